@@ -0,0 +1,180 @@
+import hashlib
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.crypto import constant_time_compare
+from rest_framework import status
+from rest_framework.exceptions import APIException, Throttled
+from rest_framework.throttling import BaseThrottle
+
+# ==========================================
+# 🛡️ LOGIN: LÍMITES ANTES DEL HASH
+# ==========================================
+# Verificar una contraseña (PBKDF2, 1M iteraciones) cuesta cientos de ms de
+# CPU. Un ataque de credential stuffing contra los endpoints públicos de
+# login/registro ocuparía todos los hilos de gunicorn en hashear y se caería
+# también el catálogo. Por eso:
+# - Throttles de cubeta de tokens en la caché, por IP y por cuenta: rechazan con
+#   429 + Retry-After en APIView.initial, antes de leer la base o hashear.
+# - Un semáforo por proceso acota cuántos hilos hashean a la vez
+#   (HASH_MAX_CONCURRENTES, por defecto uno por CPU). El turno se pide antes de
+#   buscar al usuario: hasta HASH_MAX_EN_FILA hilos más lo esperan
+#   HASH_ESPERA_SEGUNDOS; el que no entra en la fila o no lo consigue a tiempo
+#   recibe 503 sin tocar la base, y el resto de los hilos sigue libre para las
+#   demás vistas.
+# - Esperar turno también ocupa un hilo: antes del semáforo, cada cliente (IP)
+#   puede tener a lo sumo HASH_MAX_POR_CLIENTE turnos pedidos; el siguiente
+#   recibe 429 sin esperar, así un solo cliente no llena la fila.
+# - Las contraseñas viejas guardadas en texto plano se pasan a hash en el primer
+#   login correcto.
+# Las cubetas están en la caché compartida (CACHE_URL en settings: Redis o la
+# base), así que los límites son globales entre workers e instancias; solo con
+# CACHE_URL=locmem (desarrollo) son por proceso.
+
+
+def tomar_token(clave, capacidad, por_minuto):
+    """
+    Cubeta de tokens (GCRA): guarda un solo número por clave, el instante en que
+    la cubeta vuelve a estar llena. Devuelve (permitido, segundos_de_espera).
+    Como los throttles de DRF, lee y escribe sin bloqueo: ante pedidos
+    simultáneos puede dejar pasar alguno de más, nunca rechaza de más.
+    """
+    intervalo = 60.0 / por_minuto
+    ahora = time.time()
+    llena_en = max(cache.get(clave, ahora), ahora) + intervalo
+    exceso = llena_en - ahora - intervalo * capacidad
+    if exceso > 0:
+        return False, exceso
+    cache.set(clave, llena_en, int(llena_en - ahora) + 1)
+    return True, 0
+
+
+class CuboTokensThrottle(BaseThrottle):
+    """Base: las subclases definen `ambito`, los nombres de sus settings y la clave."""
+    ambito = None
+    ajuste_rafaga = None
+    ajuste_por_minuto = None
+
+    def get_identidad(self, request):
+        raise NotImplementedError
+
+    def allow_request(self, request, view):
+        identidad = self.get_identidad(request)
+        if not identidad:
+            return True
+        digest = hashlib.sha256(identidad.encode()).hexdigest()
+        permitido, self.espera = tomar_token(
+            f'acceso:{self.ambito}:{digest}',
+            getattr(settings, self.ajuste_rafaga),
+            getattr(settings, self.ajuste_por_minuto),
+        )
+        return permitido
+
+    def wait(self):
+        return self.espera
+
+
+class AccesoIPThrottle(CuboTokensThrottle):
+    ambito = 'ip'
+    ajuste_rafaga = 'ACCESO_IP_RAFAGA'
+    ajuste_por_minuto = 'ACCESO_IP_POR_MINUTO'
+
+    def get_identidad(self, request):
+        # Respeta NUM_PROXIES para tomar la IP real detrás del balanceador
+        return self.get_ident(request)
+
+
+class AccesoCuentaThrottle(CuboTokensThrottle):
+    """Por correo/usuario intentado: frena el ataque lento a una cuenta desde muchas IPs."""
+    ambito = 'cuenta'
+    ajuste_rafaga = 'ACCESO_CUENTA_RAFAGA'
+    ajuste_por_minuto = 'ACCESO_CUENTA_POR_MINUTO'
+
+    def get_identidad(self, request):
+        if request.method != 'POST':
+            return None
+        cuenta = request.data.get('email') or request.data.get('username')
+        return str(cuenta).strip().lower() if cuenta else None
+
+
+ACCESO_THROTTLES = [AccesoIPThrottle, AccesoCuentaThrottle]
+
+
+# ------------------------------------------
+# Hash acotado
+# ------------------------------------------
+
+class HashSaturado(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = "Demasiados inicios de sesión en curso, intenta de nuevo en unos segundos."
+    default_code = 'hash_saturado'
+    # El manejador de excepciones de DRF lo manda como Retry-After
+    wait = 1
+
+
+_turnos_hash = threading.BoundedSemaphore(settings.HASH_MAX_CONCURRENTES)
+# Lugares para hashear o esperar turno: acota los hilos que un ataque puede ocupar
+_fila_hash = threading.BoundedSemaphore(settings.HASH_MAX_CONCURRENTES + settings.HASH_MAX_EN_FILA)
+_turnos_por_cliente = Counter()
+_lock_clientes = threading.Lock()
+
+
+@contextmanager
+def _turno_del_cliente(request):
+    cliente = AccesoIPThrottle().get_ident(request) if request is not None else None
+    if cliente is None:
+        yield
+        return
+    with _lock_clientes:
+        if _turnos_por_cliente[cliente] >= settings.HASH_MAX_POR_CLIENTE:
+            raise Throttled(wait=1, detail="Ya hay un inicio de sesión en curso desde tu conexión.")
+        _turnos_por_cliente[cliente] += 1
+    try:
+        yield
+    finally:
+        with _lock_clientes:
+            _turnos_por_cliente[cliente] -= 1
+            if not _turnos_por_cliente[cliente]:
+                del _turnos_por_cliente[cliente]
+
+
+@contextmanager
+def turno_de_hash(request=None):
+    """
+    Envuelve todo trabajo de hash (verificar, set_password, create_user). No es
+    reentrante. Con `request` aplica primero el tope de turnos por cliente.
+    """
+    with _turno_del_cliente(request):
+        if not _fila_hash.acquire(blocking=False):
+            raise HashSaturado()
+        try:
+            if not _turnos_hash.acquire(timeout=settings.HASH_ESPERA_SEGUNDOS):
+                raise HashSaturado()
+            try:
+                yield
+            finally:
+                _turnos_hash.release()
+        finally:
+            _fila_hash.release()
+
+
+def verificar_clave(user, password):
+    """
+    check_password; llamar dentro de turno_de_hash(). Si la contraseña guardada
+    es texto plano (cuentas viejas) se compara en tiempo constante y, si
+    coincide, se guarda hasheada.
+    """
+    if not user.has_usable_password():
+        return False
+    if user.password.startswith(('pbkdf2_', 'argon2', 'bcrypt', 'scrypt')):
+        # También re-hashea si el hasher o las iteraciones quedaron viejos
+        return user.check_password(password)
+    if not constant_time_compare(user.password, password):
+        return False
+    user.set_password(password)
+    user.save(update_fields=['password'])
+    return True
@@ -1,5 +1,10 @@
+from django.conf import settings
 from django.contrib import admin
+from django.contrib.admin.widgets import AutocompleteSelect
 from django.contrib.auth.admin import UserAdmin
+from django.core.paginator import Paginator
+from django.db import connections, transaction
+from django.utils.functional import cached_property
 from .models import (
     Cliente, 
     Categoria, 
@@ -7,29 +12,81 @@ from .models import (
     Llavero, 
     Pedido, 
     DetallePedido, 
-    LlaveroMaterial
+    LlaveroMaterial,
+    MovimientoInventario
 )
+from .inventario import con_stock_vigente, stock_vigente, ajustar_stock
+from .pedidos import cambiar_estado_pedidos, registrar_transiciones, tomar_pedidos
+from .reportes import ESTADO_CANCELADO, aplicar_ventas, ventas_de_pedidos
+from .resumenes import reconstruir_resumenes, resumen_pedido_creado, resumen_pedido_editado
+
+# ==========================================
+# 0. MODO ALTO VOLUMEN (TABLAS GRANDES)
+# ==========================================
+
+def estimar_filas(modelo, alias='default'):
+    """Filas de la tabla según las estadísticas de la base (None si no hay)."""
+    conexion = connections[alias]
+    tabla = modelo._meta.db_table
+    consultas = {
+        'mysql': "SELECT TABLE_ROWS FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s",
+        'postgresql': "SELECT reltuples::bigint FROM pg_class WHERE relname = %s",
+    }
+    if conexion.vendor not in consultas:
+        return None
+    with conexion.cursor() as cursor:
+        cursor.execute(consultas[conexion.vendor], [tabla])
+        fila = cursor.fetchone()
+    return fila[0] if fila and fila[0] is not None and fila[0] >= 0 else None
+
+
+class ConteoEstimadoPaginator(Paginator):
+    """
+    Evita el COUNT(*) exacto en tablas grandes: sin filtros usa la estadística
+    de la base; con filtros cuenta como mucho ADMIN_CONTEO_MAXIMO + 1 filas.
+    """
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        limite = settings.ADMIN_CONTEO_MAXIMO
+        if not queryset.query.where:
+            estimado = estimar_filas(queryset.model, queryset.db)
+            if estimado is not None and estimado > limite:
+                return estimado
+        return queryset.order_by().values('pk')[:limite + 1].count()
+
+
+class AltoVolumenAdminMixin:
+    paginator = ConteoEstimadoPaginator
+    # Sin el segundo COUNT(*) de "N resultados (M en total)"
+    show_full_result_count = False
+
 
 # ==========================================
 # 1. CONFIGURACIÓN DE CLIENTE (USUARIO)
 # ==========================================
 @admin.register(Cliente)
-class ClienteAdmin(UserAdmin):
+class ClienteAdmin(AltoVolumenAdminMixin, UserAdmin):
     # Columnas visibles en la lista de usuarios
-    list_display = ('id', 'username', 'email', 'first_name', 'last_name', 'telefono', 'is_staff')
+    list_display = ('id', 'username', 'email', 'first_name', 'last_name', 'telefono', 'total_pedidos', 'ultimo_pedido', 'is_staff')
     
     # Filtros laterales
     list_filter = ('is_staff', 'is_superuser', 'is_active', 'date_joined')
     
-    # Buscador (Busca por usuario, correo o nombre)
-    search_fields = ('username', 'email', 'first_name', 'last_name')
+    # Buscador por prefijo (LIKE 'texto%' usa el índice; '%texto%' recorre la tabla)
+    search_fields = ('^username', '^email')
 
     # Configuración del formulario de edición
     fieldsets = UserAdmin.fieldsets + (
         ('Datos Extra', {
             'fields': ('telefono', 'direccion')
         }),
+        # Lo mantienen los pedidos (api/resumenes.py): solo lectura
+        ('Resumen de pedidos', {
+            'fields': ('total_pedidos', 'total_gastado', 'ultimo_pedido')
+        }),
     )
+    readonly_fields = ('total_pedidos', 'total_gastado', 'ultimo_pedido')
     add_fieldsets = UserAdmin.add_fieldsets + (
         ('Datos Extra', {
             'fields': ('telefono', 'direccion')
@@ -40,16 +97,74 @@ class ClienteAdmin(UserAdmin):
 # 2. CONFIGURACIÓN DE PRODUCTOS (LLAVEROS)
 # ==========================================
 
+class StockEnLibroAdminMixin:
+    """
+    El admin muestra y edita el stock vigente; al guardar, la diferencia se
+    registra como movimiento en el libro de inventario.
+    """
+    def get_queryset(self, request):
+        return con_stock_vigente(super().get_queryset(request))
+
+    def get_object(self, request, object_id, from_field=None):
+        obj = super().get_object(request, object_id, from_field)
+        if obj is not None:
+            obj.stock_actual = obj.stock_vigente
+        return obj
+
+    def save_model(self, request, obj, form, change):
+        with transaction.atomic():
+            super().save_model(request, obj, form, change)
+            if change and 'stock_actual' in form.changed_data:
+                ajustar_stock(obj, obj.stock_actual, actual=form.initial['stock_actual'])
+
+    @admin.display(description="Stock actual", ordering='stock_vigente')
+    def stock_actual_vigente(self, obj):
+        return stock_vigente(obj)
+
+class AutocompletePrecargado(AutocompleteSelect):
+    """
+    AutocompleteSelect que toma la etiqueta del valor elegido de `etiquetas`
+    (cargadas una vez por formset) en vez de hacer una consulta por fila.
+    """
+    etiquetas = None
+
+    def optgroups(self, name, value, attr=None):
+        elegidos = [str(v) for v in value if str(v) not in self.choices.field.empty_values]
+        if self.etiquetas is None or any(v not in self.etiquetas for v in elegidos):
+            return super().optgroups(name, value, attr)
+        opciones = []
+        if not self.is_required:
+            opciones.append(self.create_option(name, '', '', False, 0))
+        for valor in elegidos:
+            opciones.append(self.create_option(name, valor, self.etiquetas[valor], set(elegidos), len(opciones)))
+        return [(None, opciones, 0)]
+
 class LlaveroMaterialInline(admin.TabularInline):
     model = LlaveroMaterial
     extra = 1 
     autocomplete_fields = ['material'] 
 
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if db_field.name == 'material':
+            kwargs['widget'] = AutocompletePrecargado(db_field, self.admin_site, using=kwargs.get('using'))
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+
+    def get_formset(self, request, obj=None, **kwargs):
+        formset = super().get_formset(request, obj, **kwargs)
+        # El admin arma el formset varias veces por petición: una sola consulta
+        if not hasattr(request, '_etiquetas_materiales'):
+            materiales = Material.objects.filter(llaveromaterial__llavero=obj).only('id', 'nombre') if obj else []
+            request._etiquetas_materiales = {str(m.pk): str(m) for m in materiales}
+        formset.form.base_fields['material'].widget.widget.etiquetas = request._etiquetas_materiales
+        return formset
+
 @admin.register(Llavero)
-class LlaveroAdmin(admin.ModelAdmin):
-    list_display = ('nombre', 'categoria', 'precio', 'stock_actual', 'es_personalizable')
+class LlaveroAdmin(AltoVolumenAdminMixin, StockEnLibroAdminMixin, admin.ModelAdmin):
+    list_display = ('nombre', 'categoria', 'precio', 'stock_actual_vigente', 'es_personalizable')
     list_filter = ('categoria', 'es_personalizable')
-    search_fields = ('nombre', 'descripcion')
+    list_select_related = ('categoria',)
+    # Prefijo del nombre o sku exacto (la búsqueda de texto completo está en /api/llaveros/search/)
+    search_fields = ('^nombre', '=sku')
     inlines = [LlaveroMaterialInline]
 
 # ==========================================
@@ -62,23 +177,27 @@ class DetallePedidoInline(admin.TabularInline):
     can_delete = False 
     readonly_fields = ('llavero', 'cantidad', 'precio_unitario', 'subtotal') 
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('llavero')
+
 @admin.register(Pedido)
-class PedidoAdmin(admin.ModelAdmin):
+class PedidoAdmin(AltoVolumenAdminMixin, admin.ModelAdmin):
     # 1. Columnas a mostrar
-    list_display = ('id', 'ver_cliente', 'fecha_pedido', 'total', 'estado')
+    list_display = ('id', 'ver_cliente', 'fecha_pedido', 'total', 'estado', 'tomado_por')
     
     # 🔥 ESTA ES LA ACTUALIZACIÓN CLAVE 🔥
     # Permite cambiar el estado (Pendiente -> Enviado) directamente desde la lista
     list_editable = ('estado',)
     
-    # 2. Filtros laterales
+    # 2. Filtros laterales (índices pedido_estado_fecha_idx y pedido_fecha_idx)
     list_filter = ('estado', 'fecha_pedido')
+    list_select_related = ('cliente', 'tomado_por')
     
-    # 3. Buscador potente
-    search_fields = ('cliente__username', 'cliente__email', 'cliente__first_name', 'id')
+    # 3. Buscador: número de pedido exacto o prefijo de usuario/correo (ver get_search_results)
+    search_fields = ('^cliente__username', '^cliente__email')
     
     # 4. Campos de solo lectura
-    readonly_fields = ('fecha_pedido',)
+    readonly_fields = ('fecha_pedido', 'total', 'tomado_por', 'tomado_hasta')
     
     # 5. Detalles dentro del pedido
     inlines = [DetallePedidoInline]
@@ -86,10 +205,78 @@ class PedidoAdmin(admin.ModelAdmin):
     # 6. Ordenar (Más recientes primero)
     ordering = ('-fecha_pedido',)
 
+    # 7. Acciones masivas (un solo UPDATE para todos los seleccionados)
+    actions = ['tomar_para_preparar', 'marcar_pendiente', 'marcar_en_proceso', 'marcar_completado', 'marcar_cancelado']
+
     def ver_cliente(self, obj):
         return obj.cliente.username if obj.cliente else "Cliente Eliminado"
     ver_cliente.short_description = "Cliente"
 
+    def get_search_results(self, request, queryset, search_term):
+        # Un número se busca solo por id (PK), sin los JOIN a clientes
+        termino = search_term.strip().lstrip('#')
+        if termino.isdigit():
+            return queryset.filter(pk=int(termino)), False
+        return super().get_search_results(request, queryset, search_term)
+
+    def save_model(self, request, obj, form, change):
+        # También cubre list_editable: el cambio de estado pasa por registrar_transiciones
+        with transaction.atomic():
+            if not change:
+                super().save_model(request, obj, form, change)
+                resumen_pedido_creado(obj)
+                return
+            cliente_id, anterior, total = Pedido.objects.select_for_update() \
+                .values_list('cliente_id', 'estado', 'total').get(pk=obj.pk)
+            super().save_model(request, obj, form, change)
+            resumen_pedido_editado((cliente_id, anterior, total), obj)
+            if obj.estado != anterior:
+                registrar_transiciones([(obj.pk, anterior)], obj.estado)
+
+    def delete_model(self, request, obj):
+        with transaction.atomic():
+            # Sus líneas desaparecen en cascada: se descuentan de los reportes (como perform_destroy)
+            if obj.estado != ESTADO_CANCELADO:
+                aplicar_ventas(ventas_de_pedidos([obj.pk]), signo=-1)
+            super().delete_model(request, obj)
+            reconstruir_resumenes([obj.cliente_id])
+
+    def delete_queryset(self, request, queryset):
+        with transaction.atomic():
+            cliente_ids = set(queryset.values_list('cliente_id', flat=True))
+            aplicar_ventas(ventas_de_pedidos(queryset.exclude(estado=ESTADO_CANCELADO).values('pk')), signo=-1)
+            super().delete_queryset(request, queryset)
+            reconstruir_resumenes(cliente_ids)
+
+    def _cambiar_estado(self, request, queryset, estado):
+        cambiados = cambiar_estado_pedidos(queryset, estado)
+        self.message_user(request, f"{cambiados} pedido(s) marcados como {estado}.")
+
+    @admin.action(description="Tomar para preparar (salta los que otro está tomando)")
+    def tomar_para_preparar(self, request, queryset):
+        seleccionados = len(queryset)
+        tomados = tomar_pedidos(request.user, seleccionados, pedidos=queryset)
+        self.message_user(
+            request,
+            f"Tomaste {len(tomados)} de {seleccionados} pedido(s); el resto no estaba Pendiente o lo tomó otra persona."
+        )
+
+    @admin.action(description="Marcar como Pendiente")
+    def marcar_pendiente(self, request, queryset):
+        self._cambiar_estado(request, queryset, 'Pendiente')
+
+    @admin.action(description="Marcar como En proceso")
+    def marcar_en_proceso(self, request, queryset):
+        self._cambiar_estado(request, queryset, 'En proceso')
+
+    @admin.action(description="Marcar como Completado (descuenta materiales)")
+    def marcar_completado(self, request, queryset):
+        self._cambiar_estado(request, queryset, 'Completado')
+
+    @admin.action(description="Marcar como Cancelado")
+    def marcar_cancelado(self, request, queryset):
+        self._cambiar_estado(request, queryset, 'Cancelado')
+
 # ==========================================
 # 4. OTROS REGISTROS
 # ==========================================
@@ -100,6 +287,20 @@ class CategoriaAdmin(admin.ModelAdmin):
     search_fields = ('nombre',)
 
 @admin.register(Material)
-class MaterialAdmin(admin.ModelAdmin):
-    list_display = ('nombre', 'stock_actual', 'unidad_medida')
-    search_fields = ('nombre',)
\ No newline at end of file
+class MaterialAdmin(StockEnLibroAdminMixin, admin.ModelAdmin):
+    list_display = ('nombre', 'stock_actual_vigente', 'unidad_medida')
+    search_fields = ('nombre',)
+
+@admin.register(MovimientoInventario)
+class MovimientoInventarioAdmin(AltoVolumenAdminMixin, admin.ModelAdmin):
+    # Libro de solo lectura: los movimientos no se editan, se compensan con otro
+    list_display = ('id', 'tipo', 'llavero', 'material', 'cantidad', 'pedido', 'creado_en')
+    list_filter = ('tipo',)
+    list_select_related = ('llavero', 'material')
+    raw_id_fields = ('llavero', 'material', 'pedido')
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
\ No newline at end of file
@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class ApiConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "api"
+
+    def ready(self):
+        # Conectan sus señales; catalogo primero para que la versión ya esté subida
+        from . import catalogo  # noqa: F401
+        from . import busqueda  # noqa: F401
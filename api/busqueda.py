@@ -0,0 +1,326 @@
+import heapq
+import re
+import threading
+import time
+import unicodedata
+from bisect import bisect_left
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import BooleanField, FloatField
+from django.db.models.expressions import RawSQL
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .catalogo import version_catalogo
+from .models import Llavero
+
+# ==========================================
+# 🔍 BÚSQUEDA EN EL CATÁLOGO DE LLAVEROS
+# ==========================================
+# - MySQL: índice FULLTEXT (nombre, descripcion) con MATCH ... AGAINST.
+# - PostgreSQL: índice GIN sobre to_tsvector('spanish', ...) con ts_rank.
+# - Otras bases (sqlite en desarrollo): índice invertido en memoria.
+# El autocompletado usa siempre el índice en memoria (solo nombres): ni FULLTEXT
+# ni tsvector toleran errores de tipeo.
+#
+# El índice en memoria se arma la primera vez que se usa y se mantiene con las
+# señales de Llavero en este proceso. Los demás workers (o una importación
+# masiva, que no emite señales) se enteran por la versión del catálogo y
+# rearman su índice como mucho cada BUSQUEDA_REFRESCO_SEGUNDOS.
+
+TSVECTOR = "to_tsvector('spanish', coalesce(nombre, '') || ' ' || coalesce(descripcion, ''))"
+MAX_RESULTADOS = 100
+
+PESO_NOMBRE = 3.0
+PESO_DESCRIPCION = 1.0
+FACTOR_PREFIJO = 0.7
+FACTOR_DIFUSO = 0.6
+SIMILITUD_MINIMA = 0.35
+MAX_EXPANSIONES = 20
+
+_PALABRA = re.compile(r'\w+')
+
+
+def normalizar(texto):
+    """Minúsculas y sin tildes: 'Corazón' -> 'corazon'."""
+    texto = unicodedata.normalize('NFKD', (texto or '').lower())
+    return ''.join(c for c in texto if not unicodedata.combining(c))
+
+
+def palabras(texto):
+    return _PALABRA.findall(normalizar(texto))
+
+
+def trigramas(palabra):
+    relleno = f'  {palabra} '
+    return {relleno[i:i + 3] for i in range(len(relleno) - 2)}
+
+
+class IndiceInvertido:
+    """
+    Palabra -> llaveros que la tienen en el nombre / en la descripción, con
+    prefijos (vocabulario ordenado) y trigramas para errores de tipeo.
+    """
+
+    def __init__(self, solo_nombres=False):
+        self.solo_nombres = solo_nombres
+        self.en_nombre = defaultdict(dict)       # palabra -> {llavero_id: None} (dict = set ordenado)
+        self.en_descripcion = defaultdict(dict)
+        self.palabras_doc = {}
+        self.vocabulario = []
+        self.por_trigrama = defaultdict(set)
+        self.version = None
+        self.armado_en = 0.0
+        self.lock = threading.RLock()
+        self._armando = threading.Lock()
+        self._durante_armado = None      # cambios por señales mientras se arma uno nuevo
+
+    # ---- mantenimiento ----
+
+    def armar(self, esperar=True):
+        """
+        Arma un índice nuevo sin tomar self.lock (las búsquedas siguen sobre el
+        actual) y lo pone en su lugar en un solo paso. Los cambios que llegan
+        por señales mientras tanto se anotan y se repiten sobre el nuevo. Con
+        esperar=False, si otro hilo ya está armando, se sigue con el actual.
+        """
+        if not self._armando.acquire(blocking=esperar):
+            return
+        try:
+            version = version_catalogo()
+            if version == self.version:
+                return  # Lo armó otro hilo mientras se esperaba
+            with self.lock:
+                self._durante_armado = []
+            nuevo = IndiceInvertido(self.solo_nombres)
+            campos = ('id', 'nombre') if self.solo_nombres else ('id', 'nombre', 'descripcion')
+            for fila in Llavero.objects.order_by('id').values_list(*campos).iterator(chunk_size=5000):
+                nuevo._agregar(*fila)
+            nuevo.vocabulario.sort()
+            with self.lock:
+                for llavero_id, textos in self._durante_armado:
+                    nuevo._quitar(llavero_id)
+                    if textos is not None:
+                        nuevo._agregar(llavero_id, *textos, ordenado=True)
+                self._durante_armado = None
+                self.en_nombre, self.en_descripcion = nuevo.en_nombre, nuevo.en_descripcion
+                self.palabras_doc, self.vocabulario = nuevo.palabras_doc, nuevo.vocabulario
+                self.por_trigrama = nuevo.por_trigrama
+                self.version = version
+                self.armado_en = time.monotonic()
+        finally:
+            self._armando.release()
+
+    def actualizar(self, llavero_id, nombre, descripcion=''):
+        with self.lock:
+            self._quitar(llavero_id)
+            self._agregar(llavero_id, nombre, descripcion, ordenado=True)
+            if self._durante_armado is not None:
+                self._durante_armado.append((llavero_id, (nombre, descripcion)))
+            self._seguir_version()
+
+    def quitar(self, llavero_id):
+        with self.lock:
+            self._quitar(llavero_id)
+            if self._durante_armado is not None:
+                self._durante_armado.append((llavero_id, None))
+            self._seguir_version()
+
+    def _seguir_version(self):
+        # Si el único cambio de versión fue el nuestro, el índice sigue al día
+        version = version_catalogo()
+        if version == self.version + 1:
+            self.version = version
+
+    def _existe(self, palabra):
+        return palabra in self.en_nombre or palabra in self.en_descripcion
+
+    def _agregar(self, llavero_id, nombre, descripcion='', ordenado=False):
+        del_nombre = set(palabras(nombre))
+        de_descripcion = set() if self.solo_nombres else set(palabras(descripcion)) - del_nombre
+        self.palabras_doc[llavero_id] = del_nombre | de_descripcion
+        for palabra in del_nombre | de_descripcion:
+            if not self._existe(palabra):
+                self._nueva_palabra(palabra, ordenado)
+        for palabra in del_nombre:
+            self.en_nombre[palabra][llavero_id] = None
+        for palabra in de_descripcion:
+            self.en_descripcion[palabra][llavero_id] = None
+
+    def _nueva_palabra(self, palabra, ordenado):
+        if ordenado:
+            self.vocabulario.insert(bisect_left(self.vocabulario, palabra), palabra)
+        else:
+            self.vocabulario.append(palabra)
+        for trigrama in trigramas(palabra):
+            self.por_trigrama[trigrama].add(palabra)
+
+    def _quitar(self, llavero_id):
+        for palabra in self.palabras_doc.pop(llavero_id, ()):
+            for postings in (self.en_nombre, self.en_descripcion):
+                if palabra in postings:
+                    postings[palabra].pop(llavero_id, None)
+                    if not postings[palabra]:
+                        del postings[palabra]
+            if not self._existe(palabra):
+                self.vocabulario.pop(bisect_left(self.vocabulario, palabra))
+                for trigrama in trigramas(palabra):
+                    self.por_trigrama[trigrama].discard(palabra)
+
+    def vigente(self):
+        """Arma el índice si hace falta; si el catálogo cambió en otro proceso, lo rearma cada tanto."""
+        if self.version is None:
+            self.armar()
+        elif time.monotonic() - self.armado_en >= settings.BUSQUEDA_REFRESCO_SEGUNDOS:
+            if version_catalogo() != self.version:
+                self.armar(esperar=False)
+            else:
+                self.armado_en = time.monotonic()
+        return self
+
+    # ---- consultas ----
+
+    def _expandir(self, termino, prefijo):
+        """Palabras del vocabulario que cubren el término, con su factor de relevancia."""
+        expansiones = {}
+        if self._existe(termino):
+            expansiones[termino] = 1.0
+        if prefijo:
+            inicio = bisect_left(self.vocabulario, termino)
+            for palabra in self.vocabulario[inicio:inicio + MAX_EXPANSIONES]:
+                if not palabra.startswith(termino):
+                    break
+                expansiones.setdefault(palabra, FACTOR_PREFIJO)
+        if not expansiones and len(termino) >= 3:
+            propios = trigramas(termino)
+            comunes = defaultdict(int)
+            for trigrama in propios:
+                for palabra in self.por_trigrama.get(trigrama, ()):
+                    comunes[palabra] += 1
+            similares = sorted(
+                ((n / len(propios | trigramas(palabra)), palabra) for palabra, n in comunes.items()),
+                reverse=True,
+            )[:MAX_EXPANSIONES]
+            for similitud, palabra in similares:
+                if similitud >= SIMILITUD_MINIMA:
+                    expansiones[palabra] = FACTOR_DIFUSO * similitud
+        return expansiones
+
+    def _grupos(self, expansiones):
+        """[(puntaje, {ids})] de mayor a menor puntaje."""
+        grupos = []
+        for palabra, factor in expansiones.items():
+            if palabra in self.en_nombre:
+                grupos.append((PESO_NOMBRE * factor, self.en_nombre[palabra]))
+            if palabra in self.en_descripcion:
+                grupos.append((PESO_DESCRIPCION * factor, self.en_descripcion[palabra]))
+        grupos.sort(key=lambda grupo: -grupo[0])
+        return grupos
+
+    def buscar(self, texto, limite=20, prefijo_final=True):
+        """[(llavero_id, puntaje)] ordenados; todas las palabras deben coincidir (exacta, prefijo o parecida)."""
+        terminos = palabras(texto)
+        if not terminos:
+            return []
+        with self.lock:
+            ultimo = len(terminos) - 1
+            grupos = [
+                self._grupos(self._expandir(termino, prefijo_final and i == ultimo))
+                for i, termino in enumerate(terminos)
+            ]
+            if not all(grupos):
+                return []
+
+            if len(grupos) == 1:
+                # Un solo término: los grupos ya vienen por puntaje, basta con los primeros `limite`
+                resultado, vistos = [], set()
+                for puntaje, ids in grupos[0]:
+                    for llavero_id in ids:
+                        if llavero_id not in vistos:
+                            vistos.add(llavero_id)
+                            resultado.append((llavero_id, puntaje))
+                            if len(resultado) == limite:
+                                return resultado
+                return resultado
+
+            # Se empieza por el término más selectivo y los demás solo se miran sobre
+            # esos candidatos: una palabra común ("llavero") no recorre todo el catálogo
+            grupos.sort(key=lambda del_termino: sum(len(ids) for _, ids in del_termino))
+            puntajes = {}
+            for puntaje, ids in reversed(grupos[0]):
+                for llavero_id in ids:
+                    puntajes[llavero_id] = puntaje  # de menor a mayor: queda el máximo
+            for del_termino in grupos[1:]:
+                siguientes = {}
+                for llavero_id, acumulado in puntajes.items():
+                    for puntaje, ids in del_termino:
+                        if llavero_id in ids:
+                            siguientes[llavero_id] = acumulado + puntaje
+                            break
+                puntajes = siguientes
+                if not puntajes:
+                    return []
+        return heapq.nsmallest(limite, puntajes.items(), key=lambda par: (-par[1], par[0]))
+
+
+_indice_texto = IndiceInvertido()
+_indice_nombres = IndiceInvertido(solo_nombres=True)
+
+
+def busqueda_nativa():
+    return connection.vendor in ('mysql', 'postgresql')
+
+
+def _columna(campo):
+    """`tabla`.`columna` de Llavero, citados como los cita el ORM."""
+    citar = connection.ops.quote_name
+    return f"{citar(Llavero._meta.db_table)}.{citar(Llavero._meta.get_field(campo).column)}"
+
+
+def buscar_llaveros(queryset, texto, limite=20):
+    """
+    Devuelve (queryset filtrado, [ids en orden de relevancia] o None).
+    Con búsqueda nativa el orden va en el queryset (anotación `relevancia`);
+    con el índice en memoria se devuelven los ids ya ordenados.
+    """
+    if connection.vendor == 'mysql':
+        match = f"MATCH({_columna('nombre')}, {_columna('descripcion')}) AGAINST (%s IN NATURAL LANGUAGE MODE)"
+        queryset = queryset.filter(RawSQL(match, [texto], output_field=BooleanField())).annotate(
+            relevancia=RawSQL(match, [texto], output_field=FloatField())
+        ).order_by('-relevancia', 'id')
+        return queryset[:limite], None
+    if connection.vendor == 'postgresql':
+        consulta = "websearch_to_tsquery('spanish', %s)"
+        queryset = queryset.filter(
+            RawSQL(f"{TSVECTOR} @@ {consulta}", [texto], output_field=BooleanField())
+        ).annotate(
+            relevancia=RawSQL(f"ts_rank({TSVECTOR}, {consulta})", [texto], output_field=FloatField())
+        ).order_by('-relevancia', 'id')
+        return queryset[:limite], None
+
+    ids = [llavero_id for llavero_id, _ in _indice_texto.vigente().buscar(texto, limite=MAX_RESULTADOS)]
+    return queryset.filter(pk__in=ids), ids
+
+
+def autocompletar(texto, limite=10):
+    """[(id, nombre)] para sugerencias mientras se escribe."""
+    ids = [llavero_id for llavero_id, _ in _indice_nombres.vigente().buscar(texto, limite=limite)]
+    nombres = dict(Llavero.objects.filter(pk__in=ids).values_list('id', 'nombre'))
+    return [(llavero_id, nombres[llavero_id]) for llavero_id in ids if llavero_id in nombres]
+
+
+@receiver(post_save, sender=Llavero)
+def _llavero_guardado(sender, instance, **kwargs):
+    if _indice_texto.version is not None:
+        _indice_texto.actualizar(instance.pk, instance.nombre, instance.descripcion)
+    if _indice_nombres.version is not None:
+        _indice_nombres.actualizar(instance.pk, instance.nombre)
+
+
+@receiver(post_delete, sender=Llavero)
+def _llavero_borrado(sender, instance, **kwargs):
+    for indice in (_indice_texto, _indice_nombres):
+        if indice.version is not None:
+            indice.quitar(instance.pk)
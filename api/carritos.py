@@ -0,0 +1,56 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Prefetch
+from django.utils import timezone
+
+from .inventario import con_stock_vigente
+from .lotes import borrar_por_lotes
+from .models import Carrito, Llavero
+
+# ==========================================
+# 🛒 CARRITOS: LECTURA SIN ESCRITURA Y BARRIDO
+# ==========================================
+# Leer un carrito no lo crea: quien nunca agregó nada recibe un carrito vacío
+# armado en memoria. La fila nace con el primer item y actualizado_en se toca
+# en cada cambio de items, así el barrido puede borrar los carritos que nadie
+# usó en CARRITO_ABANDONADO_DIAS (sus items y reservas caen en cascada).
+
+
+def carritos_con_items():
+    """Para CarritoSerializer: items y llaveros con stock_vigente en dos consultas, no una por item."""
+    return Carrito.objects.prefetch_related(
+        Prefetch('items__llavero', queryset=con_stock_vigente(Llavero.objects.all()))
+    )
+
+
+def carrito_vacio(cliente_id):
+    """Misma forma que CarritoSerializer, para clientes sin carrito."""
+    return {'id': None, 'cliente': cliente_id, 'items': [], 'total': 0}
+
+
+def tocar_carrito(carrito_id):
+    """Marca actividad: cambiar items no guarda el Carrito, así que auto_now no alcanza."""
+    Carrito.objects.filter(pk=carrito_id).update(actualizado_en=timezone.now())
+
+
+def barrer_carritos_abandonados(dias=None, lote=500):
+    """
+    Borra por lotes los carritos sin actividad hace `dias`. Cada lote es un
+    DELETE acotado por ids (más los de sus items y reservas). Devuelve métricas.
+    """
+    dias = settings.CARRITO_ABANDONADO_DIAS if dias is None else dias
+    limite = timezone.now() - timedelta(days=dias)
+    inicio = time.perf_counter()
+    metricas = {'carritos': 0, 'items': 0, 'reservas': 0, 'lotes': 0}
+
+    def contar(por_modelo):
+        metricas['items'] += por_modelo.get('api.ItemCarrito', 0)
+        metricas['reservas'] += por_modelo.get('api.ReservaStock', 0)
+        metricas['lotes'] += 1
+
+    abandonados = Carrito.objects.filter(actualizado_en__lt=limite).order_by('actualizado_en')
+    metricas['carritos'] = borrar_por_lotes(abandonados, lote, al_borrar=contar)
+    metricas['segundos'] = round(time.perf_counter() - inicio, 3)
+    return metricas
@@ -0,0 +1,175 @@
+import time
+from collections import defaultdict
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Case, Count, IntegerField, Value, When
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.exceptions import ValidationError
+
+from .inventario import filtrar_con_stock
+from .models import Categoria, Llavero, LlaveroMaterial, Material
+
+# ==========================================
+# 🗂️ VERSIÓN DEL CATÁLOGO (CACHÉ)
+# ==========================================
+# Todo lo que se cachee a partir del catálogo lleva la versión en la clave.
+# Invalidar = subir la versión; las entradas viejas mueren por su TTL.
+# Los cambios fila a fila (API, admin) la suben por señales; las cargas
+# masivas (bulk_create/bulk_update no emiten señales) la suben una sola vez al final.
+
+CLAVE_VERSION = 'catalogo:version'
+
+
+def version_catalogo():
+    version = cache.get(CLAVE_VERSION)
+    if version is None:
+        # Valor inicial por tiempo para no reutilizar claves de antes de un desalojo
+        cache.add(CLAVE_VERSION, time.time_ns(), None)
+        version = cache.get(CLAVE_VERSION)
+    return version
+
+
+def clave_catalogo(*partes):
+    return ':'.join(['catalogo', str(version_catalogo()), *map(str, partes)])
+
+
+def invalidar_catalogo():
+    try:
+        cache.incr(CLAVE_VERSION)
+    except ValueError:
+        cache.set(CLAVE_VERSION, time.time_ns(), None)
+
+
+@receiver([post_save, post_delete], sender=Categoria)
+@receiver([post_save, post_delete], sender=Llavero)
+@receiver([post_save, post_delete], sender=Material)
+@receiver([post_save, post_delete], sender=LlaveroMaterial)
+def _catalogo_modificado(sender, **kwargs):
+    invalidar_catalogo()
+
+
+# ==========================================
+# 🧭 FILTROS, ORDEN Y FACETAS DE PRODUCTOS
+# ==========================================
+# ?precio_min=&precio_max=&personalizable=true|false&en_stock=true&orden=precio|-precio|nombre|-nombre|recientes
+# Los filtros de precio/personalizable y los órdenes usan los índices
+# (categoria, precio), (categoria, es_personalizable, precio) y (categoria, nombre).
+
+ORDENES = {
+    'precio': ('precio', 'id'),
+    '-precio': ('-precio', 'id'),
+    'nombre': ('nombre', 'id'),
+    '-nombre': ('-nombre', 'id'),
+    'recientes': ('-id',),
+}
+# Tramos de precio de las facetas: [desde, hasta)
+RANGOS_PRECIO = ((0, 5), (5, 10), (10, 20), (20, 50), (50, None))
+
+_SI = {'1', 'true', 'si', 'sí'}
+_NO = {'0', 'false', 'no'}
+
+
+def _booleano(params, nombre):
+    valor = params.get(nombre)
+    if valor in (None, ''):
+        return None
+    valor = valor.lower()
+    if valor in _SI:
+        return True
+    if valor in _NO:
+        return False
+    raise ValidationError({nombre: "Use true o false"})
+
+
+def _decimal(params, nombre):
+    valor = params.get(nombre)
+    if valor in (None, ''):
+        return None
+    try:
+        return Decimal(valor)
+    except InvalidOperation:
+        raise ValidationError({nombre: "Debe ser un número"})
+
+
+def filtros_catalogo(params):
+    """Valida los filtros de la query string y los devuelve normalizados."""
+    orden = params.get('orden') or 'id'
+    if orden != 'id' and orden not in ORDENES:
+        raise ValidationError({'orden': f"Use uno de: {', '.join(ORDENES)}"})
+    return {
+        'precio_min': _decimal(params, 'precio_min'),
+        'precio_max': _decimal(params, 'precio_max'),
+        'personalizable': _booleano(params, 'personalizable'),
+        'en_stock': bool(_booleano(params, 'en_stock')),
+        'orden': orden,
+    }
+
+
+def _aplicar_filtros(queryset, filtros):
+    if filtros['precio_min'] is not None:
+        queryset = queryset.filter(precio__gte=filtros['precio_min'])
+    if filtros['precio_max'] is not None:
+        queryset = queryset.filter(precio__lte=filtros['precio_max'])
+    if filtros['personalizable'] is not None:
+        queryset = queryset.filter(es_personalizable=filtros['personalizable'])
+    if filtros['en_stock']:
+        queryset = filtrar_con_stock(queryset)
+    return queryset
+
+
+def filtrar_catalogo(queryset, filtros):
+    queryset = _aplicar_filtros(queryset, filtros)
+    return queryset.order_by(*ORDENES.get(filtros['orden'], ('id',)))
+
+
+def facetas_catalogo(categoria_id, filtros):
+    """
+    Conteos por categoría, personalizable y tramo de precio. Salen de una sola
+    consulta agrupada (categoría x personalizable x tramo) que se cachea por
+    versión del catálogo y combinación de filtros; la categoría del URL no entra
+    en la consulta para que la app pueda mostrar cuántos hay en las demás.
+    """
+    clave = clave_catalogo(
+        'facetas', filtros['precio_min'], filtros['precio_max'], filtros['personalizable'], filtros['en_stock']
+    )
+    grupos = cache.get(clave)
+    if grupos is None:
+        tramo = Case(
+            *[
+                When(precio__gte=desde, **({'precio__lt': hasta} if hasta is not None else {}), then=Value(i))
+                for i, (desde, hasta) in enumerate(RANGOS_PRECIO)
+            ],
+            output_field=IntegerField(),
+        )
+        grupos = list(
+            _aplicar_filtros(Llavero.objects.all(), filtros)
+            .annotate(tramo=tramo)
+            .values_list('categoria_id', 'es_personalizable', 'tramo')
+            .annotate(total=Count('id'))
+            .order_by()
+        )
+        cache.set(clave, grupos, settings.FACETAS_TTL_SEGUNDOS)
+
+    por_categoria = defaultdict(int)
+    personalizable = {'true': 0, 'false': 0}
+    precios = [0] * len(RANGOS_PRECIO)
+    for categoria, es_personalizable, tramo, total in grupos:
+        por_categoria[categoria] += total
+        if categoria == categoria_id:
+            personalizable['true' if es_personalizable else 'false'] += total
+            if tramo is not None:
+                precios[tramo] += total
+    return {
+        'categorias': [
+            {'categoria_id': categoria, 'total': total}
+            for categoria, total in sorted(por_categoria.items(), key=lambda par: (par[0] is None, par[0] or 0))
+        ],
+        'personalizable': personalizable,
+        'precio': [
+            {'desde': desde, 'hasta': hasta, 'total': precios[i]}
+            for i, (desde, hasta) in enumerate(RANGOS_PRECIO)
+        ],
+    }
@@ -0,0 +1,167 @@
+import asyncio
+import contextvars
+import random
+import time
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.throttling import BaseThrottle
+
+# ==========================================
+# 📚 RÉPLICAS DE LECTURA
+# ==========================================
+# Solo las vistas marcadas (catálogo, historial) leen de réplicas, y solo
+# mientras no se haya escrito nada en la petición actual (lectura-tras-escritura).
+
+_leer_de_replica = contextvars.ContextVar('leer_de_replica', default=False)
+_hubo_escritura = contextvars.ContextVar('hubo_escritura', default=False)
+
+# alias -> momento (monotonic) hasta el que no se vuelve a intentar
+_replicas_caidas = {}
+
+COOKIE_STICKY = 'usar_primaria'
+
+
+def _replica_disponible(alias):
+    hasta = _replicas_caidas.get(alias)
+    if hasta and hasta > time.monotonic():
+        return False
+    try:
+        connections[alias].ensure_connection()
+    except Exception as e:
+        print(f"⚠️ RÉPLICA {alias} caída, se usa la primaria: {e}")
+        _replicas_caidas[alias] = time.monotonic() + settings.REPLICA_REINTENTO_SEGUNDOS
+        return False
+    _replicas_caidas.pop(alias, None)
+    return True
+
+
+class ReplicaRouter:
+    """
+    Lecturas marcadas -> una réplica sana al azar; todo lo demás -> 'default'.
+    Cualquier escritura deja la petición "pegada" a la primaria.
+    """
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label == 'django_cache':
+            # DatabaseCache: la tabla de caché es compartida y se lee de la primaria
+            return 'default'
+        if not _leer_de_replica.get() or _hubo_escritura.get():
+            return 'default'
+        candidatas = list(settings.DATABASE_REPLICAS)
+        random.shuffle(candidatas)
+        for alias in candidatas:
+            if _replica_disponible(alias):
+                return alias
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        if model._meta.app_label == 'django_cache':
+            # Cachear facetas o contar un intento de login no es escribir datos
+            return 'default'
+        _hubo_escritura.set(True)
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        bases = {'default', *settings.DATABASE_REPLICAS}
+        if obj1._state.db in bases and obj2._state.db in bases:
+            return True
+        return None
+
+
+def _clave_sticky(request):
+    # IP según NUM_PROXIES (la que agregó nuestro balanceador), como los throttles:
+    # la primera de X-Forwarded-For la elige el cliente
+    return f"replica_sticky:{BaseThrottle().get_ident(request)}"
+
+
+class ReplicaStickyMiddleware:
+    """
+    Reinicia el estado del router en cada petición y, si hubo escritura,
+    obliga a leer de la primaria durante REPLICA_STICKY_SEGUNDOS
+    (cookie para navegadores, caché por IP para la app Android).
+    Funciona igual bajo WSGI y ASGI.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.es_async = iscoroutinefunction(get_response)
+        if self.es_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.es_async:
+            return self.__acall__(request)
+        reciente = COOKIE_STICKY in request.COOKIES or cache.get(_clave_sticky(request)) is not None
+        tokens = self._iniciar(reciente)
+        try:
+            response = self.get_response(request)
+            if self._debe_marcar(request):
+                self._marcar_cookie(response)
+                cache.set(_clave_sticky(request), 1, settings.REPLICA_STICKY_SEGUNDOS)
+            return response
+        finally:
+            self._terminar(tokens)
+
+    async def __acall__(self, request):
+        reciente = COOKIE_STICKY in request.COOKIES or await cache.aget(_clave_sticky(request)) is not None
+        tokens = self._iniciar(reciente)
+        try:
+            response = await self.get_response(request)
+            if self._debe_marcar(request):
+                self._marcar_cookie(response)
+                await cache.aset(_clave_sticky(request), 1, settings.REPLICA_STICKY_SEGUNDOS)
+            return response
+        finally:
+            self._terminar(tokens)
+
+    def _iniciar(self, reciente):
+        return _hubo_escritura.set(reciente), _leer_de_replica.set(False)
+
+    def _terminar(self, tokens):
+        token_escritura, token_lectura = tokens
+        _leer_de_replica.reset(token_lectura)
+        _hubo_escritura.reset(token_escritura)
+
+    def _debe_marcar(self, request):
+        return _hubo_escritura.get() and request.method not in SAFE_METHODS
+
+    def _marcar_cookie(self, response):
+        response.set_cookie(COOKIE_STICKY, '1', max_age=settings.REPLICA_STICKY_SEGUNDOS, httponly=True)
+
+
+class LecturaReplicaMixin:
+    """Para vistas DRF: los GET/HEAD/OPTIONS pueden leer de una réplica."""
+    def dispatch(self, request, *args, **kwargs):
+        token = _leer_de_replica.set(request.method in SAFE_METHODS)
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            _leer_de_replica.reset(token)
+
+
+def en_replica(vista):
+    """Equivalente a LecturaReplicaMixin para vistas basadas en función (sync o async)."""
+    if asyncio.iscoroutinefunction(vista):
+        @wraps(vista)
+        async def envoltura_async(request, *args, **kwargs):
+            token = _leer_de_replica.set(request.method in SAFE_METHODS)
+            try:
+                return await vista(request, *args, **kwargs)
+            finally:
+                _leer_de_replica.reset(token)
+        return envoltura_async
+
+    @wraps(vista)
+    def envoltura(request, *args, **kwargs):
+        token = _leer_de_replica.set(request.method in SAFE_METHODS)
+        try:
+            return vista(request, *args, **kwargs)
+        finally:
+            _leer_de_replica.reset(token)
+    return envoltura
@@ -0,0 +1,279 @@
+import asyncio
+import json
+import threading
+from collections import defaultdict
+from datetime import timedelta
+from functools import lru_cache
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .lotes import borrar_por_lotes
+from .models import EventoPedido, Pedido
+
+# ==========================================
+# 📡 STREAM DE ESTADOS DE PEDIDOS (SSE)
+# ==========================================
+# Cada transición de estado guarda una fila en eventos_pedidos (misma
+# transacción) y, tras el commit, avisa al backend. Los streams abiertos no
+# consultan la base: un lector por proceso lee los eventos nuevos una vez y los
+# reparte en memoria a las suscripciones de cada cliente. Reconectar con
+# Last-Event-ID relee de la tabla exactamente lo que se perdió.
+#
+# Con ASGI cada request tiene su hilo y su conexión (CONN_MAX_AGE): un stream
+# que consultara con el ORM async retendría una conexión mientras siga abierto.
+# Por eso todas las lecturas de este módulo pasan por leer_y_cerrar, que usa un
+# hilo del pool y cierra la conexión al terminar.
+#
+# Backends (EVENTOS_PEDIDOS_BACKEND, ruta a la clase):
+# - BackendMemoria: el commit despierta al lector. Alcanza con un solo worker.
+# - BackendBaseDatos: además, el lector sondea la tabla cada
+#   EVENTOS_SONDEO_SEGUNDOS para ver los eventos escritos por otros workers.
+# Otro backend (p. ej. Redis pub/sub) solo necesita suscribir/desuscribir/publicar.
+
+MAX_POR_LECTURA = 500
+
+
+def registrar_eventos(filas, nuevo_estado):
+    """filas = [(pedido_id, estado_anterior), ...]; dentro de la transacción del cambio."""
+    # Los pedidos sin cliente (cliente borrado) no tienen a quién avisar
+    clientes = dict(
+        Pedido.objects.filter(pk__in=[pedido_id for pedido_id, _ in filas], cliente__isnull=False)
+        .values_list('id', 'cliente_id')
+    )
+    EventoPedido.objects.bulk_create([
+        EventoPedido(cliente_id=clientes[pedido_id], pedido_id=pedido_id,
+                     estado_anterior=anterior, estado=nuevo_estado)
+        for pedido_id, anterior in filas if pedido_id in clientes
+    ])
+    cliente_ids = set(clientes.values())
+    transaction.on_commit(lambda: backend_eventos().publicar(cliente_ids))
+
+
+async def leer_y_cerrar(funcion, *args):
+    """Corre una lectura sync en un hilo del pool y cierra su conexión: nada queda retenido."""
+    def leer():
+        try:
+            return funcion(*args)
+        finally:
+            connection.close()
+    return await sync_to_async(leer, thread_sensitive=False)()
+
+
+def _ultimo_evento(cliente_id=None):
+    eventos = EventoPedido.objects.all() if cliente_id is None else EventoPedido.objects.filter(cliente_id=cliente_id)
+    return eventos.order_by('-id').values_list('id', flat=True).first() or 0
+
+
+def _eventos_despues(cliente_id, ultimo):
+    return list(
+        EventoPedido.objects.filter(cliente_id=cliente_id, id__gt=ultimo)
+        .order_by('id').values_list('id', 'pedido_id', 'estado_anterior', 'estado', 'creado_en')[:MAX_POR_LECTURA]
+    )
+
+
+def _eventos_nuevos(ultimo):
+    return list(
+        EventoPedido.objects.filter(id__gt=ultimo).order_by('id')
+        .values_list('id', 'cliente_id', 'pedido_id', 'estado_anterior', 'estado', 'creado_en')[:MAX_POR_LECTURA * 10]
+    )
+
+
+class Suscripcion:
+    __slots__ = ('cliente_id', 'loop', 'aviso', 'filas', 'atrasada')
+
+    def __init__(self, cliente_id):
+        self.cliente_id = cliente_id
+        self.loop = asyncio.get_running_loop()
+        self.aviso = asyncio.Event()
+        self.filas = []
+        # Si el stream no consume a tiempo se descarta lo acumulado y relee de la tabla
+        self.atrasada = False
+
+    def entregar(self, filas):
+        try:
+            self.loop.call_soon_threadsafe(self._recibir, filas)
+        except RuntimeError:
+            pass  # loop ya cerrado
+
+    def _recibir(self, filas):
+        if len(self.filas) + len(filas) > MAX_POR_LECTURA:
+            self.filas, self.atrasada = [], True
+        else:
+            self.filas.extend(filas)
+        self.aviso.set()
+
+    async def esperar(self, segundos):
+        """Eventos recibidos desde la última espera; [] si pasó el tiempo (toca latido)."""
+        try:
+            await asyncio.wait_for(self.aviso.wait(), segundos)
+        except asyncio.TimeoutError:
+            return []
+        self.aviso.clear()
+        filas, self.filas = self.filas, []
+        return filas
+
+
+class BackendMemoria:
+    # Sin sondeo: el lector solo lee cuando un commit de este proceso lo despierta
+    sondea = False
+
+    def __init__(self):
+        self._suscriptores = defaultdict(set)
+        self._lock = threading.Lock()
+        self._lector = None
+        self._listo = None
+        self._despertar = None
+        self._loop = None
+
+    async def suscribir(self, cliente_id):
+        """Registra la suscripción y espera a que el lector tenga su cursor inicial."""
+        suscripcion = Suscripcion(cliente_id)
+        with self._lock:
+            self._suscriptores[cliente_id].add(suscripcion)
+        if self._lector is None or self._lector.done():
+            self._loop = asyncio.get_running_loop()
+            self._listo, self._despertar = self._loop.create_future(), asyncio.Event()
+            self._lector = self._loop.create_task(self._leer_eventos())
+        try:
+            # Lo posterior al cursor del lector llega por memoria; lo anterior lo relee el stream
+            await asyncio.shield(self._listo)
+        except BaseException:
+            self.desuscribir(suscripcion)
+            raise
+        return suscripcion
+
+    def desuscribir(self, suscripcion):
+        with self._lock:
+            del_cliente = self._suscriptores.get(suscripcion.cliente_id)
+            if del_cliente is not None:
+                del_cliente.discard(suscripcion)
+                if not del_cliente:
+                    del self._suscriptores[suscripcion.cliente_id]
+
+    def publicar(self, cliente_ids):
+        # Se publica desde hilos de vistas sync: el Event solo se toca desde su loop
+        with self._lock:
+            interesa = any(cliente_id in self._suscriptores for cliente_id in cliente_ids)
+        if interesa and self._lector is not None and not self._lector.done():
+            try:
+                self._loop.call_soon_threadsafe(self._despertar.set)
+            except RuntimeError:
+                pass  # loop ya cerrado
+
+    def conectados(self):
+        with self._lock:
+            return sum(len(del_cliente) for del_cliente in self._suscriptores.values())
+
+    def _repartir(self, filas):
+        por_cliente = defaultdict(list)
+        for evento_id, cliente_id, *resto in filas:
+            por_cliente[cliente_id].append((evento_id, *resto))
+        with self._lock:
+            destinos = [
+                (suscripcion, eventos)
+                for cliente_id, eventos in por_cliente.items()
+                for suscripcion in self._suscriptores.get(cliente_id, ())
+            ]
+        for suscripcion, eventos in destinos:
+            suscripcion.entregar(eventos)
+
+    async def _leer_eventos(self):
+        try:
+            ultimo = await leer_y_cerrar(_ultimo_evento)
+        except Exception as error:
+            self._listo.set_exception(error)
+            raise
+        self._listo.set_result(None)
+        espera = settings.EVENTOS_SONDEO_SEGUNDOS if self.sondea else settings.EVENTOS_LATIDO_SEGUNDOS
+        despierto = False
+        while self.conectados():
+            if not despierto:
+                try:
+                    await asyncio.wait_for(self._despertar.wait(), espera)
+                except asyncio.TimeoutError:
+                    if not self.sondea:
+                        continue
+                self._despertar.clear()
+            filas = await leer_y_cerrar(_eventos_nuevos, ultimo)
+            if filas:
+                ultimo = filas[-1][0]
+                self._repartir(filas)
+            # Si llenó la lectura quedan más: se sigue sin esperar
+            despierto = len(filas) == MAX_POR_LECTURA * 10
+
+
+class BackendBaseDatos(BackendMemoria):
+    # Los eventos de otros workers solo se ven sondeando la tabla
+    sondea = True
+
+
+@lru_cache(maxsize=None)
+def backend_eventos():
+    return import_string(settings.EVENTOS_PEDIDOS_BACKEND)()
+
+
+# ------------------------------------------
+# Formato SSE
+# ------------------------------------------
+
+def _mensaje(evento_id, pedido_id, anterior, estado, fecha):
+    datos = json.dumps({
+        'pedido_id': pedido_id,
+        'estado_anterior': anterior,
+        'estado': estado,
+        'fecha': fecha.isoformat(),
+    }, ensure_ascii=False)
+    return f"id: {evento_id}\nevent: estado\ndata: {datos}\n\n"
+
+
+async def stream_eventos(cliente_id, desde=None, continuo=True):
+    """
+    Genera el texto SSE. Sin cursor empieza en el último evento del cliente.
+    Con continuo=False (servidor WSGI) devuelve lo pendiente y termina: el
+    EventSource reconecta solo tras `retry` y sigue desde su Last-Event-ID.
+    """
+    backend = backend_eventos()
+    # Suscribirse antes de leer: un evento entre la lectura y la espera no se pierde
+    suscripcion = await backend.suscribir(cliente_id) if continuo else None
+    try:
+        pendientes = desde is not None
+        if desde is None:
+            desde = await leer_y_cerrar(_ultimo_evento, cliente_id)
+        # Un id sin data fija el cursor del cliente aunque todavía no haya eventos
+        yield f"retry: {settings.EVENTOS_REINTENTO_MS}\nid: {desde}\n\n"
+        ultimo = desde
+        while True:
+            if pendientes:
+                eventos = await leer_y_cerrar(_eventos_despues, cliente_id, ultimo)
+                for fila in eventos:
+                    yield _mensaje(*fila)
+                    ultimo = fila[0]
+                if len(eventos) == MAX_POR_LECTURA:
+                    continue
+            if not continuo:
+                return
+            # Lo nuevo llega del lector del proceso; la tabla solo se relee si el stream se atrasó
+            recibidos = await suscripcion.esperar(settings.EVENTOS_LATIDO_SEGUNDOS)
+            if suscripcion.atrasada:
+                suscripcion.atrasada, pendientes = False, True
+                continue
+            if not recibidos:
+                yield ": latido\n\n"
+            # Lo que ya salió en la relectura inicial puede volver a llegar por memoria
+            for fila in recibidos:
+                if fila[0] > ultimo:
+                    yield _mensaje(*fila)
+                    ultimo = fila[0]
+    finally:
+        if suscripcion is not None:
+            backend.desuscribir(suscripcion)
+
+
+def purgar_eventos_viejos(lote=1000):
+    """Borra por lotes los eventos más viejos que EVENTOS_RETENCION_HORAS. Devuelve cuántos borró."""
+    limite = timezone.now() - timedelta(hours=settings.EVENTOS_RETENCION_HORAS)
+    return borrar_por_lotes(EventoPedido.objects.filter(creado_en__lt=limite), lote)
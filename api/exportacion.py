@@ -0,0 +1,113 @@
+import csv
+import json
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from itertools import groupby
+
+from django.utils import timezone
+from rest_framework.utils.encoders import JSONEncoder
+
+from .models import Pedido
+
+# ==========================================
+# 📤 EXPORTACIÓN DE PEDIDOS (STREAMING)
+# ==========================================
+# Se recorre la tabla por tramos de ids (keyset, sin OFFSET): primero los ids
+# de un tramo de pedidos filtrados y luego sus filas pedido+líneas+cliente.
+# La memoria depende de `lote`, no del tamaño de la exportación, incluso en
+# MySQL donde el driver no tiene cursores del lado del servidor.
+
+COLUMNAS_PEDIDO = [
+    ('pedido_id', 'id'),
+    ('fecha_pedido', 'fecha_pedido'),
+    ('estado', 'estado'),
+    ('total', 'total'),
+    ('cliente_id', 'cliente_id'),
+    ('cliente_username', 'cliente__username'),
+    ('cliente_email', 'cliente__email'),
+    ('cliente_telefono', 'cliente__telefono'),
+]
+COLUMNAS_DETALLE = [
+    ('detalle_id', 'detalles__id'),
+    ('llavero_id', 'detalles__llavero_id'),
+    ('llavero_nombre', 'detalles__llavero__nombre'),
+    ('cantidad', 'detalles__cantidad'),
+    ('precio_unitario', 'detalles__precio_unitario'),
+    ('subtotal', 'detalles__subtotal'),
+]
+COLUMNAS = COLUMNAS_PEDIDO + COLUMNAS_DETALLE
+FORMATOS = ('csv', 'ndjson')
+
+
+def filtrar_pedidos(desde=None, hasta=None, estado=None):
+    """Filtros sobre fecha_pedido/estado que usan los índices de pedidos (rango, no __date)."""
+    pedidos = Pedido.objects.all()
+    if estado:
+        pedidos = pedidos.filter(estado=estado)
+    if desde:
+        pedidos = pedidos.filter(fecha_pedido__gte=_inicio_del_dia(desde))
+    if hasta:
+        pedidos = pedidos.filter(fecha_pedido__lt=_inicio_del_dia(hasta + timedelta(days=1)))
+    return pedidos
+
+
+def _inicio_del_dia(fecha):
+    return timezone.make_aware(datetime.combine(fecha, time.min))
+
+
+def filas_pedidos(pedidos, lote=1000):
+    """Genera tuplas en el orden de COLUMNAS, un pedido tras otro (una fila por línea)."""
+    ultimo = 0
+    campos = [campo for _, campo in COLUMNAS]
+    while True:
+        ids = list(pedidos.filter(id__gt=ultimo).order_by('id').values_list('id', flat=True)[:lote])
+        if not ids:
+            return
+        yield from (
+            Pedido.objects.filter(id__in=ids)
+            .order_by('id', 'detalles__id')
+            .values_list(*campos)
+            .iterator(chunk_size=lote)
+        )
+        ultimo = ids[-1]
+
+
+class _Eco:
+    """Pseudo-buffer para csv.writer: devuelve la línea en vez de guardarla."""
+    def write(self, valor):
+        return valor
+
+
+def generar_csv(filas):
+    escritor = csv.writer(_Eco())
+    yield escritor.writerow([nombre for nombre, _ in COLUMNAS])
+    for fila in filas:
+        yield escritor.writerow(fila)
+
+
+class _EncoderExportacion(JSONEncoder):
+    # Importes como texto, igual que los DecimalField de los serializers
+    def default(self, obj):
+        if isinstance(obj, Decimal):
+            return str(obj)
+        return super().default(obj)
+
+
+def generar_ndjson(filas):
+    """Un objeto JSON por pedido con sus líneas anidadas."""
+    n_pedido = len(COLUMNAS_PEDIDO)
+    nombres_pedido = [nombre for nombre, _ in COLUMNAS_PEDIDO]
+    nombres_detalle = [nombre for nombre, _ in COLUMNAS_DETALLE]
+    for cabecera, grupo in groupby(filas, key=lambda fila: fila[:n_pedido]):
+        pedido = dict(zip(nombres_pedido, cabecera))
+        pedido['detalles'] = [
+            dict(zip(nombres_detalle, fila[n_pedido:]))
+            for fila in grupo if fila[n_pedido] is not None
+        ]
+        yield json.dumps(pedido, cls=_EncoderExportacion, ensure_ascii=False) + '\n'
+
+
+def exportar_pedidos(formato, desde=None, hasta=None, estado=None, lote=1000):
+    """Generador de texto (líneas CSV o NDJSON) listo para StreamingHttpResponse o un archivo."""
+    filas = filas_pedidos(filtrar_pedidos(desde, hasta, estado), lote)
+    return generar_csv(filas) if formato == 'csv' else generar_ndjson(filas)
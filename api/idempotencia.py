@@ -0,0 +1,122 @@
+import hashlib
+import json
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.request import Request
+from rest_framework.response import Response
+
+from .lotes import borrar_por_lotes
+from .models import ClaveIdempotencia
+
+# ==========================================
+# 🔁 IDEMPOTENCIA DE ESCRITURAS (Idempotency-Key)
+# ==========================================
+# La app manda un Idempotency-Key (p. ej. un UUID) en los POST que reintenta.
+# La clave se inserta al empezar, en la misma transacción que el trabajo de la
+# vista, y se completa con la respuesta antes del commit:
+# - un reintento posterior choca con el índice único y recibe la respuesta guardada;
+# - un duplicado simultáneo queda esperando en ese INSERT (bloqueo del índice
+#   único) hasta que el primero confirma, y entonces recibe su respuesta;
+# - si el primero falla (excepción o 5xx) la clave no queda y el reintento se ejecuta.
+# Se guarda la respuesta ya renderizada (bytes + Content-Type), no response.data:
+# el reintento recibe exactamente los mismos bytes (Decimal, fechas, orden de claves).
+# Las claves viven IDEMPOTENCIA_TTL_HORAS; las vencidas las borra purgar_claves_idempotencia.
+
+CABECERA = 'Idempotency-Key'
+MAX_LARGO_CLAVE = 255
+
+
+def limite_vigencia():
+    return timezone.now() - timedelta(hours=settings.IDEMPOTENCIA_TTL_HORAS)
+
+
+def _huella(request):
+    datos = request.data.dict() if hasattr(request.data, 'dict') else request.data
+    cuerpo = json.dumps(datos, sort_keys=True, default=str)
+    return hashlib.sha256(f'{request.method} {request.path}\n{cuerpo}'.encode()).hexdigest()
+
+
+def _repetir(guardada, huella):
+    if guardada.huella != huella:
+        return Response(
+            {"error": f"{CABECERA} ya usada con otro cuerpo"},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY
+        )
+    response = HttpResponse(bytes(guardada.cuerpo or b''), status=guardada.codigo_http,
+                            content_type=guardada.tipo_contenido or None)
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def _renderizar(request, response):
+    """Renderiza una Response de DRF como lo haría finalize_response, para guardar sus bytes."""
+    if isinstance(response, Response) and not response.is_rendered:
+        response.accepted_renderer = request.accepted_renderer
+        response.accepted_media_type = request.accepted_media_type
+        response.renderer_context = {**request.parser_context, 'request': request}
+        response.render()
+    return bytes(response.content), response.get('Content-Type', '')
+
+
+def ejecutar_idempotente(request, ambito, ejecutar):
+    """Corre `ejecutar()` una sola vez por (ambito, Idempotency-Key); sin cabecera, siempre."""
+    clave = request.headers.get(CABECERA)
+    if not clave:
+        return ejecutar()
+    if len(clave) > MAX_LARGO_CLAVE:
+        return Response(
+            {"error": f"{CABECERA} admite hasta {MAX_LARGO_CLAVE} caracteres"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    huella = _huella(request)
+    # Cada usuario tiene sus propias claves: otro que mande la misma clave y el
+    # mismo cuerpo no recibe la respuesta guardada ajena. Sin sesión, el cuerpo
+    # (que trae el cliente) ya va en la huella.
+    if request.user.is_authenticated:
+        ambito = f'{ambito}:{request.user.pk}'
+    # Una clave vencida que el barrido aún no borró no debe repetir una respuesta vieja
+    ClaveIdempotencia.objects.filter(ambito=ambito, clave=clave, creado_en__lt=limite_vigencia()).delete()
+
+    while True:
+        reservada = False
+        try:
+            with transaction.atomic():
+                registro = ClaveIdempotencia.objects.create(ambito=ambito, clave=clave, huella=huella, codigo_http=0)
+                reservada = True
+                response = ejecutar()
+                if response.status_code >= 500:
+                    registro.delete()
+                else:
+                    registro.codigo_http = response.status_code
+                    registro.cuerpo, registro.tipo_contenido = _renderizar(request, response)
+                    registro.save(update_fields=['codigo_http', 'cuerpo', 'tipo_contenido'])
+                return response
+        except IntegrityError:
+            if reservada:
+                raise  # el error vino de la vista, no de la clave
+        guardada = ClaveIdempotencia.objects.filter(ambito=ambito, clave=clave).first()
+        if guardada is not None:
+            return _repetir(guardada, huella)
+        # Se borró entre el choque y la lectura (barrido): se vuelve a intentar
+
+
+def idempotente(ambito):
+    """Decorador para vistas de función (debajo de @api_view) y métodos de ViewSet."""
+    def decorador(vista):
+        @wraps(vista)
+        def envoltura(*args, **kwargs):
+            request = next(arg for arg in args[:2] if isinstance(arg, Request))
+            return ejecutar_idempotente(request, ambito, lambda: vista(*args, **kwargs))
+        return envoltura
+    return decorador
+
+
+def purgar_claves_vencidas(lote=1000):
+    """Borra claves vencidas por lotes cortos para no bloquear la tabla. Devuelve cuántas borró."""
+    return borrar_por_lotes(ClaveIdempotencia.objects.filter(creado_en__lt=limite_vigencia()), lote)
@@ -0,0 +1,264 @@
+import csv
+import json
+from collections import defaultdict
+from itertools import islice
+
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+
+from .catalogo import invalidar_catalogo
+from .inventario import ajustar_stock_lote
+from .models import Categoria, Llavero, LlaveroMaterial, Material
+
+# ==========================================
+# 📥 IMPORTACIÓN MASIVA DEL CATÁLOGO
+# ==========================================
+# Archivos CSV (uno por tipo) o JSON ({"materiales": [...], "llaveros": [...],
+# "bom": [...]}). Se procesa por lotes: cada lote se valida en memoria y se
+# escribe con pocas consultas (upsert por sku, un INSERT de movimientos de
+# stock). Las filas inválidas se reportan y se saltan.
+#
+#   materiales: sku, nombre, unidad_medida, [descripcion], [stock_actual]
+#   llaveros:   sku, nombre, precio, categoria (nombre), [descripcion],
+#               [stock_actual], [es_personalizable], [imagen_url]
+#   bom:        llavero_sku, material_sku, cantidad_requerida
+
+TIPOS = ('materiales', 'llaveros', 'bom')
+FORMATOS = ('csv', 'json')
+LOTE = 1000
+MAX_ERRORES = 100
+
+CAMPOS = {
+    'materiales': (Material, ('nombre', 'unidad_medida'), ('descripcion', 'stock_actual')),
+    'llaveros': (Llavero, ('nombre', 'precio'), ('descripcion', 'stock_actual', 'es_personalizable', 'imagen_url')),
+}
+VERDADEROS = {'1', 'true', 't', 'si', 'sí', 'yes', 'y', 'x'}
+
+
+class ArchivoInvalido(Exception):
+    pass
+
+
+def leer_fuentes(archivo, formato, tipo=None):
+    """
+    Devuelve [(tipo, filas)] a partir de un archivo de texto abierto.
+    CSV y las listas JSON necesitan `tipo`; un objeto JSON trae sus tipos como claves.
+    """
+    if formato not in FORMATOS:
+        raise ArchivoInvalido(f"Formato no soportado: {formato}")
+    if tipo is not None and tipo not in TIPOS:
+        raise ArchivoInvalido(f"Tipo inválido: {tipo}. Use uno de: {', '.join(TIPOS)}")
+
+    if formato == 'csv':
+        if tipo is None:
+            raise ArchivoInvalido("Para CSV indique el tipo (materiales, llaveros o bom)")
+        return [(tipo, csv.DictReader(archivo))]
+
+    try:
+        datos = json.load(archivo)
+    except json.JSONDecodeError as e:
+        raise ArchivoInvalido(f"JSON inválido: {e}")
+    if isinstance(datos, list):
+        if tipo is None:
+            raise ArchivoInvalido("Para una lista JSON indique el tipo (materiales, llaveros o bom)")
+        return [(tipo, datos)]
+    if not isinstance(datos, dict):
+        raise ArchivoInvalido("El JSON debe ser una lista de filas o un objeto con materiales/llaveros/bom")
+    # Materiales y llaveros antes que la BOM que los referencia
+    return [(t, datos[t]) for t in TIPOS if t in datos and (tipo is None or t == tipo)]
+
+
+def importar_catalogo(fuentes, lote=LOTE, solo_validar=False):
+    """Importa las fuentes de leer_fuentes(). Devuelve un resumen por tipo y los primeros errores."""
+    resumen = {
+        'tipos': {},
+        'errores': [],
+        'total_errores': 0,
+    }
+    categorias = dict(Categoria.objects.values_list('nombre', 'id'))
+    hubo_cambios = False
+
+    for tipo, filas in fuentes:
+        conteo = resumen['tipos'].setdefault(
+            tipo, {'filas': 0, 'validas': 0, 'creadas': 0, 'actualizadas': 0, 'con_error': 0}
+        )
+        numeradas = enumerate(filas, start=1)
+        while True:
+            tramo = list(islice(numeradas, lote))
+            if not tramo:
+                break
+            conteo['filas'] += len(tramo)
+            validas, errores = _validar(tipo, tramo, categorias)
+            conteo['validas'] += len(validas)
+            conteo['con_error'] += len(errores)
+            resumen['total_errores'] += len(errores)
+            espacio = MAX_ERRORES - len(resumen['errores'])
+            resumen['errores'].extend({'tipo': tipo, **error} for error in errores[:max(espacio, 0)])
+
+            if solo_validar or not validas:
+                continue
+            with transaction.atomic():
+                if tipo == 'bom':
+                    creadas, actualizadas, invalidas = _escribir_bom(validas)
+                    for numero, mensaje in invalidas:
+                        conteo['con_error'] += 1
+                        conteo['validas'] -= 1
+                        resumen['total_errores'] += 1
+                        if len(resumen['errores']) < MAX_ERRORES:
+                            resumen['errores'].append({'tipo': tipo, 'fila': numero, 'errores': mensaje})
+                else:
+                    creadas, actualizadas = _escribir_items(CAMPOS[tipo][0], validas)
+            conteo['creadas'] += creadas
+            conteo['actualizadas'] += actualizadas
+            hubo_cambios = hubo_cambios or bool(creadas or actualizadas)
+
+    if hubo_cambios:
+        # Una sola invalidación para toda la carga
+        invalidar_catalogo()
+    return resumen
+
+
+# ------------------------------------------
+# Validación
+# ------------------------------------------
+
+def _texto(valor):
+    return valor.strip() if isinstance(valor, str) else valor
+
+
+def _limpiar(modelo, nombre, valor):
+    campo = modelo._meta.get_field(nombre)
+    if nombre == 'es_personalizable' and isinstance(valor, str):
+        valor = valor.strip().lower() in VERDADEROS
+    if valor in ('', None) and campo.null:
+        valor = None
+    elif valor is None:
+        valor = ''
+    return campo.clean(valor, None)
+
+
+def _validar(tipo, tramo, categorias):
+    """Devuelve ([(numero, valores)], [errores]) sin tocar la base (salvo la BOM, que resuelve skus al escribir)."""
+    validas, errores = [], []
+    for numero, fila in tramo:
+        if not isinstance(fila, dict):
+            errores.append({'fila': numero, 'errores': "La fila debe ser un objeto"})
+            continue
+        fila = {clave.strip(): _texto(valor) for clave, valor in fila.items() if clave}
+        try:
+            valores = _validar_bom(fila) if tipo == 'bom' else _validar_item(tipo, fila, categorias)
+        except ValidationError as e:
+            errores.append({'fila': numero, 'errores': e.message_dict if hasattr(e, 'error_dict') else e.messages})
+            continue
+        validas.append((numero, valores))
+    return validas, errores
+
+
+def _validar_item(tipo, fila, categorias):
+    modelo, requeridos, opcionales = CAMPOS[tipo]
+    valores, errores = {}, {}
+    if not fila.get('sku'):
+        errores['sku'] = ["El sku es obligatorio para importar"]
+    for nombre in ('sku', *requeridos, *opcionales):
+        if nombre not in requeridos and fila.get(nombre) in (None, ''):
+            continue  # opcional ausente: se deja como está (o el default si es nuevo)
+        try:
+            valores[nombre] = _limpiar(modelo, nombre, fila.get(nombre))
+        except ValidationError as e:
+            errores.setdefault(nombre, []).extend(e.messages)
+
+    if modelo is Llavero:
+        nombre_categoria = fila.get('categoria')
+        if not nombre_categoria:
+            errores['categoria'] = ["La categoría es obligatoria"]
+        elif nombre_categoria not in categorias:
+            errores['categoria'] = [f"Categoría desconocida: {nombre_categoria}"]
+        else:
+            valores['categoria_id'] = categorias[nombre_categoria]
+
+    if errores:
+        raise ValidationError(errores)
+    return valores
+
+
+def _validar_bom(fila):
+    errores = {}
+    for nombre in ('llavero_sku', 'material_sku'):
+        if not fila.get(nombre):
+            errores[nombre] = ["Obligatorio"]
+    try:
+        cantidad = _limpiar(LlaveroMaterial, 'cantidad_requerida', fila.get('cantidad_requerida'))
+    except ValidationError as e:
+        errores['cantidad_requerida'] = e.messages
+    if errores:
+        raise ValidationError(errores)
+    return {'llavero_sku': fila['llavero_sku'], 'material_sku': fila['material_sku'], 'cantidad_requerida': cantidad}
+
+
+# ------------------------------------------
+# Escritura
+# ------------------------------------------
+
+def _upsert(modelo, objetos, unique_fields, update_fields):
+    opciones = {'update_conflicts': True, 'update_fields': update_fields}
+    # MySQL hace el upsert con ON DUPLICATE KEY y no acepta unique_fields
+    if connection.features.supports_update_conflicts_with_target:
+        opciones['unique_fields'] = unique_fields
+    modelo.objects.bulk_create(objetos, batch_size=LOTE, **opciones)
+
+
+def _escribir_items(modelo, validas):
+    # Si un sku se repite en el lote gana la última fila
+    por_sku = {valores['sku']: valores for _, valores in validas}
+    existentes = dict(modelo.objects.filter(sku__in=list(por_sku)).values_list('sku', 'pk'))
+
+    # Un upsert por combinación de columnas presentes: una opcional ausente no pisa
+    # lo guardado. Es bastante más rápido que bulk_update (un CASE por columna).
+    grupos = defaultdict(list)
+    stock_existentes = {}
+    for sku, valores in por_sku.items():
+        if sku in existentes and 'stock_actual' in valores:
+            # El stock de un item existente se cambia con un movimiento del libro
+            stock_existentes[existentes[sku]] = valores['stock_actual']
+        columnas = tuple(sorted(set(valores) - {'sku', 'stock_actual'}))
+        grupos[columnas].append(modelo(**{'stock_actual': 0, **valores}))
+
+    for columnas, objetos in grupos.items():
+        _upsert(modelo, objetos, ['sku'], list(columnas))
+    ajustar_stock_lote(modelo, stock_existentes)
+    return len(por_sku) - len(existentes), len(existentes)
+
+
+def _escribir_bom(validas):
+    """Upsert de (llavero, material) -> cantidad. Devuelve (creadas, actualizadas, [(fila, error)])."""
+    llaveros = dict(Llavero.objects.filter(
+        sku__in={valores['llavero_sku'] for _, valores in validas}
+    ).values_list('sku', 'pk'))
+    materiales = dict(Material.objects.filter(
+        sku__in={valores['material_sku'] for _, valores in validas}
+    ).values_list('sku', 'pk'))
+
+    por_par, invalidas = {}, []
+    for numero, valores in validas:
+        llavero_id = llaveros.get(valores['llavero_sku'])
+        material_id = materiales.get(valores['material_sku'])
+        if llavero_id is None or material_id is None:
+            faltante = 'llavero_sku' if llavero_id is None else 'material_sku'
+            invalidas.append((numero, {faltante: [f"No existe: {valores[faltante]}"]}))
+            continue
+        por_par[(llavero_id, material_id)] = valores['cantidad_requerida']
+    if not por_par:
+        return 0, 0, invalidas
+
+    existentes = set(LlaveroMaterial.objects.filter(
+        llavero_id__in={llavero_id for llavero_id, _ in por_par},
+        material_id__in={material_id for _, material_id in por_par},
+    ).values_list('llavero_id', 'material_id'))
+    _upsert(
+        LlaveroMaterial,
+        [LlaveroMaterial(llavero_id=l, material_id=m, cantidad_requerida=c) for (l, m), c in por_par.items()],
+        ['llavero', 'material'],
+        ['cantidad_requerida'],
+    )
+    actualizadas = len(existentes & set(por_par))
+    return len(por_par) - actualizadas, actualizadas, invalidas
@@ -0,0 +1,320 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, DecimalField, F, Max, Min, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .lotes import borrar_por_lotes, marca_de_agua
+from .models import Llavero, Material, MovimientoInventario, SnapshotInventario, ReservaStock
+
+# ==========================================
+# 📒 LIBRO DE INVENTARIO
+# ==========================================
+# Los escritores solo agregan filas a MovimientoInventario (bulk_create), nunca
+# actualizan la fila caliente del llavero/material. Cada cierto tiempo
+# compactar_inventario() suma los movimientos nuevos en stock_actual y guarda
+# una foto en SnapshotInventario. Leer el stock vigente es la fila + los pocos
+# movimientos posteriores a su corte (índice (item, id)).
+
+DECIMAL = DecimalField(max_digits=12, decimal_places=2)
+CERO = Value(Decimal('0'), output_field=DECIMAL)
+MAX_PENDIENTES_EN_FILTRO = 1000
+
+
+def _campo(modelo):
+    return 'llavero' if modelo is Llavero else 'material'
+
+
+def _suma_pendiente(modelo):
+    """Subquery: suma de movimientos del item posteriores a su movimiento_corte."""
+    campo = _campo(modelo)
+    movimientos = (
+        MovimientoInventario.objects
+        .filter(**{campo: OuterRef('pk')}, id__gt=OuterRef('movimiento_corte'))
+        .values(campo)
+        .annotate(total=Sum('cantidad'))
+        .values('total')
+    )
+    return Coalesce(Subquery(movimientos, output_field=DECIMAL), CERO)
+
+
+def con_stock_vigente(queryset):
+    """Anota `stock_vigente` en un queryset de Llavero o Material."""
+    return queryset.annotate(stock_vigente=F('stock_actual') + _suma_pendiente(queryset.model))
+
+
+def stock_vigente(obj):
+    if hasattr(obj, 'stock_vigente'):
+        return obj.stock_vigente
+    campo = _campo(type(obj))
+    pendiente = MovimientoInventario.objects.filter(
+        **{campo: obj.pk}, id__gt=obj.movimiento_corte
+    ).aggregate(total=Sum('cantidad'))['total'] or 0
+    return obj.stock_actual + pendiente
+
+
+def filtrar_con_stock(queryset):
+    """
+    Equivale a filtrar stock_vigente > 0 sin la subconsulta por fila: todo
+    movimiento hasta el último snapshot ya está en stock_actual, así que solo se
+    suman los posteriores (rango chico de la PK) y el resto se resuelve con stock_actual.
+    """
+    campo = _campo(queryset.model)
+    corte = SnapshotInventario.objects.order_by('-id').values_list('movimiento_hasta', flat=True).first() or 0
+    pendientes = list(
+        MovimientoInventario.objects
+        .filter(**{f'{campo}__isnull': False}, id__gt=corte)
+        .filter(id__gt=F(f'{campo}__movimiento_corte'))
+        .values_list(f'{campo}_id', f'{campo}__stock_actual')
+        .annotate(total=Sum('cantidad'))
+        .order_by()
+    )
+    if len(pendientes) > MAX_PENDIENTES_EN_FILTRO:
+        # Sin compactar hace rato: listas tan largas salen peor que la subconsulta
+        if 'stock_vigente' not in queryset.query.annotations:
+            queryset = con_stock_vigente(queryset)
+        return queryset.filter(stock_vigente__gt=0)
+    con_pendientes = [pk for pk, _, _ in pendientes]
+    positivos = [pk for pk, stock, total in pendientes if stock + total > 0]
+    return queryset.filter((Q(stock_actual__gt=0) & ~Q(pk__in=con_pendientes)) | Q(pk__in=positivos))
+
+
+def registrar_movimientos(movimientos):
+    """Agrega movimientos al libro con un solo INSERT."""
+    return MovimientoInventario.objects.bulk_create(movimientos, batch_size=1000)
+
+
+def ajustar_stock(obj, nuevo_stock, actual=None):
+    """
+    Lleva el stock vigente de un llavero/material a `nuevo_stock` con un movimiento.
+    `actual` permite pasar el stock vigente leído antes de modificar el objeto.
+    """
+    if actual is None:
+        actual = stock_vigente(obj)
+    diferencia = Decimal(nuevo_stock) - Decimal(actual)
+    obj.stock_vigente = nuevo_stock
+    if diferencia == 0:
+        return None
+    movimiento = MovimientoInventario(
+        tipo='reposicion' if diferencia > 0 else 'ajuste',
+        cantidad=diferencia,
+        **{_campo(type(obj)): obj},
+    )
+    registrar_movimientos([movimiento])
+    return movimiento
+
+
+def ajustar_stock_lote(modelo, objetivos):
+    """Como ajustar_stock para muchos items: {pk: nuevo_stock}, con una lectura y un INSERT."""
+    if not objetivos:
+        return []
+    actuales = dict(
+        con_stock_vigente(modelo.objects.filter(pk__in=list(objetivos))).values_list('pk', 'stock_vigente')
+    )
+    campo = _campo(modelo)
+    movimientos = []
+    for pk, nuevo_stock in objetivos.items():
+        diferencia = Decimal(nuevo_stock) - Decimal(actuales[pk])
+        if diferencia:
+            movimientos.append(MovimientoInventario(
+                tipo='reposicion' if diferencia > 0 else 'ajuste',
+                cantidad=diferencia,
+                **{f'{campo}_id': pk},
+            ))
+    return registrar_movimientos(movimientos)
+
+
+# ==========================================
+# 📸 SNAPSHOTS PERIÓDICOS
+# ==========================================
+
+def compactar_inventario(espera_huecos_segundos=600, lote=500):
+    """
+    Aplica los movimientos nuevos a stock_actual y guarda las fotos. Avanza
+    solo hasta marca_de_agua(): un movimiento que hace commit tarde nunca
+    queda por debajo de un corte ya aplicado.
+    """
+    desde = SnapshotInventario.objects.order_by('-id').values_list('movimiento_hasta', flat=True).first() or 0
+    hasta = marca_de_agua(MovimientoInventario.objects.all(), desde, espera_huecos_segundos)
+    resumen = {'llaveros': 0, 'materiales': 0, 'movimiento_hasta': hasta}
+    if not hasta:
+        return resumen
+
+    for modelo, clave in ((Llavero, 'llaveros'), (Material, 'materiales')):
+        campo = _campo(modelo)
+        pendientes = list(
+            MovimientoInventario.objects
+            .filter(**{f'{campo}__isnull': False}, id__lte=hasta, id__gt=F(f'{campo}__movimiento_corte'))
+            .values_list(f'{campo}_id', flat=True)
+            .distinct()
+            .order_by(f'{campo}_id')
+        )
+        for inicio in range(0, len(pendientes), lote):
+            resumen[clave] += _compactar_lote(modelo, pendientes[inicio:inicio + lote], hasta)
+    return resumen
+
+
+def _compactar_lote(modelo, ids, hasta):
+    campo = _campo(modelo)
+    with transaction.atomic():
+        # Con las filas bloqueadas, otra compactación no puede aplicar los mismos movimientos
+        filas = {
+            pk: (stock, corte) for pk, stock, corte in
+            modelo.objects.select_for_update().filter(pk__in=ids).values_list('pk', 'stock_actual', 'movimiento_corte')
+        }
+        deltas = dict(
+            MovimientoInventario.objects
+            .filter(**{f'{campo}_id__in': ids}, id__lte=hasta, id__gt=F(f'{campo}__movimiento_corte'))
+            .values_list(f'{campo}_id')
+            .annotate(total=Sum('cantidad'))
+            .order_by()
+        )
+        if not deltas:
+            return 0
+
+        nuevos = {pk: filas[pk][0] + delta for pk, delta in deltas.items()}
+        if modelo is Llavero:
+            nuevos = {pk: int(valor) for pk, valor in nuevos.items()}
+
+        modelo.objects.filter(pk__in=list(nuevos)).update(
+            stock_actual=Case(
+                *[When(pk=pk, then=Value(valor)) for pk, valor in nuevos.items()],
+                output_field=modelo._meta.get_field('stock_actual'),
+            ),
+            movimiento_corte=hasta,
+        )
+        SnapshotInventario.objects.bulk_create([
+            SnapshotInventario(
+                movimiento_desde=filas[pk][1], movimiento_hasta=hasta,
+                stock_anterior=filas[pk][0], stock=valor,
+                **{f'{campo}_id': pk},
+            )
+            for pk, valor in nuevos.items()
+        ])
+    return len(nuevos)
+
+
+# ==========================================
+# 🔎 CONCILIACIÓN LIBRO VS SNAPSHOTS
+# ==========================================
+
+def reconciliar_inventario(lote=5000):
+    """
+    Verifica por tramos de ids que:
+      1. cada snapshot = stock_anterior + movimientos de su rango,
+      2. cada snapshot continúa al anterior del mismo item,
+      3. stock_actual/movimiento_corte de cada item coinciden con su último snapshot.
+    Devuelve (revisados, lista de diferencias).
+    """
+    diferencias = []
+    revisados = 0
+    for modelo in (Llavero, Material):
+        campo = _campo(modelo)
+        snapshots = SnapshotInventario.objects.filter(**{f'{campo}__isnull': False})
+        movimientos = (
+            MovimientoInventario.objects
+            .filter(**{campo: OuterRef(campo)}, id__gt=OuterRef('movimiento_desde'), id__lte=OuterRef('movimiento_hasta'))
+            .values(campo).annotate(total=Sum('cantidad')).values('total')
+        )
+        anterior = snapshots.filter(**{campo: OuterRef(campo)}, id__lt=OuterRef('pk')).order_by('-id')
+
+        for desde, hasta in _tramos(snapshots, lote):
+            tramo = snapshots.filter(pk__gte=desde, pk__lt=hasta).annotate(
+                esperado=F('stock_anterior') + Coalesce(Subquery(movimientos, output_field=DECIMAL), CERO),
+                previo_stock=Subquery(anterior.values('stock')[:1]),
+                previo_hasta=Subquery(anterior.values('movimiento_hasta')[:1]),
+            )
+            revisados += tramo.count()
+            for snap in tramo.exclude(stock=F('esperado')).values('id', f'{campo}_id', 'stock', 'esperado'):
+                diferencias.append({'tipo': 'snapshot_vs_libro', **snap})
+            for snap in tramo.filter(previo_stock__isnull=False).exclude(
+                stock_anterior=F('previo_stock'), movimiento_desde=F('previo_hasta')
+            ).values('id', f'{campo}_id', 'stock_anterior', 'previo_stock'):
+                diferencias.append({'tipo': 'cadena_rota', **snap})
+
+        ultimo = snapshots.filter(**{campo: OuterRef('pk')}).order_by('-id')
+        items = modelo.objects.annotate(
+            snap_stock=Subquery(ultimo.values('stock')[:1]),
+            snap_hasta=Subquery(ultimo.values('movimiento_hasta')[:1]),
+        ).filter(snap_stock__isnull=False)
+        for desde, hasta in _tramos(modelo.objects.all(), lote):
+            tramo = items.filter(pk__gte=desde, pk__lt=hasta)
+            for item in tramo.exclude(stock_actual=F('snap_stock'), movimiento_corte=F('snap_hasta')).values(
+                'id', 'stock_actual', 'snap_stock'
+            ):
+                diferencias.append({'tipo': f'{campo}_vs_snapshot', **item})
+    return revisados, diferencias
+
+
+def _tramos(queryset, lote):
+    """Rangos [desde, hasta) de pk para recorrer tablas grandes sin OFFSET."""
+    limites = queryset.aggregate(minimo=Min('pk'), maximo=Max('pk'))
+    if limites['maximo'] is None:
+        return
+    desde = limites['minimo']
+    while desde <= limites['maximo']:
+        yield desde, desde + lote
+        desde += lote
+
+
+# ==========================================
+# ⏳ RESERVAS DE STOCK (CARRITOS)
+# ==========================================
+# Agregar al carrito aparta stock por RESERVA_TTL_MINUTOS. Disponible =
+# stock vigente - reservas activas de otros carritos (índice (llavero, expira_en)).
+# La fila del llavero se bloquea mientras se decide, así dos carritos no
+# pueden apartar la misma última unidad.
+
+class StockInsuficiente(Exception):
+    def __init__(self, disponible):
+        super().__init__(f"No hay suficiente stock. Disponibles: {disponible}")
+        self.disponible = disponible
+
+
+def reservado_por_otros(llavero_id, carrito_id=None):
+    reservas = ReservaStock.objects.filter(llavero_id=llavero_id, expira_en__gt=timezone.now())
+    if carrito_id is not None:
+        reservas = reservas.exclude(carrito_id=carrito_id)
+    return reservas.aggregate(total=Sum('cantidad'))['total'] or 0
+
+
+def bloquear_llavero(llavero_id):
+    """Bloquea la fila del llavero (dentro de una transacción) y la devuelve con su stock vigente."""
+    return con_stock_vigente(
+        Llavero.objects.select_for_update().only('id', 'nombre', 'stock_actual', 'movimiento_corte')
+    ).get(pk=llavero_id)
+
+
+def disponible_para(llavero, carrito_id=None):
+    return int(stock_vigente(llavero)) - reservado_por_otros(llavero.pk, carrito_id)
+
+
+def reservar(carrito_id, llavero_id, cantidad):
+    """Fija la reserva del carrito para ese llavero en `cantidad` unidades (total, no incremento)."""
+    with transaction.atomic():
+        llavero = bloquear_llavero(llavero_id)
+        disponible = disponible_para(llavero, carrito_id)
+        if cantidad > disponible:
+            raise StockInsuficiente(disponible)
+        ReservaStock.objects.update_or_create(
+            carrito_id=carrito_id, llavero_id=llavero_id,
+            defaults={
+                'cantidad': cantidad,
+                'expira_en': timezone.now() + timedelta(minutes=settings.RESERVA_TTL_MINUTOS),
+            },
+        )
+
+
+def liberar_reservas(carrito_id, llavero_id=None):
+    reservas = ReservaStock.objects.filter(carrito_id=carrito_id)
+    if llavero_id is not None:
+        reservas = reservas.filter(llavero_id=llavero_id)
+    reservas.delete()
+
+
+def purgar_reservas_vencidas(lote=1000):
+    """Borra reservas vencidas por lotes cortos para no bloquear la tabla. Devuelve cuántas borró."""
+    return borrar_por_lotes(ReservaStock.objects.filter(expira_en__lte=timezone.now()), lote)
@@ -0,0 +1,67 @@
+from datetime import timedelta
+
+from django.utils import timezone
+
+# ==========================================
+# 🧹 TRABAJO POR LOTES
+# ==========================================
+# Las purgas y liberaciones periódicas nunca borran/actualizan toda la tabla
+# de una vez: leen hasta `lote` ids y operan sobre esos, así cada sentencia
+# bloquea pocas filas y poco tiempo aunque haya millones pendientes.
+
+
+def por_lotes(queryset, lote, accion):
+    """
+    Llama `accion(ids)` con hasta `lote` ids de `queryset` (releído en cada
+    vuelta) hasta que un lote procese menos de `lote` filas: no quedan más, o
+    las que quedan las tiene bloqueadas otro. `accion` devuelve cuántas filas
+    procesó. Devuelve el total.
+    """
+    total = 0
+    while True:
+        ids = list(queryset.values_list('pk', flat=True)[:lote])
+        hechas = accion(ids) if ids else 0
+        total += hechas
+        if hechas < lote:
+            return total
+
+
+def borrar_por_lotes(queryset, lote=1000, al_borrar=None):
+    """
+    Borra las filas de `queryset` con DELETEs de hasta `lote` ids. Cada DELETE
+    repite el filtro del queryset por si una fila cambió entre la lectura y el
+    borrado. `al_borrar` recibe {modelo: filas} de cada lote (cascadas
+    incluidas). Devuelve cuántas filas del modelo del queryset borró.
+    """
+    etiqueta = queryset.model._meta.label
+
+    def borrar(ids):
+        _, por_modelo = queryset.filter(pk__in=ids).delete()
+        if al_borrar is not None:
+            al_borrar(por_modelo)
+        return por_modelo.get(etiqueta, 0)
+
+    return por_lotes(queryset, lote, borrar)
+
+
+def marca_de_agua(queryset, desde, espera_huecos_segundos=600, tope=100000):
+    """
+    Mayor id H tal que todas las filas de `queryset` con id en (desde, H] ya
+    son visibles. Los ids se asignan al insertar, no al hacer commit: un hueco
+    en la secuencia puede ser una transacción abierta cuya fila aparecerá
+    después con un id menor. Por eso la marca se detiene en el primer hueco,
+    salvo que la fila siguiente tenga más de `espera_huecos_segundos` según su
+    `creado_en` (entonces el hueco es un rollback o un borrado y se salta). Las
+    transacciones que insertan en la tabla deben durar menos que esa espera.
+    Mira a lo sumo `tope` filas (None: todas).
+    """
+    limite = timezone.now() - timedelta(seconds=espera_huecos_segundos)
+    hasta = desde
+    siguientes = queryset.filter(id__gt=desde).order_by('id').values_list('id', 'creado_en')
+    if tope is not None:
+        siguientes = siguientes[:tope]
+    for pk, creado_en in siguientes.iterator(chunk_size=10000):
+        if pk != hasta + 1 and creado_en > limite:
+            break
+        hasta = pk
+    return hasta
@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+
+class ComandoPorLotes(BaseCommand):
+    """
+    Base de los comandos de mantenimiento: --lote, --cada y una línea de
+    resumen con el tiempo. Las subclases definen `lote_por_defecto`,
+    `ayuda_lote` y ejecutar(lote, **options), que devuelve el resumen.
+    """
+    lote_por_defecto = 1000
+    ayuda_lote = "Filas por lote"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=self.lote_por_defecto, help=self.ayuda_lote)
+        parser.add_argument('--cada', type=int, default=0,
+                            help="Repetir cada N segundos (0 = una sola vez, para cron/Cloud Scheduler)")
+
+    def ejecutar(self, lote, **options):
+        raise NotImplementedError
+
+    def handle(self, *args, **options):
+        while True:
+            inicio = time.perf_counter()
+            resumen = self.ejecutar(**options)
+            self.stdout.write(self.style.SUCCESS(f"{resumen} en {time.perf_counter() - inicio:.2f}s"))
+            if not options['cada']:
+                break
+            time.sleep(options['cada'])
@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.pedidos import auditar_totales
+
+
+class Command(BaseCommand):
+    help = "Compara Pedido.total con la suma de sus líneas (por tramos) y reporta los desvíos."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=5000, help="Pedidos por tramo")
+        parser.add_argument('--corregir', action='store_true', help="Ajustar los totales desviados")
+        parser.add_argument('--mostrar', type=int, default=20, help="Desvíos a listar")
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        revisados, desvios = auditar_totales(
+            lote=options['lote'],
+            corregir=options['corregir'],
+            progreso=lambda n, d: self.stdout.write(f"  {n} pedidos revisados ({d} desvíos)..."),
+        )
+        for pedido_id, guardado, calculado in desvios[:options['mostrar']]:
+            self.stdout.write(f"  Pedido #{pedido_id}: total {guardado}, líneas {calculado}")
+        accion = "corregido(s)" if options['corregir'] else "encontrado(s)"
+        estilo = self.style.SUCCESS if options['corregir'] or not desvios else self.style.WARNING
+        self.stdout.write(estilo(
+            f"{revisados} pedidos revisados, {len(desvios)} desvío(s) {accion} en {time.perf_counter() - inicio:.2f}s"
+        ))
@@ -0,0 +1,28 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.carritos import barrer_carritos_abandonados
+
+
+class Command(BaseCommand):
+    help = "Borra por lotes los carritos sin actividad (con sus items y reservas)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dias', type=int, default=None,
+                            help=f"Días sin actividad (por defecto CARRITO_ABANDONADO_DIAS={settings.CARRITO_ABANDONADO_DIAS})")
+        parser.add_argument('--lote', type=int, default=500, help="Carritos por DELETE")
+        parser.add_argument('--cada', type=int, default=0,
+                            help="Repetir cada N segundos (0 = una sola vez, para cron/Cloud Scheduler)")
+
+    def handle(self, *args, **options):
+        while True:
+            m = barrer_carritos_abandonados(dias=options['dias'], lote=options['lote'])
+            self.stdout.write(self.style.SUCCESS(
+                f"carritos_borrados={m['carritos']} items_borrados={m['items']} "
+                f"reservas_borradas={m['reservas']} lotes={m['lotes']} segundos={m['segundos']:.2f}"
+            ))
+            if not options['cada']:
+                break
+            time.sleep(options['cada'])
@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.inventario import compactar_inventario
+
+
+class Command(BaseCommand):
+    help = "Aplica los movimientos nuevos del libro de inventario a stock_actual y guarda snapshots."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=500, help="Items por transacción")
+        parser.add_argument('--espera-huecos', type=int, default=600,
+                            help="Segundos tras los que un hueco en los ids del libro se da por rollback")
+        parser.add_argument('--cada', type=int, default=0,
+                            help="Repetir cada N segundos (0 = una sola vez, para cron/Cloud Scheduler)")
+
+    def handle(self, *args, **options):
+        while True:
+            inicio = time.perf_counter()
+            resumen = compactar_inventario(espera_huecos_segundos=options['espera_huecos'], lote=options['lote'])
+            self.stdout.write(self.style.SUCCESS(
+                f"Snapshot hasta movimiento {resumen['movimiento_hasta']}: "
+                f"{resumen['llaveros']} llavero(s), {resumen['materiales']} material(es) "
+                f"en {time.perf_counter() - inicio:.2f}s"
+            ))
+            if not options['cada']:
+                break
+            time.sleep(options['cada'])
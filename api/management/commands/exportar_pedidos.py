@@ -0,0 +1,44 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from api.exportacion import exportar_pedidos, FORMATOS
+from api.models import Pedido
+
+
+class Command(BaseCommand):
+    help = "Exporta pedidos + líneas + cliente como CSV o NDJSON sin cargarlos todos en memoria."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--formato', choices=FORMATOS, default='csv')
+        parser.add_argument('--desde', help="YYYY-MM-DD (incluido)")
+        parser.add_argument('--hasta', help="YYYY-MM-DD (incluido)")
+        parser.add_argument('--estado', choices=[valor for valor, _ in Pedido.ESTADOS])
+        parser.add_argument('--salida', help="Archivo destino (por defecto la salida estándar)")
+        parser.add_argument('--lote', type=int, default=1000, help="Pedidos por consulta")
+
+    def handle(self, *args, **options):
+        fechas = {}
+        for nombre in ('desde', 'hasta'):
+            if options[nombre]:
+                fechas[nombre] = parse_date(options[nombre])
+                if fechas[nombre] is None:
+                    raise CommandError(f"--{nombre} inválida, use YYYY-MM-DD")
+
+        inicio = time.perf_counter()
+        lineas = exportar_pedidos(options['formato'], estado=options['estado'], lote=options['lote'], **fechas)
+        destino = open(options['salida'], 'w', encoding='utf-8', newline='') if options['salida'] else sys.stdout
+        try:
+            escritas = 0
+            for linea in lineas:
+                destino.write(linea)
+                escritas += 1
+        finally:
+            if options['salida']:
+                destino.close()
+        if options['salida']:
+            self.stdout.write(self.style.SUCCESS(
+                f"{escritas} línea(s) escritas en {options['salida']} en {time.perf_counter() - inicio:.2f}s"
+            ))
@@ -0,0 +1,44 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.importacion import ArchivoInvalido, FORMATOS, LOTE, TIPOS, importar_catalogo, leer_fuentes
+
+
+class Command(BaseCommand):
+    help = "Importa/actualiza materiales, llaveros y BOM desde un CSV o JSON (upsert por sku, por lotes)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('archivo')
+        parser.add_argument('--tipo', choices=TIPOS, help="Obligatorio para CSV y listas JSON")
+        parser.add_argument('--formato', choices=FORMATOS, help="Por defecto según la extensión del archivo")
+        parser.add_argument('--lote', type=int, default=LOTE, help="Filas por lote")
+        parser.add_argument('--validar', action='store_true', help="Solo validar, sin escribir")
+
+    def handle(self, *args, **options):
+        formato = options['formato'] or os.path.splitext(options['archivo'])[1].lstrip('.').lower()
+        inicio = time.perf_counter()
+        try:
+            with open(options['archivo'], encoding='utf-8-sig', newline='') as archivo:
+                fuentes = leer_fuentes(archivo, formato, options['tipo'])
+                resumen = importar_catalogo(fuentes, lote=options['lote'], solo_validar=options['validar'])
+        except (ArchivoInvalido, OSError) as e:
+            raise CommandError(str(e))
+        segundos = time.perf_counter() - inicio
+
+        filas = 0
+        for tipo, conteo in resumen['tipos'].items():
+            filas += conteo['filas']
+            self.stdout.write(
+                f"{tipo:<11} filas={conteo['filas']} válidas={conteo['validas']} creadas={conteo['creadas']} "
+                f"actualizadas={conteo['actualizadas']} con_error={conteo['con_error']}"
+            )
+        mostrados = resumen['errores'][:20]
+        for error in mostrados:
+            self.stdout.write(self.style.ERROR(f"  {error['tipo']} fila {error['fila']}: {error['errores']}"))
+        if resumen['total_errores'] > len(mostrados):
+            self.stdout.write(self.style.ERROR(f"  ... y {resumen['total_errores'] - len(mostrados)} error(es) más"))
+
+        velocidad = filas / segundos if segundos else filas
+        self.stdout.write(self.style.SUCCESS(f"{filas} filas en {segundos:.2f}s ({velocidad:,.0f} filas/s)"))
@@ -0,0 +1,11 @@
+from api.management.base import ComandoPorLotes
+from api.pedidos import liberar_tomas_vencidas
+
+
+class Command(ComandoPorLotes):
+    help = "Devuelve a 'Pendiente' los pedidos de la cola de preparación cuya toma venció."
+    lote_por_defecto = 500
+    ayuda_lote = "Pedidos por UPDATE"
+
+    def ejecutar(self, lote, **options):
+        return f"{liberar_tomas_vencidas(lote=lote)} pedido(s) con la toma vencida volvieron a la cola"
@@ -0,0 +1,10 @@
+from api.management.base import ComandoPorLotes
+from api.inventario import purgar_reservas_vencidas
+
+
+class Command(ComandoPorLotes):
+    help = "Borra por lotes las reservas de stock de carritos que ya vencieron."
+    ayuda_lote = "Reservas por DELETE"
+
+    def ejecutar(self, lote, **options):
+        return f"{purgar_reservas_vencidas(lote=lote)} reserva(s) vencida(s) liberadas"
@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.mrp import calcular_mrp
+
+
+class Command(BaseCommand):
+    help = "Calcula cuánto se puede producir de cada llavero y qué materiales faltan para los pedidos pendientes."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--faltantes', action='store_true', help="Mostrar solo materiales con faltante")
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        resultado = calcular_mrp(solo_faltantes=options['faltantes'])
+        segundos = time.perf_counter() - inicio
+
+        self.stdout.write("LLAVEROS (máximo producible con el stock actual)")
+        for fila in resultado['llaveros']:
+            maximo = fila['maximo_producible']
+            self.stdout.write(f"  #{fila['llavero_id']:<6} {fila['nombre']:<50} {'sin BOM' if maximo is None else maximo}")
+
+        self.stdout.write("\nMATERIALES (stock / demanda pendiente / faltante)")
+        for fila in resultado['materiales']:
+            linea = (f"  #{fila['material_id']:<6} {fila['nombre']:<50} "
+                     f"{fila['stock_actual']:>10} {fila['demanda_pendiente']:>10} {fila['faltante']:>10}")
+            self.stdout.write(self.style.ERROR(linea) if fila['faltante'] > 0 else linea)
+
+        self.stdout.write(self.style.SUCCESS(f"\nMRP calculado en {segundos:.3f}s"))
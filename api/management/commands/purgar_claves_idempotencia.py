@@ -0,0 +1,10 @@
+from api.management.base import ComandoPorLotes
+from api.idempotencia import purgar_claves_vencidas
+
+
+class Command(ComandoPorLotes):
+    help = "Borra por lotes las claves de idempotencia (y sus respuestas guardadas) que ya vencieron."
+    ayuda_lote = "Claves por DELETE"
+
+    def ejecutar(self, lote, **options):
+        return f"{purgar_claves_vencidas(lote=lote)} clave(s) vencida(s) borradas"
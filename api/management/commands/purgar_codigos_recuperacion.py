@@ -0,0 +1,10 @@
+from api.management.base import ComandoPorLotes
+from api.recuperacion import purgar_codigos_vencidos
+
+
+class Command(ComandoPorLotes):
+    help = "Borra por lotes los códigos de recuperación de contraseña que ya vencieron."
+    ayuda_lote = "Códigos por DELETE"
+
+    def ejecutar(self, lote, **options):
+        return f"{purgar_codigos_vencidos(lote=lote)} código(s) vencido(s) borrados"
@@ -0,0 +1,10 @@
+from api.management.base import ComandoPorLotes
+from api.eventos import purgar_eventos_viejos
+
+
+class Command(ComandoPorLotes):
+    help = "Borra por lotes los eventos de estado de pedidos más viejos que EVENTOS_RETENCION_HORAS."
+    ayuda_lote = "Eventos por DELETE"
+
+    def ejecutar(self, lote, **options):
+        return f"{purgar_eventos_viejos(lote=lote)} evento(s) viejo(s) borrados"
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from api.recomendaciones import LOTE_PEDIDOS, TOP_K, recalcular_recomendaciones
+
+
+class Command(BaseCommand):
+    help = "Actualiza las recomendaciones 'comprados juntos' con los pedidos nuevos desde la última corrida."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=TOP_K, help="Recomendaciones por llavero")
+        parser.add_argument('--completo', action='store_true', help="Recalcular desde cero con todo el historial")
+        parser.add_argument('--lote', type=int, default=LOTE_PEDIDOS, help="Pedidos por lote")
+        parser.add_argument('--espera-huecos', type=int, default=600,
+                            help="Segundos tras los que un hueco en los ids de líneas se da por rollback")
+
+    def handle(self, *args, **options):
+        resumen = recalcular_recomendaciones(
+            k=options['top'],
+            completo=options['completo'],
+            lote=options['lote'],
+            espera_huecos_segundos=options['espera_huecos'],
+            progreso=lambda hechos, total: self.stdout.write(f"  {hechos}/{total} pedidos..."),
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Líneas {resumen['lineas_desde']}..{resumen['lineas_hasta']}: {resumen['pedidos']} pedido(s), "
+            f"{resumen['llaveros_actualizados']} llavero(s) actualizados en {resumen['segundos']:.2f}s"
+        ))
@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.inventario import reconciliar_inventario
+
+
+class Command(BaseCommand):
+    help = "Verifica que los snapshots de inventario cuadren con el libro de movimientos."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=5000, help="Tamaño de cada tramo de ids")
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        revisados, diferencias = reconciliar_inventario(lote=options['lote'])
+        segundos = time.perf_counter() - inicio
+
+        for diferencia in diferencias:
+            self.stdout.write(self.style.ERROR(f"  {diferencia}"))
+
+        resumen = f"{revisados} snapshot(s) revisados en {segundos:.2f}s, {len(diferencias)} diferencia(s)"
+        if diferencias:
+            raise CommandError(resumen)
+        self.stdout.write(self.style.SUCCESS(resumen))
@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.resumenes import reconstruir_resumenes
+
+
+class Command(BaseCommand):
+    help = "Recalcula total_pedidos, total_gastado y ultimo_pedido de los clientes desde sus pedidos (por tramos)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=1000, help="Clientes por tramo")
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        revisados, corregidos = reconstruir_resumenes(
+            lote=options['lote'],
+            progreso=lambda n, c: self.stdout.write(f"  {n} clientes revisados ({c} corregidos)..."),
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"{revisados} cliente(s) revisados, {corregidos} corregido(s) en {time.perf_counter() - inicio:.2f}s"
+        ))
@@ -0,0 +1,57 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:14
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_carrito_itemcarrito'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='llavero',
+            name='movimiento_corte',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='material',
+            name='movimiento_corte',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.CreateModel(
+            name='MovimientoInventario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('venta', 'Venta'), ('reposicion', 'Reposición'), ('ajuste', 'Ajuste'), ('consumo_material', 'Consumo de material')], max_length=20)),
+                ('cantidad', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('creado_en', models.DateTimeField(auto_now_add=True)),
+                ('llavero', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='movimientos', to='api.llavero')),
+                ('material', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='movimientos', to='api.material')),
+                ('pedido', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='api.pedido')),
+            ],
+            options={
+                'db_table': 'movimientos_inventario',
+                'indexes': [models.Index(fields=['llavero', 'id'], name='mov_llavero_id_idx'), models.Index(fields=['material', 'id'], name='mov_material_id_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='SnapshotInventario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('movimiento_desde', models.BigIntegerField()),
+                ('movimiento_hasta', models.BigIntegerField()),
+                ('stock_anterior', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('stock', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('creado_en', models.DateTimeField(auto_now_add=True)),
+                ('llavero', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to='api.llavero')),
+                ('material', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to='api.material')),
+            ],
+            options={
+                'db_table': 'snapshots_inventario',
+                'indexes': [models.Index(fields=['llavero', 'id'], name='snap_llavero_id_idx'), models.Index(fields=['material', 'id'], name='snap_material_id_idx')],
+            },
+        ),
+    ]
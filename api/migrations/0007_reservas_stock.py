@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:16
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_libro_inventario'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReservaStock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cantidad', models.PositiveIntegerField()),
+                ('expira_en', models.DateTimeField()),
+                ('carrito', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservas', to='api.carrito')),
+                ('llavero', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservas', to='api.llavero')),
+            ],
+            options={
+                'db_table': 'reservas_stock',
+                'indexes': [models.Index(fields=['llavero', 'expira_en'], name='reserva_llavero_expira_idx'), models.Index(fields=['expira_en'], name='reserva_expira_idx')],
+                'unique_together': {('carrito', 'llavero')},
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_reservas_stock'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VentaDiaria',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('unidades', models.IntegerField(default=0)),
+                ('ingresos', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('categoria', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='api.categoria')),
+                ('llavero', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='api.llavero')),
+            ],
+            options={
+                'db_table': 'ventas_diarias',
+                'indexes': [models.Index(fields=['fecha', 'categoria'], name='venta_fecha_categoria_idx')],
+                'unique_together': {('fecha', 'llavero')},
+            },
+        ),
+    ]
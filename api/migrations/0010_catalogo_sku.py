@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_pedidos_indices_fecha'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='llavero',
+            name='sku',
+            field=models.CharField(blank=True, max_length=50, null=True, unique=True),
+        ),
+        migrations.AddField(
+            model_name='material',
+            name='sku',
+            field=models.CharField(blank=True, max_length=50, null=True, unique=True),
+        ),
+    ]
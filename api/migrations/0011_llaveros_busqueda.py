@@ -0,0 +1,39 @@
+from django.db import migrations
+
+# Índices de texto completo solo donde la base los soporta (ver api/busqueda.py).
+# En otras bases la búsqueda usa el índice en memoria y no hace falta nada.
+
+INDICES = {
+    'mysql': (
+        "CREATE FULLTEXT INDEX llavero_fulltext_idx ON llaveros (nombre, descripcion)",
+        "DROP INDEX llavero_fulltext_idx ON llaveros",
+    ),
+    'postgresql': (
+        "CREATE INDEX llavero_busqueda_idx ON llaveros USING GIN "
+        "(to_tsvector('spanish', coalesce(nombre, '') || ' ' || coalesce(descripcion, '')))",
+        "DROP INDEX llavero_busqueda_idx",
+    ),
+}
+
+
+def crear_indice(apps, schema_editor):
+    sql = INDICES.get(schema_editor.connection.vendor)
+    if sql:
+        schema_editor.execute(sql[0])
+
+
+def borrar_indice(apps, schema_editor):
+    sql = INDICES.get(schema_editor.connection.vendor)
+    if sql:
+        schema_editor.execute(sql[1])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_catalogo_sku'),
+    ]
+
+    operations = [
+        migrations.RunPython(crear_indice, borrar_indice),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_llaveros_busqueda'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='llavero',
+            index=models.Index(fields=['categoria', 'precio'], name='llavero_cat_precio_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='llavero',
+            index=models.Index(fields=['categoria', 'es_personalizable', 'precio'], name='llavero_cat_pers_precio_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='llavero',
+            index=models.Index(fields=['categoria', 'nombre'], name='llavero_cat_nombre_idx'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:33
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_llaveros_indices_catalogo'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EstadoRecomendaciones',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ultimo_detalle', models.BigIntegerField(default=0)),
+                ('matriz', models.BinaryField(null=True)),
+                ('actualizado_en', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'recomendaciones_estado',
+            },
+        ),
+        migrations.CreateModel(
+            name='Recomendacion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('posicion', models.PositiveSmallIntegerField()),
+                ('puntaje', models.FloatField()),
+                ('llavero', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recomendaciones', to='api.llavero')),
+                ('recomendado', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.llavero')),
+            ],
+            options={
+                'db_table': 'recomendaciones',
+                'unique_together': {('llavero', 'posicion')},
+            },
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_clientes_indices_directorio'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='codigorecuperacion',
+            index=models.Index(fields=['user', 'codigo'], name='codigo_user_codigo_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='codigorecuperacion',
+            index=models.Index(fields=['creado_en'], name='codigo_creado_idx'),
+        ),
+    ]
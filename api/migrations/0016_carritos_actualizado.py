@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0015_codigos_recuperacion_vigencia'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='carrito',
+            index=models.Index(fields=['actualizado_en'], name='carrito_actualizado_idx'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:41
+
+import django.core.serializers.json
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0016_carritos_actualizado'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClaveIdempotencia',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ambito', models.CharField(max_length=50)),
+                ('clave', models.CharField(max_length=255)),
+                ('huella', models.CharField(max_length=64)),
+                ('codigo_http', models.PositiveSmallIntegerField()),
+                ('respuesta', models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder, null=True)),
+                ('creado_en', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'claves_idempotencia',
+                'indexes': [models.Index(fields=['creado_en'], name='idempotencia_creado_idx')],
+                'unique_together': {('ambito', 'clave')},
+            },
+        ),
+    ]
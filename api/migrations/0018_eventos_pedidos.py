@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:43
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0017_claves_idempotencia'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventoPedido',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('estado_anterior', models.CharField(max_length=20)),
+                ('estado', models.CharField(max_length=20)),
+                ('creado_en', models.DateTimeField(auto_now_add=True)),
+                ('cliente', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('pedido', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='eventos', to='api.pedido')),
+            ],
+            options={
+                'db_table': 'eventos_pedidos',
+                'indexes': [models.Index(fields=['cliente', 'id'], name='evento_cliente_id_idx'), models.Index(fields=['creado_en'], name='evento_creado_idx')],
+            },
+        ),
+    ]
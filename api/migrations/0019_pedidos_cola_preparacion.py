@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:04
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0018_eventos_pedidos'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pedido',
+            name='tomado_hasta',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='pedido',
+            name='tomado_por',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='pedidos_tomados', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(fields=['estado', 'tomado_hasta'], name='pedido_estado_tomado_idx'),
+        ),
+    ]
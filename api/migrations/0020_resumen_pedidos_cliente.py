@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0019_pedidos_cola_preparacion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cliente',
+            name='total_gastado',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='cliente',
+            name='total_pedidos',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='cliente',
+            name='ultimo_pedido',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,37 @@
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import migrations, models
+
+
+def respuesta_a_cuerpo(apps, schema_editor):
+    ClaveIdempotencia = apps.get_model('api', 'ClaveIdempotencia')
+    for clave in ClaveIdempotencia.objects.exclude(respuesta=None).iterator():
+        clave.cuerpo = json.dumps(clave.respuesta, cls=DjangoJSONEncoder).encode()
+        clave.tipo_contenido = 'application/json'
+        clave.save(update_fields=['cuerpo', 'tipo_contenido'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0020_resumen_pedidos_cliente'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='claveidempotencia',
+            name='cuerpo',
+            field=models.BinaryField(null=True),
+        ),
+        migrations.AddField(
+            model_name='claveidempotencia',
+            name='tipo_contenido',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.RunPython(respuesta_a_cuerpo, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='claveidempotencia',
+            name='respuesta',
+        ),
+    ]
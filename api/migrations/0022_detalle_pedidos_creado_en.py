@@ -0,0 +1,29 @@
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def fecha_del_pedido(apps, schema_editor):
+    # Las líneas existentes ya están confirmadas: basta una fecha vieja, la de su pedido
+    DetallePedido = apps.get_model('api', 'DetallePedido')
+    Pedido = apps.get_model('api', 'Pedido')
+    DetallePedido.objects.update(
+        creado_en=Subquery(Pedido.objects.filter(pk=OuterRef('pedido_id')).values('fecha_pedido')[:1])
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0021_claves_idempotencia_cuerpo'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='detallepedido',
+            name='creado_en',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fecha_del_pedido, migrations.RunPython.noop),
+    ]
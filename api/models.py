@@ -1,3 +1,5 @@
+from decimal import Decimal
+
 from django.db import models
 from django.contrib.auth.models import AbstractUser
 
@@ -14,11 +16,32 @@ class Categoria(models.Model):
     def __str__(self):
         return self.nombre
 
-class Material(models.Model):
+# El stock de llaveros y materiales se lleva en un libro de movimientos
+# (MovimientoInventario). stock_actual es el valor de la última foto
+# (SnapshotInventario) y movimiento_corte el último movimiento incluido en ella:
+# stock vigente = stock_actual + movimientos con id > movimiento_corte.
+# Después de creada la fila, esos dos campos solo los toca api.inventario.
+CAMPOS_LIBRO_INVENTARIO = ('stock_actual', 'movimiento_corte')
+
+
+class StockEnLibroMixin:
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                campo.name for campo in self._meta.concrete_fields
+                if not campo.primary_key and campo.name not in CAMPOS_LIBRO_INVENTARIO
+            ]
+        super().save(*args, **kwargs)
+
+
+class Material(StockEnLibroMixin, models.Model):
     nombre = models.CharField(max_length=50)
     descripcion = models.TextField(blank=True)
+    # Código para importaciones masivas del catálogo (clave del upsert)
+    sku = models.CharField(max_length=50, unique=True, null=True, blank=True)
     stock_actual = models.DecimalField(max_digits=10, decimal_places=2)
     unidad_medida = models.CharField(max_length=50)
+    movimiento_corte = models.BigIntegerField(default=0, editable=False)
 
     class Meta:
         db_table = 'materiales'
@@ -26,17 +49,25 @@ class Material(models.Model):
     def __str__(self):
         return self.nombre
 
-class Llavero(models.Model):
+class Llavero(StockEnLibroMixin, models.Model):
     categoria = models.ForeignKey(Categoria, on_delete=models.SET_NULL, null=True)
     nombre = models.CharField(max_length=50)
+    sku = models.CharField(max_length=50, unique=True, null=True, blank=True)
     descripcion = models.TextField(blank=True)
     precio = models.DecimalField(max_digits=10, decimal_places=2)
     stock_actual = models.IntegerField()
     es_personalizable = models.BooleanField(default=False)
     imagen_url = models.URLField(max_length=500, blank=True, null=True)
+    movimiento_corte = models.BigIntegerField(default=0, editable=False)
 
     class Meta:
         db_table = 'llaveros'
+        indexes = [
+            # Filtros y órdenes del listado por categoría (api/catalogo.py)
+            models.Index(fields=['categoria', 'precio'], name='llavero_cat_precio_idx'),
+            models.Index(fields=['categoria', 'es_personalizable', 'precio'], name='llavero_cat_pers_precio_idx'),
+            models.Index(fields=['categoria', 'nombre'], name='llavero_cat_nombre_idx'),
+        ]
 
     def __str__(self):
         return self.nombre
@@ -55,6 +86,11 @@ class Cliente(AbstractUser):
     direccion = models.TextField(blank=True, null=True)
     fecha_registro = models.DateTimeField(auto_now_add=True)
 
+    # Resumen de pedidos, mantenido al vuelo (api/resumenes.py); no cuenta los cancelados
+    total_pedidos = models.PositiveIntegerField(default=0)
+    total_gastado = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    ultimo_pedido = models.DateTimeField(null=True, blank=True)
+
     # Solución de conflicto con auth.User nativo de Django
     groups = models.ManyToManyField(
         'auth.Group',
@@ -73,6 +109,11 @@ class Cliente(AbstractUser):
 
     class Meta:
         db_table = 'clientes'
+        indexes = [
+            # Búsqueda por prefijo en el directorio de clientes (username ya es único)
+            models.Index(fields=['email'], name='cliente_email_idx'),
+            models.Index(fields=['telefono'], name='cliente_telefono_idx'),
+        ]
 
     def __str__(self):
         return f"{self.first_name} {self.last_name} ({self.username})"
@@ -89,9 +130,22 @@ class Pedido(models.Model):
     fecha_pedido = models.DateTimeField(auto_now_add=True)
     estado = models.CharField(max_length=20, choices=ESTADOS, default='Pendiente')
     total = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
+    # Cola de preparación (api/pedidos.py): quién lo tomó y hasta cuándo vale la toma
+    tomado_por = models.ForeignKey(
+        Cliente, on_delete=models.SET_NULL, null=True, blank=True, related_name='pedidos_tomados'
+    )
+    tomado_hasta = models.DateTimeField(null=True, blank=True)
 
     class Meta:
         db_table = 'pedidos'
+        indexes = [
+            # Filtros por rango de fechas / estado (exportación, reportes, admin)
+            # y la cola de preparación: WHERE estado = 'Pendiente' ORDER BY fecha_pedido
+            models.Index(fields=['fecha_pedido'], name='pedido_fecha_idx'),
+            models.Index(fields=['estado', 'fecha_pedido'], name='pedido_estado_fecha_idx'),
+            # Tomas vencidas: WHERE estado = 'En proceso' AND tomado_hasta < ahora
+            models.Index(fields=['estado', 'tomado_hasta'], name='pedido_estado_tomado_idx'),
+        ]
 
     def __str__(self):
         return f"Pedido #{self.id} - {self.cliente}"
@@ -107,14 +161,22 @@ class DetallePedido(models.Model):
     subtotal = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
     
     personalizacion = models.TextField(blank=True, null=True)
+    # Para saltar huecos de ids en las corridas incrementales (lotes.marca_de_agua)
+    creado_en = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         db_table = 'detalle_pedidos'
 
+    def calcular_subtotal(self):
+        # En Decimal: con float 0.1 * 3 ya no da 0.30. Quien use bulk_create debe llamarlo antes
+        # Contra None: un precio editado a 0 también recalcula (deja el subtotal en 0)
+        if self.precio_unitario is not None and self.cantidad is not None:
+            self.subtotal = Decimal(str(self.precio_unitario)) * int(self.cantidad)
+        return self.subtotal
+
     def save(self, *args, **kwargs):
         # CAMBIO IMPORTANTE: Cálculo automático del subtotal antes de guardar
-        if self.precio_unitario and self.cantidad:
-            self.subtotal = float(self.precio_unitario) * int(self.cantidad)
+        self.calcular_subtotal()
         super().save(*args, **kwargs)
 
     def __str__(self):
@@ -131,6 +193,11 @@ class CodigoRecuperacion(models.Model):
 
     class Meta:
         db_table = 'codigos_recuperacion'
+        indexes = [
+            models.Index(fields=['user', 'codigo'], name='codigo_user_codigo_idx'),
+            # Para purgar los vencidos sin recorrer la tabla
+            models.Index(fields=['creado_en'], name='codigo_creado_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.email} - {self.codigo}"
@@ -139,6 +206,12 @@ class Carrito(models.Model):
     creado_en = models.DateTimeField(auto_now_add=True)
     actualizado_en = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # Barrido de carritos abandonados
+            models.Index(fields=['actualizado_en'], name='carrito_actualizado_idx'),
+        ]
+
     def __str__(self):
         return f"Carrito de {self.cliente.nombre}"
 
@@ -158,4 +231,172 @@ class ItemCarrito(models.Model):
         return self.llavero.precio * self.cantidad
 
     def __str__(self):
-        return f"{self.cantidad} x {self.llavero.nombre}"
\ No newline at end of file
+        return f"{self.cantidad} x {self.llavero.nombre}"
+
+# ==========================================
+# 📒 LIBRO DE INVENTARIO
+# ==========================================
+class MovimientoInventario(models.Model):
+    TIPOS = [
+        ('venta', 'Venta'),
+        ('reposicion', 'Reposición'),
+        ('ajuste', 'Ajuste'),
+        ('consumo_material', 'Consumo de material'),
+    ]
+    tipo = models.CharField(max_length=20, choices=TIPOS)
+    llavero = models.ForeignKey(Llavero, on_delete=models.CASCADE, null=True, blank=True, related_name='movimientos')
+    material = models.ForeignKey(Material, on_delete=models.CASCADE, null=True, blank=True, related_name='movimientos')
+    # Positivo suma stock, negativo resta
+    cantidad = models.DecimalField(max_digits=12, decimal_places=2)
+    pedido = models.ForeignKey(Pedido, on_delete=models.SET_NULL, null=True, blank=True)
+    creado_en = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'movimientos_inventario'
+        indexes = [
+            models.Index(fields=['llavero', 'id'], name='mov_llavero_id_idx'),
+            models.Index(fields=['material', 'id'], name='mov_material_id_idx'),
+        ]
+
+    def __str__(self):
+        item = self.llavero or self.material
+        return f"{self.get_tipo_display()} {self.cantidad:+} {item}"
+
+class SnapshotInventario(models.Model):
+    """Foto periódica: stock = stock_anterior + movimientos en (movimiento_desde, movimiento_hasta]."""
+    llavero = models.ForeignKey(Llavero, on_delete=models.CASCADE, null=True, blank=True, related_name='snapshots')
+    material = models.ForeignKey(Material, on_delete=models.CASCADE, null=True, blank=True, related_name='snapshots')
+    movimiento_desde = models.BigIntegerField()
+    movimiento_hasta = models.BigIntegerField()
+    stock_anterior = models.DecimalField(max_digits=12, decimal_places=2)
+    stock = models.DecimalField(max_digits=12, decimal_places=2)
+    creado_en = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'snapshots_inventario'
+        indexes = [
+            models.Index(fields=['llavero', 'id'], name='snap_llavero_id_idx'),
+            models.Index(fields=['material', 'id'], name='snap_material_id_idx'),
+        ]
+
+# ==========================================
+# ⏳ RESERVAS DE STOCK DEL CARRITO
+# ==========================================
+class ReservaStock(models.Model):
+    """Stock apartado por un carrito hasta expira_en (lo renueva cada agregado)."""
+    carrito = models.ForeignKey(Carrito, on_delete=models.CASCADE, related_name='reservas')
+    llavero = models.ForeignKey(Llavero, on_delete=models.CASCADE, related_name='reservas')
+    cantidad = models.PositiveIntegerField()
+    expira_en = models.DateTimeField()
+
+    class Meta:
+        db_table = 'reservas_stock'
+        unique_together = ('carrito', 'llavero')
+        indexes = [
+            # Suma de reservas activas por llavero sin tocar filas vencidas
+            models.Index(fields=['llavero', 'expira_en'], name='reserva_llavero_expira_idx'),
+            # Barrido de vencidas
+            models.Index(fields=['expira_en'], name='reserva_expira_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.cantidad} x {self.llavero_id} (carrito {self.carrito_id}) hasta {self.expira_en}"
+
+# ==========================================
+# 📊 ROLLUPS DE VENTAS (REPORTES)
+# ==========================================
+class VentaDiaria(models.Model):
+    """Ventas acumuladas por día y llavero (pedidos no cancelados), mantenidas al vuelo."""
+    fecha = models.DateField()
+    llavero = models.ForeignKey(Llavero, on_delete=models.SET_NULL, null=True, blank=True)
+    # Categoría del llavero al momento de la venta
+    categoria = models.ForeignKey(Categoria, on_delete=models.SET_NULL, null=True, blank=True)
+    unidades = models.IntegerField(default=0)
+    ingresos = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        db_table = 'ventas_diarias'
+        unique_together = ('fecha', 'llavero')
+        indexes = [
+            models.Index(fields=['fecha', 'categoria'], name='venta_fecha_categoria_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.fecha} - {self.llavero_id}: {self.unidades} u / {self.ingresos}"
+
+# ==========================================
+# 🤝 "FRECUENTEMENTE COMPRADOS JUNTOS"
+# ==========================================
+class Recomendacion(models.Model):
+    """Top-K vecinos de un llavero por co-compra, precalculados (api/recomendaciones.py)."""
+    llavero = models.ForeignKey(Llavero, on_delete=models.CASCADE, related_name='recomendaciones')
+    recomendado = models.ForeignKey(Llavero, on_delete=models.CASCADE, related_name='+')
+    posicion = models.PositiveSmallIntegerField()
+    puntaje = models.FloatField()
+
+    class Meta:
+        db_table = 'recomendaciones'
+        # También es el índice de la lectura: WHERE llavero_id = ? ORDER BY posicion
+        unique_together = ('llavero', 'posicion')
+
+    def __str__(self):
+        return f"{self.llavero_id} -> {self.recomendado_id} ({self.puntaje:.3f})"
+
+
+class EstadoRecomendaciones(models.Model):
+    """Fila única con la matriz de co-compras acumulada y hasta qué línea de pedido incluye."""
+    ultimo_detalle = models.BigIntegerField(default=0)
+    matriz = models.BinaryField(null=True)
+    actualizado_en = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'recomendaciones_estado'
+
+# ==========================================
+# 🔁 CLAVES DE IDEMPOTENCIA
+# ==========================================
+class ClaveIdempotencia(models.Model):
+    """Respuesta guardada de un POST con Idempotency-Key (api/idempotencia.py)."""
+    # Vista y, con sesión, el usuario dueño de la clave: 'pedidos:42'
+    ambito = models.CharField(max_length=50)
+    clave = models.CharField(max_length=255)
+    # Hash del cuerpo: la misma clave con otro cuerpo es un error del cliente
+    huella = models.CharField(max_length=64)
+    codigo_http = models.PositiveSmallIntegerField()
+    # La respuesta tal como salió (bytes y Content-Type): el reintento recibe lo mismo
+    cuerpo = models.BinaryField(null=True)
+    tipo_contenido = models.CharField(max_length=255, blank=True, default='')
+    creado_en = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'claves_idempotencia'
+        unique_together = ('ambito', 'clave')
+        indexes = [
+            # Barrido de vencidas
+            models.Index(fields=['creado_en'], name='idempotencia_creado_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.ambito}:{self.clave} -> {self.codigo_http}"
+
+# ==========================================
+# 📡 EVENTOS DE ESTADO DE PEDIDOS
+# ==========================================
+class EventoPedido(models.Model):
+    """Cambio de estado de un pedido; su id es el cursor del stream (Last-Event-ID)."""
+    cliente = models.ForeignKey(Cliente, on_delete=models.CASCADE, related_name='+')
+    pedido = models.ForeignKey(Pedido, on_delete=models.CASCADE, related_name='eventos')
+    estado_anterior = models.CharField(max_length=20)
+    estado = models.CharField(max_length=20)
+    creado_en = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'eventos_pedidos'
+        indexes = [
+            # Eventos de un cliente después del cursor: WHERE cliente_id = ? AND id > ?
+            models.Index(fields=['cliente', 'id'], name='evento_cliente_id_idx'),
+            models.Index(fields=['creado_en'], name='evento_creado_idx'),
+        ]
+
+    def __str__(self):
+        return f"Pedido {self.pedido_id}: {self.estado_anterior} -> {self.estado}"
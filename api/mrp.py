@@ -0,0 +1,118 @@
+import numpy as np
+from scipy import sparse
+from django.db.models import Sum
+
+from .models import Llavero, Material, LlaveroMaterial, DetallePedido
+from .inventario import con_stock_vigente
+
+# ==========================================
+# 🏭 MRP: PLANIFICACIÓN DE MATERIALES
+# ==========================================
+# La lista de materiales (LlaveroMaterial) se carga como una matriz dispersa
+# B de llaveros x materiales. Con eso todo se resuelve con operaciones
+# vectorizadas de NumPy/SciPy, sin loops por llavero ni por material:
+#   - máximo producible del llavero i = min_j floor(stock_j / B_ij)
+#   - demanda de materiales         = Bᵀ · unidades pendientes por llavero
+#   - faltantes                      = max(demanda - stock, 0)
+
+ESTADOS_PENDIENTES = ('Pendiente', 'En proceso')
+
+
+class MatrizBOM:
+    def __init__(self, llavero_ids, llavero_nombres, material_ids, material_nombres, stock, matriz):
+        self.llavero_ids = llavero_ids
+        self.llavero_nombres = llavero_nombres
+        self.material_ids = material_ids
+        self.material_nombres = material_nombres
+        self.stock = stock
+        self.matriz = matriz
+
+
+def cargar_bom():
+    llaveros = list(Llavero.objects.order_by('id').values_list('id', 'nombre'))
+    materiales = list(con_stock_vigente(Material.objects.order_by('id')).values_list('id', 'nombre', 'stock_vigente'))
+
+    llavero_ids = np.array([fila[0] for fila in llaveros], dtype=np.int64)
+    material_ids = np.array([fila[0] for fila in materiales], dtype=np.int64)
+    stock = np.array([float(fila[2]) for fila in materiales], dtype=np.float64)
+
+    relaciones = LlaveroMaterial.objects.filter(cantidad_requerida__gt=0).values_list(
+        'llavero_id', 'material_id', 'cantidad_requerida'
+    )
+    bom = np.array([(l, m, float(c)) for l, m, c in relaciones.iterator(chunk_size=5000)],
+                   dtype=np.float64).reshape(-1, 3)
+
+    filas = np.searchsorted(llavero_ids, bom[:, 0].astype(np.int64))
+    columnas = np.searchsorted(material_ids, bom[:, 1].astype(np.int64))
+    matriz = sparse.csr_matrix(
+        (bom[:, 2], (filas, columnas)), shape=(len(llavero_ids), len(material_ids))
+    )
+
+    return MatrizBOM(
+        llavero_ids, [fila[1] for fila in llaveros],
+        material_ids, [fila[1] for fila in materiales],
+        stock, matriz,
+    )
+
+
+def maximo_producible(bom):
+    """Unidades que se pueden fabricar de cada llavero con el stock actual (-1 = sin BOM)."""
+    matriz = bom.matriz
+    maximos = np.full(matriz.shape[0], -1, dtype=np.int64)
+    con_bom = np.diff(matriz.indptr) > 0
+    if not con_bom.any():
+        return maximos
+
+    # stock del material / cantidad requerida, para cada celda no nula de la matriz
+    ratios = np.maximum(bom.stock[matriz.indices], 0) / matriz.data
+    # reduceat toma el mínimo de cada fila (las filas vacías no tienen celdas)
+    minimos = np.minimum.reduceat(ratios, matriz.indptr[:-1][con_bom])
+    maximos[con_bom] = np.floor(minimos + 1e-9).astype(np.int64)
+    return maximos
+
+
+def unidades_pendientes(bom):
+    """Vector de unidades pedidas y aún no completadas, alineado con bom.llavero_ids."""
+    pendientes = (
+        DetallePedido.objects
+        .filter(pedido__estado__in=ESTADOS_PENDIENTES, llavero__isnull=False)
+        .values_list('llavero_id')
+        .annotate(unidades=Sum('cantidad'))
+        .order_by()
+    )
+    unidades = np.zeros(len(bom.llavero_ids), dtype=np.float64)
+    datos = np.array(list(pendientes), dtype=np.int64).reshape(-1, 2)
+    if len(datos):
+        posiciones = np.searchsorted(bom.llavero_ids, datos[:, 0])
+        unidades[posiciones] = datos[:, 1]
+    return unidades
+
+
+def calcular_mrp(solo_faltantes=False):
+    bom = cargar_bom()
+    maximos = maximo_producible(bom)
+    demanda = bom.matriz.T @ unidades_pendientes(bom)
+    faltantes = np.maximum(demanda - bom.stock, 0)
+
+    producibles = [
+        {
+            "llavero_id": int(llavero_id),
+            "nombre": nombre,
+            "maximo_producible": int(maximo) if maximo >= 0 else None,
+        }
+        for llavero_id, nombre, maximo in zip(bom.llavero_ids, bom.llavero_nombres, maximos)
+    ]
+
+    indices = np.flatnonzero(faltantes > 0) if solo_faltantes else range(len(bom.material_ids))
+    materiales = [
+        {
+            "material_id": int(bom.material_ids[i]),
+            "nombre": bom.material_nombres[i],
+            "stock_actual": round(float(bom.stock[i]), 2),
+            "demanda_pendiente": round(float(demanda[i]), 2),
+            "faltante": round(float(faltantes[i]), 2),
+        }
+        for i in indices
+    ]
+
+    return {"llaveros": producibles, "materiales": materiales}
@@ -0,0 +1,231 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import DecimalField, F, Q, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Pedido, DetallePedido, MovimientoInventario
+from .eventos import registrar_eventos
+from .inventario import registrar_movimientos
+from .lotes import por_lotes
+from .reportes import registrar_cancelaciones
+from .resumenes import resumen_total_cambiado, resumen_transiciones
+
+# ==========================================
+# 📦 CAMBIOS DE ESTADO DE PEDIDOS
+# ==========================================
+# Toda transición de estado (API, admin, acciones masivas) pasa por aquí para
+# que los efectos secundarios (p. ej. descontar materiales) se apliquen una
+# sola vez y en la misma transacción.
+
+ESTADO_COMPLETADO = 'Completado'
+
+
+def cambiar_estado_pedidos(pedidos, nuevo_estado):
+    """
+    Cambia de estado muchos pedidos con un solo UPDATE.
+    `pedidos` puede ser un queryset o una lista de ids. Devuelve cuántos cambiaron.
+    """
+    if hasattr(pedidos, 'values'):
+        pedidos = pedidos.values('pk')
+
+    with transaction.atomic():
+        filas = list(
+            Pedido.objects.select_for_update()
+            .filter(pk__in=pedidos)
+            .exclude(estado=nuevo_estado)
+            .values_list('id', 'estado')
+        )
+        if not filas:
+            return 0
+        Pedido.objects.filter(pk__in=[pedido_id for pedido_id, _ in filas]).update(estado=nuevo_estado)
+        registrar_transiciones(filas, nuevo_estado)
+    return len(filas)
+
+
+def registrar_transiciones(filas, nuevo_estado):
+    """
+    Efectos de un cambio de estado ya guardado.
+    filas = [(pedido_id, estado_anterior), ...]; debe llamarse dentro de la transacción.
+    """
+    if nuevo_estado == ESTADO_COMPLETADO:
+        consumir_materiales([pedido_id for pedido_id, anterior in filas if anterior != ESTADO_COMPLETADO])
+    registrar_cancelaciones(filas, nuevo_estado)
+    registrar_eventos(filas, nuevo_estado)
+    resumen_transiciones(filas, nuevo_estado)
+
+
+def consumir_materiales(pedido_ids):
+    """
+    Descuenta los materiales que usan los detalles de los pedidos: una consulta
+    suma el consumo por (pedido, material) y un solo INSERT lo agrega al libro
+    de inventario como movimientos 'consumo_material'. Un pedido consume una
+    sola vez: si ya tiene consumo (Completado -> Pendiente -> Completado) se
+    salta. Los pedidos llegan bloqueados por quien cambia el estado.
+    """
+    ya_consumidos = set(
+        MovimientoInventario.objects.filter(tipo='consumo_material', pedido_id__in=pedido_ids)
+        .values_list('pedido_id', flat=True).distinct()
+    )
+    pedido_ids = [pedido_id for pedido_id in pedido_ids if pedido_id not in ya_consumidos]
+    if not pedido_ids:
+        return []
+
+    consumos = (
+        DetallePedido.objects
+        .filter(pedido_id__in=pedido_ids, llavero__llaveromaterial__isnull=False)
+        .values_list('pedido_id', 'llavero__llaveromaterial__material_id')
+        .annotate(total=Sum(
+            F('cantidad') * F('llavero__llaveromaterial__cantidad_requerida'),
+            output_field=DecimalField(max_digits=14, decimal_places=2),
+        ))
+        .order_by()
+    )
+    movimientos = registrar_movimientos([
+        MovimientoInventario(tipo='consumo_material', pedido_id=pedido_id, material_id=material_id, cantidad=-total)
+        for pedido_id, material_id, total in consumos
+    ])
+
+    print(f"🧵 Materiales consumidos por {len(pedido_ids)} pedido(s): {len(movimientos)} movimiento(s)")
+    return movimientos
+
+
+# ==========================================
+# 🧑‍🏭 COLA DE PREPARACIÓN
+# ==========================================
+# Varios empleados toman a la vez los siguientes pedidos pendientes (los más
+# viejos primero). SELECT ... FOR UPDATE SKIP LOCKED sobre el índice
+# (estado, fecha_pedido): cada uno bloquea solo las filas que se lleva y salta
+# las que otro está tomando, así nadie espera ni se lleva el mismo pedido.
+# Tomar = pasar a 'En proceso' con dueño y vencimiento; si la toma vence sin
+# que el pedido avance, vuelve a 'Pendiente'.
+
+ESTADO_PENDIENTE = 'Pendiente'
+ESTADO_EN_PROCESO = 'En proceso'
+
+
+def tomar_pedidos(usuario, cantidad=1, minutos=None, pedidos=None):
+    """
+    Toma hasta `cantidad` pedidos pendientes (de `pedidos` si se indica, si no
+    de toda la cola) y devuelve sus ids, en orden de llegada.
+    """
+    minutos = settings.COLA_TOMA_MINUTOS if minutos is None else minutos
+    candidatos = Pedido.objects.all() if pedidos is None else pedidos
+    with transaction.atomic():
+        ids = list(
+            candidatos.select_for_update(skip_locked=True)
+            .filter(estado=ESTADO_PENDIENTE)
+            .order_by('fecha_pedido', 'id')
+            .values_list('id', flat=True)[:cantidad]
+        )
+        if not ids:
+            return []
+        Pedido.objects.filter(pk__in=ids).update(
+            estado=ESTADO_EN_PROCESO,
+            tomado_por=usuario,
+            tomado_hasta=timezone.now() + timedelta(minutes=minutos),
+        )
+        registrar_transiciones([(pedido_id, ESTADO_PENDIENTE) for pedido_id in ids], ESTADO_EN_PROCESO)
+    return ids
+
+
+def renovar_toma(usuario, pedido_ids, minutos=None):
+    """Extiende las tomas vigentes del usuario sobre esos pedidos. Devuelve cuántas renovó."""
+    minutos = settings.COLA_TOMA_MINUTOS if minutos is None else minutos
+    return Pedido.objects.filter(
+        pk__in=pedido_ids, tomado_por=usuario, estado=ESTADO_EN_PROCESO, tomado_hasta__isnull=False
+    ).update(tomado_hasta=timezone.now() + timedelta(minutes=minutos))
+
+
+def soltar_pedidos(pedidos):
+    """Devuelve a 'Pendiente' los pedidos tomados (queryset) que sigan 'En proceso'. Devuelve los ids."""
+    with transaction.atomic():
+        ids = list(
+            pedidos.select_for_update(skip_locked=True)
+            .filter(estado=ESTADO_EN_PROCESO, tomado_hasta__isnull=False)
+            .values_list('id', flat=True)
+        )
+        if ids:
+            Pedido.objects.filter(pk__in=ids).update(
+                estado=ESTADO_PENDIENTE, tomado_por=None, tomado_hasta=None
+            )
+            registrar_transiciones([(pedido_id, ESTADO_EN_PROCESO) for pedido_id in ids], ESTADO_PENDIENTE)
+    return ids
+
+
+def liberar_tomas_vencidas(lote=500):
+    """Suelta por lotes las tomas vencidas. Devuelve cuántos pedidos volvieron a la cola."""
+    vencidos = Pedido.objects.filter(estado=ESTADO_EN_PROCESO, tomado_hasta__lt=timezone.now())
+    return por_lotes(vencidos, lote, lambda ids: len(soltar_pedidos(Pedido.objects.filter(pk__in=ids))))
+
+
+# ------------------------------------------
+# Total del pedido
+# ------------------------------------------
+# Pedido.total es la suma de los subtotales de sus líneas. Cada alta, cambio o
+# baja de una línea lo ajusta con un UPDATE total = total + diferencia (la fila
+# queda bloqueada hasta el commit, así dos líneas simultáneas no se pisan) y
+# leer un pedido nunca tiene que sumar sus detalles. auditar_totales_pedidos
+# revisa y corrige desvíos.
+
+def sumar_al_total(pedido_id, diferencia):
+    """Suma `diferencia` al total del pedido y al gasto de su cliente; dentro de la transacción de la línea."""
+    if not diferencia:
+        return
+    Pedido.objects.filter(pk=pedido_id).update(total=F('total') + diferencia)
+    # Ya bloqueada por el UPDATE: el estado no cambia entre medio
+    cliente_id, estado = Pedido.objects.values_list('cliente_id', 'estado').get(pk=pedido_id)
+    resumen_total_cambiado(cliente_id, estado, diferencia)
+
+
+def linea_cambiada(antes, detalle):
+    """antes = (pedido_id, subtotal) leídos antes de guardar la línea, o None si es nueva."""
+    if antes is None:
+        sumar_al_total(detalle.pedido_id, detalle.subtotal)
+        return
+    pedido_anterior, subtotal_anterior = antes
+    if pedido_anterior != detalle.pedido_id:
+        sumar_al_total(pedido_anterior, -subtotal_anterior)
+        sumar_al_total(detalle.pedido_id, detalle.subtotal)
+    else:
+        sumar_al_total(detalle.pedido_id, detalle.subtotal - subtotal_anterior)
+
+
+def auditar_totales(lote=5000, corregir=False, progreso=None):
+    """
+    Compara Pedido.total con la suma de sus líneas por tramos de ids. Con
+    corregir=True ajusta cada desvío por la misma vía incremental (también el
+    gasto del cliente). Devuelve (revisados, desvios) con desvios = [(id, guardado, calculado)].
+    """
+    revisados = 0
+    desvios = []
+    ultimo = 0
+    suma = Coalesce(Sum('detalles__subtotal'), Value(Decimal('0')), output_field=DecimalField(max_digits=12, decimal_places=2))
+    while True:
+        with transaction.atomic():
+            pedidos = Pedido.objects.filter(pk__gt=ultimo).order_by('pk')
+            ids = list(pedidos.values_list('pk', flat=True)[:lote])
+            if not ids:
+                break
+            tramo = Pedido.objects.filter(pk__in=ids)
+            if corregir:
+                # Bloquea el tramo: una línea nueva espera a que se corrija su pedido
+                list(tramo.select_for_update().values_list('pk', flat=True))
+            filas = (
+                tramo.annotate(calculado=suma)
+                .filter(~Q(total=F('calculado')))
+                .values_list('pk', 'total', 'calculado')
+                .order_by('pk')
+            )
+            for pedido_id, guardado, calculado in filas:
+                desvios.append((pedido_id, guardado, calculado))
+                if corregir:
+                    sumar_al_total(pedido_id, calculado - guardado)
+        revisados += len(ids)
+        ultimo = ids[-1]
+        if progreso:
+            progreso(revisados, len(desvios))
+    return revisados, desvios
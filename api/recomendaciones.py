@@ -0,0 +1,174 @@
+import io
+import time
+
+import numpy as np
+from scipy import sparse
+from django.db import transaction
+
+from .lotes import marca_de_agua
+from .models import DetallePedido, EstadoRecomendaciones, Llavero, Recomendacion
+
+# ==========================================
+# 🤝 RECOMENDACIONES POR CO-COMPRA
+# ==========================================
+# B = matriz dispersa pedidos x llaveros (1 si el pedido lo incluye).
+# C = Bᵀ·B es la matriz llavero x llavero de co-compras; su diagonal es en
+# cuántos pedidos aparece cada llavero. El puntaje de j para i es el coseno
+# C_ij / sqrt(C_ii · C_jj), así los llaveros muy vendidos no salen en todas partes.
+#
+# Incremental: C se guarda en EstadoRecomendaciones junto con la última línea
+# de pedido incluida. En cada corrida se toman los pedidos con líneas nuevas y
+# se suma C(canasta completa) - C(parte ya contada). Solo se recalcula el
+# top-K de los llaveros cuyos puntajes cambiaron. La corrida llega solo hasta
+# lotes.marca_de_agua: una línea con id asignado pero sin commit todavía no
+# queda por debajo del corte (la siguiente corrida la toma). Los pedidos
+# cancelados no cuentan, pero uno cancelado después de contado queda hasta el
+# próximo recálculo --completo.
+
+TOP_K = 10
+LOTE_PEDIDOS = 20000
+LOTE_LLAVEROS = 2000
+
+
+def _cargar_matriz(datos):
+    return sparse.load_npz(io.BytesIO(bytes(datos))).tocsr()
+
+
+def _guardar_matriz(matriz):
+    buffer = io.BytesIO()
+    sparse.save_npz(buffer, matriz, compressed=True)
+    return buffer.getvalue()
+
+
+def _redimensionar(matriz, n):
+    if matriz.shape[0] < n:
+        matriz = matriz.tolil()
+        matriz.resize((n, n))
+        matriz = matriz.tocsr()
+    return matriz
+
+
+def coocurrencias(lineas, n):
+    """lineas: array (pedido_id, llavero_id). Devuelve Bᵀ·B de n x n."""
+    if not len(lineas):
+        return sparse.csr_matrix((n, n), dtype=np.float64)
+    _, filas = np.unique(lineas[:, 0], return_inverse=True)
+    incidencia = sparse.csr_matrix(
+        (np.ones(len(lineas)), (filas, lineas[:, 1])), shape=(filas.max() + 1, n)
+    )
+    incidencia.data[:] = 1  # un llavero repetido en el mismo pedido cuenta una vez
+    return (incidencia.T @ incidencia).tocsr()
+
+
+def _lineas(pedido_ids, hasta):
+    """(pedido_id, llavero_id, detalle_id) de esos pedidos, sin cancelados."""
+    filas = (
+        DetallePedido.objects
+        .filter(pedido_id__in=pedido_ids, id__lte=hasta, llavero__isnull=False)
+        .exclude(pedido__estado='Cancelado')
+        .values_list('pedido_id', 'llavero_id', 'id')
+    )
+    return np.array(list(filas.iterator(chunk_size=10000)), dtype=np.int64).reshape(-1, 3)
+
+
+def top_k(matriz, filas, existentes, k):
+    """
+    Para las filas dadas devuelve arrays (llavero, recomendado, posicion, puntaje),
+    todo vectorizado: puntaje coseno, se descarta la diagonal y llaveros borrados,
+    y se toman los k mejores de cada fila con un lexsort.
+    """
+    sub = matriz[filas].tocoo()
+    origen = filas[sub.row]
+    destino = sub.col
+    diagonal = matriz.diagonal()
+    puntaje = sub.data / np.sqrt(diagonal[origen] * diagonal[destino])
+
+    validos = (origen != destino) & (sub.data > 0) & np.isin(destino, existentes)
+    origen, destino, puntaje = origen[validos], destino[validos], puntaje[validos]
+
+    orden = np.lexsort((destino, -puntaje, origen))
+    origen, destino, puntaje = origen[orden], destino[orden], puntaje[orden]
+    # Posición dentro de cada fila = índice - índice donde empieza su grupo
+    inicio_grupo = np.r_[0, np.flatnonzero(np.diff(origen)) + 1]
+    largo_grupo = np.diff(np.r_[inicio_grupo, len(origen)])
+    posicion = np.arange(len(origen)) - np.repeat(inicio_grupo, largo_grupo)
+    quedan = posicion < k
+    return origen[quedan], destino[quedan], posicion[quedan], puntaje[quedan]
+
+
+def recalcular_recomendaciones(k=TOP_K, completo=False, lote=LOTE_PEDIDOS, progreso=None,
+                               espera_huecos_segundos=600):
+    """Procesa las líneas nuevas desde la última corrida (o todo con completo=True)."""
+    inicio = time.perf_counter()
+    with transaction.atomic():
+        # La fila de estado bloqueada evita dos corridas a la vez
+        estado, _ = EstadoRecomendaciones.objects.select_for_update().get_or_create(pk=1)
+        # Hasta el corte anterior todo era visible: la marca sigue desde ahí también en el completo
+        hasta = marca_de_agua(DetallePedido.objects.all(), estado.ultimo_detalle, espera_huecos_segundos, tope=None)
+        desde = 0 if completo else estado.ultimo_detalle
+        resumen = {'lineas_desde': desde, 'lineas_hasta': hasta, 'pedidos': 0, 'llaveros_actualizados': 0}
+        if hasta <= desde and not completo:
+            resumen['segundos'] = time.perf_counter() - inicio
+            return resumen
+
+        existentes = np.fromiter(Llavero.objects.values_list('id', flat=True).iterator(chunk_size=10000), dtype=np.int64)
+        n = int(existentes.max()) + 1 if len(existentes) else 1
+        matriz = None if completo or not estado.matriz else _redimensionar(_cargar_matriz(estado.matriz), n)
+        n = max(n, matriz.shape[0]) if matriz is not None else n
+
+        pedido_ids = list(
+            DetallePedido.objects.filter(id__gt=desde, id__lte=hasta)
+            .values_list('pedido_id', flat=True).distinct().order_by('pedido_id')
+        )
+        delta = sparse.csr_matrix((n, n), dtype=np.float64)
+        for i in range(0, len(pedido_ids), lote):
+            lineas = _lineas(pedido_ids[i:i + lote], hasta)
+            lineas = lineas[lineas[:, 1] < n]  # llaveros creados durante la corrida: la próxima
+            ya_contadas = lineas[lineas[:, 2] <= desde]
+            delta = delta + coocurrencias(lineas[:, :2], n) - coocurrencias(ya_contadas[:, :2], n)
+            if progreso:
+                progreso(min(i + lote, len(pedido_ids)), len(pedido_ids))
+        delta.eliminate_zeros()
+        matriz = delta if matriz is None else matriz + delta
+        matriz.eliminate_zeros()
+
+        if completo:
+            afectados = np.arange(n)
+        else:
+            # Filas con co-compras nuevas, más las que tienen de vecino a un llavero
+            # cuya diagonal cambió (el coseno depende de ella). C es simétrica.
+            cambiaron = np.flatnonzero(delta.diagonal())
+            afectados = np.unique(np.r_[delta.nonzero()[0], matriz[cambiaron].indices])
+        afectados = afectados[np.isin(afectados, existentes)]
+        if completo:
+            Recomendacion.objects.all().delete()
+        for j in range(0, len(afectados), LOTE_LLAVEROS):
+            filas = afectados[j:j + LOTE_LLAVEROS]
+            origen, destino, posicion, puntaje = top_k(matriz, filas, existentes, k)
+            if not completo:
+                Recomendacion.objects.filter(llavero_id__in=filas.tolist()).delete()
+            Recomendacion.objects.bulk_create([
+                Recomendacion(llavero_id=int(o), recomendado_id=int(d), posicion=int(p), puntaje=float(s))
+                for o, d, p, s in zip(origen, destino, posicion, puntaje)
+            ], batch_size=5000)
+
+        estado.matriz = _guardar_matriz(matriz)
+        estado.ultimo_detalle = hasta
+        estado.save()
+
+    resumen.update({
+        'pedidos': len(pedido_ids),
+        'llaveros_actualizados': len(afectados),
+        'segundos': time.perf_counter() - inicio,
+    })
+    return resumen
+
+
+def recomendaciones_de(llavero_id):
+    """Una sola lectura por el índice (llavero, posicion)."""
+    campos = ('id', 'nombre', 'precio', 'imagen_url', 'puntaje')
+    filas = Recomendacion.objects.filter(llavero_id=llavero_id).order_by('posicion').values_list(
+        'recomendado_id', 'recomendado__nombre', 'recomendado__precio', 'recomendado__imagen_url', 'puntaje',
+    )
+    # Precio como texto, igual que los DecimalField de los serializers
+    return [dict(zip(campos, fila), precio=str(fila[2])) for fila in filas]
@@ -0,0 +1,58 @@
+import hashlib
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from .lotes import borrar_por_lotes
+from .models import CodigoRecuperacion
+
+# ==========================================
+# 🔐 CÓDIGOS DE RECUPERACIÓN DE CONTRASEÑA
+# ==========================================
+# Un código por usuario, válido RECUPERACION_CODIGO_MINUTOS. La vigencia se
+# controla en la consulta (no hace falta borrar a tiempo para que expire);
+# los vencidos los borra por lotes el comando purgar_codigos_recuperacion.
+# Las solicitudes se limitan por correo en la caché, antes de tocar la base o el SMTP.
+
+
+def limite_vigencia():
+    return timezone.now() - timedelta(minutes=settings.RECUPERACION_CODIGO_MINUTOS)
+
+
+def codigo_vigente(user, codigo):
+    """El registro del código si existe y no venció (usa el índice (user, codigo))."""
+    return CodigoRecuperacion.objects.filter(
+        user=user, codigo=codigo, creado_en__gte=limite_vigencia()
+    ).first()
+
+
+def guardar_codigo(user, codigo):
+    """Reemplaza el código del usuario en su misma fila (un UPDATE) o crea la primera."""
+    actualizadas = CodigoRecuperacion.objects.filter(user=user).update(codigo=codigo, creado_en=timezone.now())
+    if not actualizadas:
+        CodigoRecuperacion.objects.create(user=user, codigo=codigo)
+
+
+def permitir_solicitud(email):
+    """
+    Ventana fija por correo en la caché: como mucho RECUPERACION_MAX_SOLICITUDES
+    cada RECUPERACION_VENTANA_SEGUNDOS. Cuenta también correos que no existen,
+    así la respuesta no delata cuáles están registrados.
+    """
+    clave = 'recuperacion:' + hashlib.sha256(email.strip().lower().encode()).hexdigest()
+    if cache.add(clave, 1, settings.RECUPERACION_VENTANA_SEGUNDOS):
+        return True
+    try:
+        intentos = cache.incr(clave)
+    except ValueError:
+        # La clave venció entre el add y el incr
+        cache.add(clave, 1, settings.RECUPERACION_VENTANA_SEGUNDOS)
+        return True
+    return intentos <= settings.RECUPERACION_MAX_SOLICITUDES
+
+
+def purgar_codigos_vencidos(lote=1000):
+    """Borra códigos vencidos por lotes cortos para no bloquear la tabla. Devuelve cuántos borró."""
+    return borrar_por_lotes(CodigoRecuperacion.objects.filter(creado_en__lt=limite_vigencia()), lote)
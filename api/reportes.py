@@ -0,0 +1,184 @@
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Max, Min, Sum
+from django.utils import timezone
+
+from .models import DetallePedido, Pedido, VentaDiaria
+
+# ==========================================
+# 📊 ROLLUPS DE VENTAS
+# ==========================================
+# Los reportes nunca agregan detalle_pedidos: leen VentaDiaria, que se
+# actualiza con incrementos F() cuando se crean/cambian líneas o un pedido
+# entra o sale de 'Cancelado'.
+
+ESTADO_CANCELADO = 'Cancelado'
+
+
+def aplicar_ventas(filas, signo=1):
+    """
+    Suma (signo=1) o resta (signo=-1) ventas en los rollups.
+    filas = iterable de (fecha, llavero_id, categoria_id, unidades, ingresos).
+    """
+    acumulado = defaultdict(lambda: [None, 0, Decimal('0')])
+    for fecha, llavero_id, categoria_id, unidades, ingresos in filas:
+        fila = acumulado[(fecha, llavero_id)]
+        fila[0] = categoria_id
+        fila[1] += unidades or 0
+        fila[2] += ingresos or 0
+
+    for (fecha, llavero_id), (categoria_id, unidades, ingresos) in acumulado.items():
+        _incrementar(fecha, llavero_id, categoria_id, signo * unidades, signo * ingresos)
+
+
+def _incrementar(fecha, llavero_id, categoria_id, unidades, ingresos):
+    filtro = {'fecha': fecha, 'llavero_id': llavero_id} if llavero_id else {'fecha': fecha, 'llavero__isnull': True}
+    cambios = {'unidades': F('unidades') + unidades, 'ingresos': F('ingresos') + ingresos}
+    if VentaDiaria.objects.filter(**filtro).update(**cambios):
+        return
+    try:
+        with transaction.atomic():
+            VentaDiaria.objects.create(
+                fecha=fecha, llavero_id=llavero_id, categoria_id=categoria_id,
+                unidades=unidades, ingresos=ingresos,
+            )
+    except IntegrityError:
+        # Otra petición creó la fila entre el UPDATE y el INSERT
+        VentaDiaria.objects.filter(**filtro).update(**cambios)
+
+
+def ventas_de_lineas(detalles):
+    """Filas para aplicar_ventas a partir de DetallePedido ya cargados (con su pedido)."""
+    return [
+        (
+            timezone.localdate(detalle.pedido.fecha_pedido),
+            detalle.llavero_id,
+            detalle.llavero.categoria_id if detalle.llavero_id else None,
+            detalle.cantidad,
+            detalle.subtotal,
+        )
+        for detalle in detalles
+    ]
+
+
+def ventas_de_pedidos(pedidos):
+    """
+    Filas para aplicar_ventas sumadas en SQL para muchos pedidos (ids o un
+    queryset de pedidos). La SQL agrupa por el instante del pedido y el día
+    local se saca en Python, como en ventas_de_lineas: TruncDate con USE_TZ
+    es CONVERT_TZ en MySQL, que da NULL si la base no tiene cargadas las
+    tablas de zonas horarias.
+    """
+    filas = (
+        DetallePedido.objects
+        .filter(pedido_id__in=pedidos)
+        .values_list('pedido__fecha_pedido', 'llavero_id', 'llavero__categoria_id')
+        .annotate(unidades=Sum('cantidad'), ingresos=Sum('subtotal'))
+        .order_by()
+    )
+    return [
+        (timezone.localdate(momento), llavero_id, categoria_id, unidades, ingresos)
+        for momento, llavero_id, categoria_id, unidades, ingresos in filas
+    ]
+
+
+def registrar_cancelaciones(filas, nuevo_estado):
+    """Ajusta los rollups cuando pedidos entran o salen de 'Cancelado'. filas = [(pedido_id, estado_anterior)]."""
+    if nuevo_estado == ESTADO_CANCELADO:
+        ids = [pedido_id for pedido_id, anterior in filas if anterior != ESTADO_CANCELADO]
+        signo = -1
+    else:
+        ids = [pedido_id for pedido_id, anterior in filas if anterior == ESTADO_CANCELADO]
+        signo = 1
+    if ids:
+        aplicar_ventas(ventas_de_pedidos(ids), signo)
+
+
+def reconstruir_ventas(dias=31, progreso=None):
+    """
+    Recalcula los rollups desde el historial por tramos de `dias` días. Cada
+    tramo bloquea sus filas de VentaDiaria mientras se recalcula y reemplaza:
+    un pedido simultáneo de esos días espera al UPDATE/INSERT de aplicar_ventas
+    y suma sobre el valor ya corregido en vez de perderse. Devuelve
+    (pedidos, filas).
+    """
+    limites = [
+        Pedido.objects.aggregate(desde=Min('fecha_pedido'), hasta=Max('fecha_pedido')),
+        VentaDiaria.objects.aggregate(desde=Min('fecha'), hasta=Max('fecha')),
+    ]
+    fechas = [
+        timezone.localdate(valor) if isinstance(valor, datetime) else valor
+        for limite in limites for valor in limite.values() if valor is not None
+    ]
+    if not fechas:
+        return 0, 0
+
+    procesados = filas = 0
+    desde = min(fechas)
+    while desde <= max(fechas):
+        hasta = desde + timedelta(days=dias)
+        with transaction.atomic():
+            tramo = VentaDiaria.objects.filter(fecha__gte=desde, fecha__lt=hasta)
+            # En MySQL el bloqueo por rango también frena los INSERT de filas nuevas de esos días
+            list(tramo.select_for_update().values_list('pk', flat=True))
+            pedidos = Pedido.objects.filter(
+                fecha_pedido__gte=_inicio_del_dia(desde), fecha_pedido__lt=_inicio_del_dia(hasta),
+            ).exclude(estado=ESTADO_CANCELADO)
+            acumulado = defaultdict(lambda: [None, 0, Decimal('0')])
+            for fecha, llavero_id, categoria_id, unidades, ingresos in ventas_de_pedidos(pedidos.values('pk')):
+                fila = acumulado[(fecha, llavero_id)]
+                fila[0] = categoria_id
+                fila[1] += unidades or 0
+                fila[2] += ingresos or 0
+            tramo.delete()
+            VentaDiaria.objects.bulk_create(
+                [
+                    VentaDiaria(fecha=fecha, llavero_id=llavero_id, categoria_id=categoria_id,
+                                unidades=unidades, ingresos=ingresos)
+                    for (fecha, llavero_id), (categoria_id, unidades, ingresos) in acumulado.items()
+                ],
+                batch_size=1000,
+            )
+            procesados += pedidos.count()
+            filas += len(acumulado)
+        desde = hasta
+        if progreso:
+            progreso(procesados)
+    return procesados, filas
+
+
+def _inicio_del_dia(fecha):
+    return timezone.make_aware(datetime.combine(fecha, time.min))
+
+
+# ==========================================
+# 📈 CONSULTAS DE REPORTES (SOLO ROLLUPS)
+# ==========================================
+
+AGRUPACIONES = {
+    'dia': ('fecha',),
+    'llavero': ('llavero_id', 'llavero__nombre'),
+    'categoria': ('categoria_id', 'categoria__nombre'),
+}
+
+
+def reporte_ventas(desde, hasta, agrupar='dia'):
+    campos = AGRUPACIONES[agrupar]
+    return list(
+        VentaDiaria.objects.filter(fecha__range=(desde, hasta))
+        .values(*campos)
+        .annotate(unidades=Sum('unidades'), ingresos=Sum('ingresos'))
+        .order_by(*campos[:1])
+    )
+
+
+def top_productos(desde, hasta, limite=10, orden='ingresos'):
+    return list(
+        VentaDiaria.objects.filter(fecha__range=(desde, hasta), llavero__isnull=False)
+        .values('llavero_id', 'llavero__nombre')
+        .annotate(unidades=Sum('unidades'), ingresos=Sum('ingresos'))
+        .order_by(f'-{orden}')[:limite]
+    )
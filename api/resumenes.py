@@ -0,0 +1,124 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, DateTimeField, F, Max, Q, Sum, Value
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import Cliente, Pedido
+
+# ==========================================
+# 👤 RESUMEN DE PEDIDOS POR CLIENTE
+# ==========================================
+# total_pedidos / total_gastado (sin cancelados) y ultimo_pedido viven en la
+# fila del cliente y se ajustan con incrementos F() en la misma transacción
+# que el cambio del pedido: al crearlo, al cambiar su total y en cada
+# transición de estado (registrar_transiciones). Borrar un pedido o moverlo a
+# otro cliente recalcula a los clientes afectados. reconstruir_resumenes
+# rellena y corrige desvíos.
+
+ESTADO_CANCELADO = 'Cancelado'
+
+
+def _cuenta(estado):
+    return estado != ESTADO_CANCELADO
+
+
+def _sumar(cliente_id, pedidos=0, gastado=0, fecha=None):
+    cambios = {}
+    if pedidos:
+        cambios['total_pedidos'] = F('total_pedidos') + pedidos
+    if gastado:
+        cambios['total_gastado'] = F('total_gastado') + gastado
+    if fecha is not None:
+        fecha = Value(fecha, output_field=DateTimeField())
+        # GREATEST de MySQL devuelve NULL si algún argumento lo es
+        cambios['ultimo_pedido'] = Greatest(Coalesce('ultimo_pedido', fecha), fecha)
+    if cliente_id and cambios:
+        Cliente.objects.filter(pk=cliente_id).update(**cambios)
+
+
+def resumen_pedido_creado(pedido):
+    cuenta = _cuenta(pedido.estado)
+    _sumar(pedido.cliente_id, int(cuenta), pedido.total if cuenta else 0, pedido.fecha_pedido)
+
+
+def resumen_total_cambiado(cliente_id, estado_anterior, diferencia):
+    """
+    Ajusta el gasto por un cambio de total. Se usa el estado *anterior*: si
+    además cambió el estado, registrar_transiciones mueve el total nuevo.
+    """
+    if diferencia and _cuenta(estado_anterior):
+        _sumar(cliente_id, gastado=diferencia)
+
+
+def resumen_pedido_editado(antes, pedido):
+    """antes = (cliente_id, estado, total) leídos antes de guardar; el estado lo cubre registrar_transiciones."""
+    cliente_anterior, estado_anterior, total_anterior = antes
+    if cliente_anterior != pedido.cliente_id:
+        reconstruir_resumenes([cliente_anterior, pedido.cliente_id])
+        return
+    resumen_total_cambiado(pedido.cliente_id, estado_anterior, Decimal(str(pedido.total)) - total_anterior)
+
+
+def resumen_transiciones(filas, nuevo_estado):
+    """filas = [(pedido_id, estado_anterior), ...]; solo importa entrar o salir de 'Cancelado'."""
+    anteriores = dict(filas)
+    por_cliente = defaultdict(lambda: [0, Decimal('0')])
+    pedidos = Pedido.objects.filter(pk__in=list(anteriores), cliente__isnull=False).values_list('id', 'cliente_id', 'total')
+    for pedido_id, cliente_id, total in pedidos:
+        signo = int(_cuenta(nuevo_estado)) - int(_cuenta(anteriores[pedido_id]))
+        if signo:
+            acumulado = por_cliente[cliente_id]
+            acumulado[0] += signo
+            acumulado[1] += signo * total
+    # Siempre en el mismo orden para que dos cambios masivos no se bloqueen entre sí
+    for cliente_id in sorted(por_cliente):
+        pedidos, gastado = por_cliente[cliente_id]
+        _sumar(cliente_id, pedidos, gastado)
+
+
+def reconstruir_resumenes(cliente_ids=None, lote=1000, progreso=None):
+    """
+    Recalcula los resúmenes desde pedidos por tramos de clientes (todos o los
+    indicados). Cada tramo bloquea sus clientes mientras se recalcula, así un
+    pedido simultáneo espera en vez de perderse. Devuelve (revisados, corregidos).
+    """
+    clientes = Cliente.objects.all()
+    if cliente_ids is not None:
+        clientes = clientes.filter(pk__in=[cliente_id for cliente_id in cliente_ids if cliente_id])
+    revisados = corregidos = 0
+    ultimo = 0
+    while True:
+        with transaction.atomic():
+            actuales = list(
+                clientes.select_for_update().filter(pk__gt=ultimo).order_by('pk')
+                .values_list('pk', 'total_pedidos', 'total_gastado', 'ultimo_pedido')[:lote]
+            )
+            if not actuales:
+                break
+            ids = [fila[0] for fila in actuales]
+            no_cancelado = ~Q(estado=ESTADO_CANCELADO)
+            calculados = {
+                cliente_id: (pedidos, gastado or Decimal('0.00'), ultimo_pedido)
+                for cliente_id, pedidos, gastado, ultimo_pedido in
+                Pedido.objects.filter(cliente_id__in=ids).values('cliente_id').annotate(
+                    pedidos=Count('id', filter=no_cancelado),
+                    gastado=Sum('total', filter=no_cancelado),
+                    ultimo=Max('fecha_pedido'),
+                ).values_list('cliente_id', 'pedidos', 'gastado', 'ultimo').order_by()
+            }
+            corregir = []
+            for cliente_id, *guardado in actuales:
+                correcto = calculados.get(cliente_id, (0, Decimal('0.00'), None))
+                if tuple(guardado) != correcto:
+                    corregir.append(Cliente(
+                        pk=cliente_id, total_pedidos=correcto[0], total_gastado=correcto[1], ultimo_pedido=correcto[2]
+                    ))
+            Cliente.objects.bulk_update(corregir, ['total_pedidos', 'total_gastado', 'ultimo_pedido'])
+        revisados += len(actuales)
+        corregidos += len(corregir)
+        ultimo = ids[-1]
+        if progreso:
+            progreso(revisados, corregidos)
+    return revisados, corregidos
@@ -3,8 +3,11 @@ from .models import (
     Cliente, Categoria, Material, Llavero, Pedido, DetallePedido, 
     LlaveroMaterial, Carrito, ItemCarrito
 )
+from .acceso import turno_de_hash
+from .inventario import stock_vigente
 from django.contrib.auth import authenticate, get_user_model
 from rest_framework import exceptions
+from rest_framework.permissions import SAFE_METHODS
 from django.db import transaction
 import decimal
 import traceback
@@ -12,6 +15,67 @@ import sys
 
 User = get_user_model()
 
+# ==========================================
+# 0. CAMPOS DINÁMICOS (?fields= / ?omit=)
+# ==========================================
+def leer_lista_param(request, nombre):
+    """Lee un query param tipo 'a,b,c' y devuelve un set (o None si no viene)."""
+    valor = request.query_params.get(nombre)
+    if valor is None:
+        return None
+    return {campo.strip() for campo in valor.split(',') if campo.strip()}
+
+
+class CamposDinamicosMixin:
+    """
+    Permite que la app pida solo los campos que necesita:
+    /api/llaveros/?fields=id,nombre,precio,imagen_url  o  ?omit=descripcion
+    Solo aplica en lecturas (GET) y al serializer raíz, nunca a los anidados.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if request is None or request.method not in SAFE_METHODS:
+            return
+        if not hasattr(request, 'query_params'):
+            return
+
+        solicitados = leer_lista_param(request, 'fields')
+        omitidos = leer_lista_param(request, 'omit')
+        if solicitados is None and omitidos is None:
+            return
+
+        legibles = {nombre for nombre, campo in self.fields.items() if not campo.write_only}
+        invalidos = ((solicitados or set()) | (omitidos or set())) - legibles
+        if invalidos:
+            raise serializers.ValidationError({
+                'fields': f"Campos inválidos: {', '.join(sorted(invalidos))}. "
+                          f"Disponibles: {', '.join(sorted(legibles))}"
+            })
+
+        for nombre in list(self.fields):
+            if self.fields[nombre].write_only:
+                continue
+            if solicitados is not None and nombre not in solicitados:
+                self.fields.pop(nombre)
+            elif omitidos is not None and nombre in omitidos:
+                self.fields.pop(nombre)
+
+
+class StockVigenteMixin:
+    """
+    stock_actual en la base es la última foto del libro de inventario;
+    hacia afuera siempre mostramos el stock vigente (foto + movimientos).
+    Las vistas lo anotan con con_stock_vigente() para no consultar fila por fila.
+    """
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        if 'stock_actual' in data:
+            vigente = stock_vigente(instance)
+            data['stock_actual'] = self.fields['stock_actual'].to_representation(vigente)
+        return data
+
+
 # ==========================================
 # 1. LOGIN DE USUARIO (SIMPLIFICADO)
 # ==========================================
@@ -26,17 +90,20 @@ class LoginSerializer(serializers.Serializer):
         if username_or_email and password:
             user = None
             
-            # 1. Intentar autenticar asumiendo que es un Username
-            user = authenticate(username=username_or_email, password=password)
+            # 1. Intentar autenticar asumiendo que es un Username (hash con turno acotado)
+            with turno_de_hash(self.context.get('request')):
+                user = authenticate(username=username_or_email, password=password)
             
             # 2. Si falla, intentar buscar por Email
             if user is None:
                 try:
                     user_obj = User.objects.filter(email__iexact=username_or_email).first()
-                    if user_obj:
-                        user = authenticate(username=user_obj.username, password=password) 
                 except Exception:
-                    pass 
+                    user_obj = None
+                # Fuera del try: sin turno es 503/429, no "credenciales incorrectas"
+                if user_obj:
+                    with turno_de_hash(self.context.get('request')):
+                        user = authenticate(username=user_obj.username, password=password)
             
             # 3. Validación final
             if user is None:
@@ -88,17 +155,25 @@ class RegisterSerializer(serializers.ModelSerializer):
 # ==========================================
 # 3. MANTENIMIENTO BÁSICO
 # ==========================================
-class ClienteSerializer(serializers.ModelSerializer):
+class ClienteSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
+    class Meta:
+        model = Cliente
+        fields = ('id', 'username', 'email', 'first_name', 'last_name', 'telefono', 'direccion',
+                  'total_pedidos', 'total_gastado', 'ultimo_pedido')
+        read_only_fields = ('total_pedidos', 'total_gastado', 'ultimo_pedido')
+
+class ClienteListaSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
+    # Proyección liviana para listados y búsquedas del directorio
     class Meta:
         model = Cliente
-        fields = ('id', 'username', 'email', 'first_name', 'last_name', 'telefono', 'direccion')
+        fields = ('id', 'username', 'email', 'first_name', 'last_name', 'telefono')
 
-class MaterialSerializer(serializers.ModelSerializer):
+class MaterialSerializer(StockVigenteMixin, CamposDinamicosMixin, serializers.ModelSerializer):
     class Meta:
         model = Material
-        fields = '__all__'
+        exclude = ('movimiento_corte',)
 
-class CategoriaSerializer(serializers.ModelSerializer):
+class CategoriaSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     class Meta:
         model = Categoria
         fields = '__all__'
@@ -106,16 +181,16 @@ class CategoriaSerializer(serializers.ModelSerializer):
 # ==========================================
 # 4. PRODUCTOS Y RELACIONES
 # ==========================================
-class LlaveroSerializer(serializers.ModelSerializer):
+class LlaveroSerializer(StockVigenteMixin, CamposDinamicosMixin, serializers.ModelSerializer):
     categoria = CategoriaSerializer(read_only=True)
     categoria_id = serializers.PrimaryKeyRelatedField(
         queryset=Categoria.objects.all(), source='categoria', write_only=True
     )
     class Meta:
         model = Llavero
-        fields = '__all__'
+        exclude = ('movimiento_corte',)
 
-class LlaveroMaterialSerializer(serializers.ModelSerializer):
+class LlaveroMaterialSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     llavero_nombre = serializers.ReadOnlyField(source='llavero.nombre')
     material_nombre = serializers.ReadOnlyField(source='material.nombre')
     
@@ -134,22 +209,24 @@ class LlaveroMaterialSerializer(serializers.ModelSerializer):
 # 5. PEDIDOS
 # ==========================================
 
-class DetallePedidoSerializer(serializers.ModelSerializer):
+class DetallePedidoSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     llavero_nombre = serializers.ReadOnlyField(source='llavero.nombre')
     llavero = serializers.PrimaryKeyRelatedField(queryset=Llavero.objects.all())
 
     class Meta:
         model = DetallePedido
         fields = ['id', 'pedido', 'llavero', 'llavero_nombre', 'cantidad', 'precio_unitario', 'subtotal']
+        read_only_fields = ['subtotal']
 
-class PedidoSerializer(serializers.ModelSerializer):
+class PedidoSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     detalles = DetallePedidoSerializer(many=True, read_only=True)
     fecha_pedido = serializers.DateTimeField(format="%Y-%m-%d %H:%M:%S", read_only=True)
 
     class Meta:
         model = Pedido
         fields = ['id', 'cliente', 'fecha_pedido', 'estado', 'total', 'detalles']
-        read_only_fields = ['fecha_pedido'] 
+        # total lo mantienen las líneas (api/pedidos.py: sumar_al_total)
+        read_only_fields = ['fecha_pedido', 'total']
 
 # ==========================================
 # 🔐 RECUPERACIÓN CLAVE
@@ -167,7 +244,7 @@ class ResetPasswordConfirmSerializer(serializers.Serializer):
 # 🛒 CARRITO DE COMPRAS
 # ==========================================
 
-class LlaveroSimpleSerializer(serializers.ModelSerializer):
+class LlaveroSimpleSerializer(StockVigenteMixin, serializers.ModelSerializer):
     class Meta:
         model = Llavero
         fields = ['id', 'nombre', 'precio', 'imagen_url', 'stock_actual']
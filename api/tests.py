@@ -1,3 +1,1178 @@
-from django.test import TestCase
+import asyncio
+import csv
+import io
+import json
+import multiprocessing
+import os
+import tempfile
+import threading
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.admin.sites import site
+from django.core import mail
+from django.core.cache import cache
+from django.core.cache.backends.db import DatabaseCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management import call_command
+from django.db import OperationalError, connection, connections, router
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.exceptions import Throttled
+from rest_framework.test import APIClient
+
+from .models import (
+    Carrito, Categoria, Cliente, CodigoRecuperacion, DetallePedido, EstadoRecomendaciones, EventoPedido, ItemCarrito,
+    Llavero, LlaveroMaterial, Material, MovimientoInventario, Pedido, Recomendacion, ReservaStock, VentaDiaria,
+)
+from . import acceso, db_router
+from .acceso import turno_de_hash
+from .admin import ConteoEstimadoPaginator
+from .busqueda import IndiceInvertido
+from .catalogo import invalidar_catalogo
+from .db_router import ReplicaRouter
+from .eventos import BackendMemoria, stream_eventos
+from .exportacion import (
+    COLUMNAS, COLUMNAS_DETALLE, COLUMNAS_PEDIDO, filas_pedidos, filtrar_pedidos, generar_csv, generar_ndjson,
+)
+from .importacion import importar_catalogo, leer_fuentes
+from .inventario import (
+    StockInsuficiente, ajustar_stock_lote, compactar_inventario, registrar_movimientos, reservar, stock_vigente,
+)
+from .pedidos import cambiar_estado_pedidos, tomar_pedidos
+from .recomendaciones import recalcular_recomendaciones
+from .recuperacion import guardar_codigo, permitir_solicitud, purgar_codigos_vencidos
+from .reportes import aplicar_ventas, reconstruir_ventas, ventas_de_pedidos
+from .resumenes import reconstruir_resumenes
+
+
+def crear_carrito(username):
+    return Carrito.objects.create(cliente=Cliente.objects.create_user(username=username, password='x'))
+
+
+def en_paralelo(*funciones):
+    """Corre las funciones a la vez, cada una en su hilo y su conexión. Devuelve resultados o excepciones."""
+    barrera = threading.Barrier(len(funciones))
+    resultados = [None] * len(funciones)
+
+    def correr(i, funcion):
+        try:
+            barrera.wait()
+            resultados[i] = funcion()
+        except Exception as error:
+            resultados[i] = error
+        finally:
+            connection.close()
+
+    hilos = [threading.Thread(target=correr, args=(i, f)) for i, f in enumerate(funciones)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    return resultados
+
+
+def crear_llavero(nombre='Llavero', precio='2.00', stock=10, categoria=None):
+    categoria = categoria or Categoria.objects.create(nombre='General')
+    return Llavero.objects.create(categoria=categoria, nombre=nombre, precio=precio, stock_actual=stock)
+
+
+# ==========================================
+# 📦 BATCH
+# ==========================================
+
+class BatchTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.cliente = Cliente.objects.create_user(username='ana', email='ana@x.com', password='clave123')
+        self.llavero = crear_llavero()
+
+    def batch(self, subpeticiones):
+        return self.client.post('/api/batch/', {'requests': subpeticiones}, format='json')
+
+    def test_error_en_una_subpeticion_no_pierde_las_demas(self):
+        respuesta = self.batch([
+            {'method': 'GET', 'path': '/api/categories/'},
+            {'method': 'POST', 'path': '/api/carrito/add/',
+             'body': {'cliente_id': self.cliente.pk, 'llavero_id': self.llavero.pk, 'cantidad': 'x'}},
+            {'method': 'GET', 'path': f'/api/carrito/{self.cliente.pk}/'},
+        ])
+        self.assertEqual(respuesta.status_code, 200)
+        estados = [r['status'] for r in respuesta.data['responses']]
+        self.assertEqual(estados, [200, 500, 200])
+
+    def test_rechaza_rutas_fuera_de_api(self):
+        for ruta in ('/admin/', '/api/../admin/', 'http://otro/api/categories/'):
+            respuesta = self.batch([{'method': 'GET', 'path': ruta}])
+            self.assertEqual(respuesta.status_code, 400, ruta)
+
+    def test_idempotency_key_del_batch_no_pasa_a_las_subpeticiones(self):
+        alta = {'method': 'POST', 'path': '/api/pedidos/', 'body': {'cliente': self.cliente.pk}}
+        respuesta = self.client.post('/api/batch/', {'requests': [alta, alta]}, format='json',
+                                     HTTP_IDEMPOTENCY_KEY='k-1')
+        self.assertEqual([r['status'] for r in respuesta.data['responses']], [201, 201])
+        self.assertEqual(Pedido.objects.count(), 2)
+
+        # Con clave propia, la segunda repite la respuesta de la primera
+        con_clave = {**alta, 'headers': {'Idempotency-Key': 'k-2'}}
+        primera, repetida = self.batch([con_clave, con_clave]).data['responses']
+        self.assertEqual(repetida, primera)
+        self.assertEqual(Pedido.objects.count(), 3)
+
+    def test_solo_cabeceras_permitidas(self):
+        respuesta = self.batch([{'method': 'GET', 'path': '/api/categories/', 'headers': {'Authorization': 'x'}}])
+        self.assertEqual(respuesta.status_code, 400)
+
+    @override_settings(BATCH_MAX_BYTES=200)
+    def test_limite_de_bytes_sobre_el_cuerpo_real(self):
+        # Sin cuerpos en las subpeticiones: el tamaño lo ponen las rutas
+        rutas = [{'method': 'GET', 'path': f'/api/categories/?relleno={"x" * 40}'} for _ in range(5)]
+        respuesta = self.client.generic('POST', '/api/batch/', json.dumps({'requests': rutas}),
+                                        content_type='application/json')
+        self.assertEqual(respuesta.status_code, 413)
+
+
+# ==========================================
+# 🧵 CONSUMO DE MATERIALES
+# ==========================================
+
+class ConsumoMaterialesTests(TestCase):
+    def setUp(self):
+        self.material = Material.objects.create(nombre='PLA', stock_actual=100, unidad_medida='g')
+        llavero = crear_llavero()
+        LlaveroMaterial.objects.create(llavero=llavero, material=self.material, cantidad_requerida='2.50')
+        self.pedido = Pedido.objects.create(cliente=Cliente.objects.create_user(username='ana', password='x'))
+        DetallePedido.objects.create(pedido=self.pedido, llavero=llavero, cantidad=3, precio_unitario='2.00')
+
+    def consumos(self):
+        return list(
+            MovimientoInventario.objects.filter(pedido=self.pedido, tipo='consumo_material')
+            .values_list('material_id', 'cantidad')
+        )
+
+    def test_completar_de_nuevo_no_consume_dos_veces(self):
+        for estado in ('Completado', 'Pendiente', 'Completado'):
+            cambiar_estado_pedidos([self.pedido.pk], estado)
+        self.assertEqual(self.consumos(), [(self.material.pk, Decimal('-7.50'))])
+
+    def test_ida_y_vuelta_por_la_api(self):
+        cliente_http = APIClient()
+        for estado in ('Completado', 'En proceso', 'Completado'):
+            respuesta = cliente_http.patch(f'/api/pedidos/{self.pedido.pk}/', {'estado': estado}, format='json')
+            self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(self.consumos(), [(self.material.pk, Decimal('-7.50'))])
+
+
+# ==========================================
+# 📒 COMPACTACIÓN DEL LIBRO DE INVENTARIO
+# ==========================================
+
+class CompactarInventarioTests(TestCase):
+    def setUp(self):
+        self.llavero = crear_llavero(stock=10)
+
+    def mover(self, *cantidades):
+        return registrar_movimientos([
+            MovimientoInventario(tipo='ajuste', llavero=self.llavero, cantidad=cantidad) for cantidad in cantidades
+        ])
+
+    def test_se_detiene_en_un_hueco_reciente(self):
+        primero, en_curso, ultimo = self.mover(-1, -2, -3)
+        # Simula una transacción sin commit: su id ya está asignado pero no se ve
+        MovimientoInventario.objects.filter(pk=en_curso.pk).delete()
+        self.assertEqual(compactar_inventario()['movimiento_hasta'], primero.pk)
+
+        # El movimiento aparece después con su id original: no queda bajo el corte
+        MovimientoInventario.objects.create(pk=en_curso.pk, tipo='ajuste', llavero=self.llavero, cantidad=-2)
+        self.assertEqual(compactar_inventario()['movimiento_hasta'], ultimo.pk)
+        self.llavero.refresh_from_db()
+        self.assertEqual(self.llavero.stock_actual, 4)
+        self.assertEqual(stock_vigente(self.llavero), 4)
+
+    def test_salta_huecos_viejos(self):
+        primero, rollback, ultimo = self.mover(-1, -2, -3)
+        MovimientoInventario.objects.filter(pk=rollback.pk).delete()
+        MovimientoInventario.objects.filter(pk=ultimo.pk).update(creado_en=timezone.now() - timedelta(hours=1))
+        self.assertEqual(compactar_inventario()['movimiento_hasta'], ultimo.pk)
+        self.llavero.refresh_from_db()
+        self.assertEqual(self.llavero.stock_actual, 6)
+
+
+# ==========================================
+# ⏳ RESERVAS DE STOCK
+# ==========================================
+
+class ReservasTests(TestCase):
+    def setUp(self):
+        self.llavero = crear_llavero(stock=3)
+        self.carritos = [crear_carrito(f'cli{i}') for i in range(3)]
+
+    def test_no_se_aparta_de_mas(self):
+        a, b, c = self.carritos
+        reservar(a.pk, self.llavero.pk, 2)
+        with self.assertRaises(StockInsuficiente) as error:
+            reservar(b.pk, self.llavero.pk, 2)
+        self.assertEqual(error.exception.disponible, 1)
+        reservar(b.pk, self.llavero.pk, 1)
+        with self.assertRaises(StockInsuficiente):
+            reservar(c.pk, self.llavero.pk, 1)
+        # Cambiar la propia reserva no cuenta contra sí misma
+        reservar(a.pk, self.llavero.pk, 2)
+
+    def test_liberar_reservas_borra_solo_las_vencidas(self):
+        a, b, c = self.carritos
+        for carrito in self.carritos:
+            reservar(carrito.pk, self.llavero.pk, 1)
+        ReservaStock.objects.filter(carrito__in=[a, b]).update(expira_en=timezone.now() - timedelta(minutes=1))
+
+        call_command('liberar_reservas', lote=1, stdout=io.StringIO())
+        self.assertEqual(list(ReservaStock.objects.values_list('carrito_id', flat=True)), [c.pk])
+        # Lo que apartaban vuelve a estar disponible
+        reservar(a.pk, self.llavero.pk, 2)
+
+
+class ReservasConcurrentesTests(TransactionTestCase):
+    @skipUnlessDBFeature('has_select_for_update')
+    def test_dos_carritos_no_apartan_las_mismas_unidades(self):
+        llavero = crear_llavero(stock=3)
+        a, b = crear_carrito('a'), crear_carrito('b')
+        resultados = en_paralelo(lambda: reservar(a.pk, llavero.pk, 2), lambda: reservar(b.pk, llavero.pk, 2))
+        self.assertEqual(sum(isinstance(r, StockInsuficiente) for r in resultados), 1, resultados)
+        self.assertEqual(ReservaStock.objects.get().cantidad, 2)
+
+
+# ==========================================
+# 📊 ROLLUPS DE VENTAS
+# ==========================================
+
+class VentasDiariasTests(TestCase):
+    def setUp(self):
+        self.llavero = crear_llavero()
+        self.cliente = Cliente.objects.create_user(username='ana', password='x')
+        self.pedidos = []
+        for cantidad in (1, 2):
+            pedido = Pedido.objects.create(cliente=self.cliente)
+            DetallePedido.objects.create(pedido=pedido, llavero=self.llavero, cantidad=cantidad, precio_unitario='2.00')
+            self.pedidos.append(pedido)
+
+    def vendido(self):
+        return list(VentaDiaria.objects.values_list('fecha', 'unidades', 'ingresos'))
+
+    def test_el_dia_es_el_local(self):
+        # 03:00 UTC del 1 de marzo todavía es 28 de febrero en Guayaquil (UTC-5)
+        Pedido.objects.filter(pk=self.pedidos[0].pk).update(
+            fecha_pedido=datetime(2026, 3, 1, 3, tzinfo=dt_timezone.utc)
+        )
+        fecha = ventas_de_pedidos([self.pedidos[0].pk])[0][0]
+        self.assertEqual(fecha.isoformat(), '2026-02-28')
+
+    def test_borrar_desde_el_admin_descuenta_las_ventas(self):
+        aplicar_ventas(ventas_de_pedidos([pedido.pk for pedido in self.pedidos]))
+        self.assertEqual(self.vendido()[0][1:], (3, Decimal('6.00')))
+
+        admin_pedidos = site._registry[Pedido]
+        solicitud = RequestFactory().post('/')
+        admin_pedidos.delete_model(solicitud, self.pedidos[0])
+        self.assertEqual(self.vendido()[0][1:], (2, Decimal('4.00')))
+        admin_pedidos.delete_queryset(solicitud, Pedido.objects.all())
+        self.assertEqual(self.vendido()[0][1:], (0, Decimal('0.00')))
+
+    def test_reconstruir_corrige_y_borra_filas_sobrantes(self):
+        hoy = timezone.localdate()
+        VentaDiaria.objects.create(fecha=hoy, llavero=self.llavero, unidades=99, ingresos=1)
+        VentaDiaria.objects.create(fecha=hoy - timedelta(days=400), llavero=self.llavero, unidades=5, ingresos=10)
+        Pedido.objects.filter(pk=self.pedidos[0].pk).update(estado='Cancelado')
+
+        self.assertEqual(reconstruir_ventas(dias=7), (1, 1))
+        self.assertEqual(self.vendido(), [(hoy, 2, Decimal('4.00'))])
+
+
+# ==========================================
+# 🔍 ÍNDICE DE BÚSQUEDA EN MEMORIA
+# ==========================================
+
+class IndiceInvertidoTests(TestCase):
+    def setUp(self):
+        categoria = Categoria.objects.create(nombre='General')
+        self.gato = crear_llavero('Gato negro', categoria=categoria)
+        self.luna = crear_llavero('Luna dorada', categoria=categoria)
+        self.indice = IndiceInvertido()
+        self.indice.armar()
+
+    def ids(self, texto):
+        return [llavero_id for llavero_id, _ in self.indice.buscar(texto)]
+
+    def test_rearmar_no_pierde_cambios_que_llegan_mientras_tanto(self):
+        original = IndiceInvertido._agregar
+        indice = self.indice
+
+        def agregar(este, *args, **kwargs):
+            # La señal de un guardado llega con el armado a medias (la fila ya se leyó con el nombre viejo)
+            if este is not indice and este.palabras_doc and indice._durante_armado == []:
+                indice.actualizar(self.luna.pk, 'Luna unicornio', '')
+            return original(este, *args, **kwargs)
+
+        invalidar_catalogo()
+        with mock.patch.object(IndiceInvertido, '_agregar', agregar):
+            indice.armar()
+        self.assertIsNone(indice._durante_armado)
+        self.assertEqual(self.ids('unicornio'), [self.luna.pk])
+        self.assertEqual(self.ids('gato'), [self.gato.pk])
+
+    def test_no_rearma_si_la_version_no_cambio(self):
+        with mock.patch.object(Llavero.objects, 'order_by') as leer:
+            self.indice.armar()
+        leer.assert_not_called()
+
+
+# ==========================================
+# 🗂️ ADMIN CON TABLAS GRANDES
+# ==========================================
+
+@override_settings(ADMIN_CONTEO_MAXIMO=5)
+class AdminAltoVolumenTests(TestCase):
+    def setUp(self):
+        self.admin = Cliente.objects.create_superuser(username='admin', email='admin@x.com', password='x')
+        self.client.force_login(self.admin)
+        self.categoria = Categoria.objects.create(nombre='General')
+
+    def crear(self, n):
+        for i in range(n):
+            llavero = crear_llavero(f'Llavero {i}', categoria=self.categoria)
+            pedido = Pedido.objects.create(cliente=self.admin)
+            DetallePedido.objects.create(pedido=pedido, llavero=llavero, cantidad=1, precio_unitario='2.00')
+            MovimientoInventario.objects.create(tipo='ajuste', llavero=llavero, cantidad=-1)
+
+    def test_paginador_cuenta_con_tope(self):
+        self.crear(3)
+        with self.assertNumQueries(1):
+            self.assertEqual(ConteoEstimadoPaginator(Llavero.objects.order_by('id'), 2).count, 3)
+        self.crear(5)
+        with self.assertNumQueries(1):
+            # Pasado el tope no se cuenta la tabla entera: alcanza con saber que hay más
+            self.assertEqual(ConteoEstimadoPaginator(Llavero.objects.order_by('id'), 2).count, 6)
+        with self.assertNumQueries(1):
+            self.assertEqual(ConteoEstimadoPaginator(Llavero.objects.filter(nombre='Llavero 1').order_by('id'), 2).count, 2)
+
+    def test_paginador_usa_la_estadistica_sin_filtros(self):
+        with mock.patch('api.admin.estimar_filas', return_value=1_000_000), self.assertNumQueries(0):
+            self.assertEqual(ConteoEstimadoPaginator(Llavero.objects.order_by('id'), 2).count, 1_000_000)
+        # Una estadística por debajo del tope no es confiable: se cuenta
+        with mock.patch('api.admin.estimar_filas', return_value=2), self.assertNumQueries(1):
+            self.assertEqual(ConteoEstimadoPaginator(Llavero.objects.order_by('id'), 2).count, 0)
+
+    def assertListadoConstante(self, url, consultas):
+        """Mismas consultas con filas por debajo y por encima de ADMIN_CONTEO_MAXIMO (sin N+1 ni COUNT completo)."""
+        for filas in (3, 10):
+            self.crear(filas)
+            with self.assertNumQueries(consultas):
+                self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_listado_de_pedidos(self):
+        # sesión, usuario, conteo con tope, página (con cliente y tomado_por en el JOIN)
+        self.assertListadoConstante('/admin/api/pedido/', 4)
+
+    def test_listado_de_llaveros(self):
+        # sesión, usuario, conteo con tope, página con stock vigente, categorías del filtro
+        self.assertListadoConstante('/admin/api/llavero/', 5)
+
+
+# ==========================================
+# 👥 DIRECTORIO DE CLIENTES
+# ==========================================
+
+class DirectorioClientesTests(TestCase):
+    def setUp(self):
+        self.ana = Cliente.objects.create_user(username='ana', email='ana@x.com', password='x')
+        self.staff = Cliente.objects.create_user(username='staff', password='x', is_staff=True)
+        self.client = APIClient()
+
+    def test_busqueda_y_lookup_solo_para_staff(self):
+        for url in ('/api/clientes/?q=an', f'/api/clientes/lookup/?ids={self.ana.pk}'):
+            self.assertIn(self.client.get(url).status_code, (401, 403), url)
+        self.assertIn(self.client.post('/api/clientes/lookup/', {'ids': [self.ana.pk]}, format='json').status_code,
+                      (401, 403))
+
+        self.client.force_authenticate(self.staff)
+        respuesta = self.client.get('/api/clientes/?q=an')
+        self.assertEqual([c['id'] for c in respuesta.data['results']], [self.ana.pk])
+        respuesta = self.client.get(f'/api/clientes/lookup/?ids={self.ana.pk},999')
+        self.assertEqual(respuesta.data['no_encontrados'], [999])
+
+    def test_cliente_comun_no_busca(self):
+        self.client.force_authenticate(self.ana)
+        self.assertEqual(self.client.get('/api/clientes/?q=st').status_code, 403)
+
+
+# ==========================================
+# 🔁 IDEMPOTENCIA
+# ==========================================
+
+class IdempotenciaTests(TestCase):
+    def setUp(self):
+        self.carrito = crear_carrito('ana')
+        self.llavero = crear_llavero(precio='2.50')
+        self.client = APIClient()
+
+    def agregar(self, clave, cantidad=2):
+        return self.client.post('/api/carrito/add/', {
+            'cliente_id': self.carrito.cliente_id, 'llavero_id': self.llavero.pk, 'cantidad': cantidad,
+        }, format='json', HTTP_IDEMPOTENCY_KEY=clave)
+
+    def test_reintento_repite_los_mismos_bytes(self):
+        primera = self.agregar('k1')
+        self.assertEqual(primera.status_code, 200)
+        repetida = self.agregar('k1')
+
+        self.assertEqual(repetida.status_code, 200)
+        self.assertEqual(repetida['Idempotent-Replayed'], 'true')
+        self.assertEqual(repetida['Content-Type'], primera['Content-Type'])
+        self.assertEqual(repetida.content, primera.content)
+        self.assertEqual(self.carrito.items.get().cantidad, 2)
+
+    def test_misma_clave_con_otro_cuerpo(self):
+        self.agregar('k1')
+        self.assertEqual(self.agregar('k1', cantidad=3).status_code, 422)
+
+    def test_error_transitorio_no_queda_guardado(self):
+        alta = {'cliente': self.carrito.cliente_id}
+        with mock.patch('rest_framework.mixins.CreateModelMixin.create', side_effect=OperationalError('deadlock')):
+            fallida = self.client.post('/api/pedidos/', alta, format='json', HTTP_IDEMPOTENCY_KEY='k1')
+        self.assertEqual(fallida.status_code, 400)
+        reintento = self.client.post('/api/pedidos/', alta, format='json', HTTP_IDEMPOTENCY_KEY='k1')
+        self.assertEqual(reintento.status_code, 201)
+        self.assertEqual(Pedido.objects.count(), 1)
+
+    def test_las_claves_son_de_cada_usuario(self):
+        alta = {'cliente': self.carrito.cliente_id}
+        ids = []
+        for username in ('uno', 'dos'):
+            self.client.force_authenticate(Cliente.objects.create_user(username=username, password='x'))
+            respuesta = self.client.post('/api/pedidos/', alta, format='json', HTTP_IDEMPOTENCY_KEY='k1')
+            self.assertNotIn('Idempotent-Replayed', respuesta)
+            ids.append(respuesta.data['id'])
+        self.assertNotEqual(*ids)
+
+
+# ==========================================
+# 📡 STREAM DE EVENTOS DE PEDIDOS
+# ==========================================
+
+@override_settings(EVENTOS_LATIDO_SEGUNDOS=0.2)
+class StreamEventosTests(TransactionTestCase):
+    async def siguiente_evento(self, stream):
+        while True:
+            parte = await asyncio.wait_for(anext(stream), 5)
+            if parte.startswith('id: ') and 'event: estado' in parte:
+                return parte
+
+    async def test_un_lector_por_proceso_reparte_a_los_streams(self):
+        cliente = await sync_to_async(Cliente.objects.create_user)(username='ana', password='x')
+        pedido = await Pedido.objects.acreate(cliente=cliente)
+        backend = BackendMemoria()
+        with mock.patch('api.eventos.backend_eventos', return_value=backend), \
+                mock.patch('api.eventos._eventos_despues') as relecturas:
+            streams = [stream_eventos(cliente.pk) for _ in range(3)]
+            for stream in streams:
+                self.assertTrue((await anext(stream)).startswith('retry: '))
+            evento = await EventoPedido.objects.acreate(
+                cliente=cliente, pedido=pedido, estado_anterior='Pendiente', estado='En proceso'
+            )
+            backend.publicar({cliente.pk})
+
+            for stream in streams:
+                mensaje = await self.siguiente_evento(stream)
+                self.assertTrue(mensaje.startswith(f'id: {evento.pk}\n'))
+                self.assertIn('"estado": "En proceso"', mensaje)
+                await stream.aclose()
+            # Los streams no leyeron la tabla: el evento llegó del lector compartido
+            relecturas.assert_not_called()
+        self.assertEqual(backend.conectados(), 0)
+        await asyncio.wait_for(backend._lector, 5)
+
+    async def test_reconectar_relee_lo_perdido(self):
+        cliente = await sync_to_async(Cliente.objects.create_user)(username='ana', password='x')
+        pedido = await Pedido.objects.acreate(cliente=cliente)
+        eventos = [
+            await EventoPedido.objects.acreate(cliente=cliente, pedido=pedido, estado_anterior='Pendiente', estado=e)
+            for e in ('En proceso', 'Completado')
+        ]
+        stream = stream_eventos(cliente.pk, desde=eventos[0].pk, continuo=False)
+        partes = [parte async for parte in stream]
+        self.assertEqual(len(partes), 2)
+        self.assertTrue(partes[1].startswith(f'id: {eventos[1].pk}\n'))
+
+
+# ==========================================
+# 🧑‍🏭 COLA DE PREPARACIÓN
+# ==========================================
+
+class ColaPreparacionTests(TestCase):
+    def test_liberar_tomas_vencidas(self):
+        empleado = Cliente.objects.create_user(username='emp', password='x', is_staff=True)
+        pedidos = [Pedido.objects.create() for _ in range(3)]
+        tomados = tomar_pedidos(empleado, cantidad=3)
+        self.assertEqual(tomados, [p.pk for p in pedidos])
+        Pedido.objects.filter(pk__in=tomados[:2]).update(tomado_hasta=timezone.now() - timedelta(minutes=1))
+
+        call_command('liberar_pedidos_tomados', lote=1, stdout=io.StringIO())
+        estados = dict(Pedido.objects.values_list('id', 'estado'))
+        self.assertEqual([estados[pk] for pk in tomados], ['Pendiente', 'Pendiente', 'En proceso'])
+        self.assertFalse(Pedido.objects.filter(estado='Pendiente', tomado_por__isnull=False).exists())
+        # Vuelven a la cola por orden de llegada
+        self.assertEqual(tomar_pedidos(empleado, cantidad=5), tomados[:2])
+
+
+def _tomar_hasta_vaciar(empleado_id, barrera, resultados):
+    """Proceso hijo: toma de a 3 hasta vaciar la cola y deja sus ids (o el error) en `resultados`."""
+    try:
+        empleado = Cliente.objects.get(pk=empleado_id)
+        barrera.wait()
+        tomados = []
+        while lote := tomar_pedidos(empleado, cantidad=3):
+            tomados.extend(lote)
+        resultados.put(tomados)
+    except Exception as error:
+        resultados.put(repr(error))
+    finally:
+        connections.close_all()
+
+
+class ColaPreparacionConcurrenteTests(TransactionTestCase):
+    @skipUnlessDBFeature('has_select_for_update_skip_locked')
+    def test_dos_empleados_no_toman_el_mismo_pedido(self):
+        empleados = [Cliente.objects.create_user(username=f'emp{i}', password='x', is_staff=True) for i in range(2)]
+        pedidos = {Pedido.objects.create().pk for _ in range(20)}
+
+        def tomar_todo(empleado):
+            tomados = []
+            while lote := tomar_pedidos(empleado, cantidad=3):
+                tomados.extend(lote)
+            return set(tomados)
+
+        primero, segundo = en_paralelo(*(lambda e=e: tomar_todo(e) for e in empleados))
+        self.assertIsInstance(primero, set, primero)
+        self.assertIsInstance(segundo, set, segundo)
+        self.assertFalse(primero & segundo)
+        self.assertEqual(primero | segundo, pedidos)
+
+    @skipUnlessDBFeature('has_select_for_update_skip_locked')
+    @skipUnless('fork' in multiprocessing.get_all_start_methods(), "necesita fork")
+    def test_varios_procesos_no_toman_el_mismo_pedido(self):
+        # Como varios workers de gunicorn: cada proceso con su propia conexión
+        empleados = [Cliente.objects.create_user(username=f'emp{i}', password='x', is_staff=True) for i in range(4)]
+        pedidos = {Pedido.objects.create().pk for _ in range(40)}
+        connections.close_all()  # los hijos no deben heredar la conexión abierta
+
+        contexto = multiprocessing.get_context('fork')
+        barrera, resultados = contexto.Barrier(len(empleados)), contexto.Queue()
+        procesos = [
+            contexto.Process(target=_tomar_hasta_vaciar, args=(empleado.pk, barrera, resultados))
+            for empleado in empleados
+        ]
+        for proceso in procesos:
+            proceso.start()
+        tomados = [resultados.get(timeout=60) for _ in procesos]
+        for proceso in procesos:
+            proceso.join()
+
+        for lote in tomados:
+            self.assertIsInstance(lote, list, lote)
+        todos = [pk for lote in tomados for pk in lote]
+        self.assertEqual(len(todos), len(set(todos)))
+        self.assertEqual(set(todos), pedidos)
+
+
+# ==========================================
+# 🛡️ LOGIN: LÍMITES ANTES DEL HASH
+# ==========================================
+
+class TurnoDeHashTests(TestCase):
+    def peticion(self, ip):
+        return RequestFactory().post('/api/android/login/', REMOTE_ADDR=ip)
+
+    def test_un_cliente_no_acapara_la_fila(self):
+        with turno_de_hash(self.peticion('1.1.1.1')):
+            # El segundo turno del mismo cliente se rechaza sin esperar el semáforo
+            with mock.patch.object(acceso._turnos_hash, 'acquire') as acquire:
+                with self.assertRaises(Throttled):
+                    with turno_de_hash(self.peticion('1.1.1.1')):
+                        pass
+                acquire.assert_not_called()
+        self.assertFalse(acceso._turnos_por_cliente)
+        with turno_de_hash(self.peticion('1.1.1.1')):
+            pass
+
+    @override_settings(HASH_ESPERA_SEGUNDOS=0)
+    def test_sin_turno_libre_es_503(self):
+        with mock.patch.object(acceso._turnos_hash, 'acquire', return_value=False):
+            respuesta = APIClient().post('/api/android/login/', {'username': 'ana', 'password': 'x'}, format='json')
+        self.assertEqual(respuesta.status_code, 503)
+        self.assertFalse(acceso._turnos_por_cliente)
+
+    def test_fila_llena_es_503_sin_esperar(self):
+        with mock.patch.object(acceso._fila_hash, 'acquire', return_value=False), \
+                mock.patch.object(acceso._turnos_hash, 'acquire') as acquire:
+            with self.assertRaises(acceso.HashSaturado):
+                with turno_de_hash(self.peticion('2.2.2.2')):
+                    pass
+        acquire.assert_not_called()
+        self.assertFalse(acceso._turnos_por_cliente)
+
+
+class CacheCompartidaTests(TestCase):
+    """Cada worker de gunicorn arma su propia instancia de la caché."""
+
+    def gastar_cubeta(self, cache_worker):
+        with mock.patch.object(acceso, 'cache', cache_worker):
+            return acceso.tomar_token('acceso:ip:prueba', 1, 1)[0]
+
+    def test_con_cache_en_la_base_la_cubeta_es_global(self):
+        call_command('createcachetable', 'cache_compartida_pruebas', verbosity=0)
+        worker_1, worker_2 = DatabaseCache('cache_compartida_pruebas', {}), DatabaseCache('cache_compartida_pruebas', {})
+        self.assertTrue(self.gastar_cubeta(worker_1))
+        self.assertFalse(self.gastar_cubeta(worker_2))
+
+    def test_con_locmem_cada_worker_tiene_su_cubeta(self):
+        self.assertTrue(self.gastar_cubeta(LocMemCache('worker-1', {})))
+        self.assertTrue(self.gastar_cubeta(LocMemCache('worker-2', {})))
+
+
+# ==========================================
+# 🤝 RECOMENDACIONES POR CO-COMPRA
+# ==========================================
+
+class RecomendacionesTests(TestCase):
+    def setUp(self):
+        categoria = Categoria.objects.create(nombre='General')
+        self.llaveros = [crear_llavero(f'Llavero {i}', categoria=categoria) for i in range(6)]
+
+    def pedido(self, *indices, **campos):
+        pedido = Pedido.objects.create()
+        for i in indices:
+            DetallePedido.objects.create(pedido=pedido, llavero=self.llaveros[i], precio_unitario='2.00', **campos)
+        return pedido
+
+    def ranking(self):
+        return sorted(Recomendacion.objects.values_list('llavero_id', 'posicion', 'recomendado_id'))
+
+    def test_incremental_igual_que_completo(self):
+        self.pedido(0, 1, 2)
+        self.pedido(1, 2)
+        recalcular_recomendaciones()
+        self.pedido(2, 3)
+        viejo = self.pedido(0, 4)
+        # Una línea nueva en un pedido ya contado
+        DetallePedido.objects.create(pedido=viejo, llavero=self.llaveros[5], precio_unitario='2.00')
+        recalcular_recomendaciones()
+        incremental = self.ranking()
+
+        recalcular_recomendaciones(completo=True)
+        self.assertEqual(incremental, self.ranking())
+        self.assertTrue(incremental)
+
+    def test_linea_con_commit_tardio_no_se_pierde(self):
+        self.pedido(0, 1)
+        recalcular_recomendaciones()
+        tarde = self.pedido(2, 3)
+        siguiente = self.pedido(2, 4)
+        # La primera línea de `tarde` todavía no hizo commit: su id queda como hueco
+        pendiente = tarde.detalles.order_by('id').first()
+        DetallePedido.objects.filter(pk=pendiente.pk).delete()
+        resumen = recalcular_recomendaciones()
+        self.assertEqual(resumen['lineas_hasta'], pendiente.pk - 1)
+
+        pendiente.save(force_insert=True)
+        recalcular_recomendaciones()
+        self.assertEqual(EstadoRecomendaciones.objects.get().ultimo_detalle,
+                         siguiente.detalles.order_by('-id').values_list('id', flat=True).first())
+        incremental = self.ranking()
+        recalcular_recomendaciones(completo=True)
+        self.assertEqual(incremental, self.ranking())
+
+
+# ==========================================
+# 📚 RÉPLICAS DE LECTURA
+# ==========================================
+
+REPLICA = 'replica_prueba'
+
+
+@override_settings(DATABASE_REPLICAS=[REPLICA], REPLICA_STICKY_SEGUNDOS=60, REST_FRAMEWORK={
+    **settings.REST_FRAMEWORK, 'NUM_PROXIES': 1,
+})
+class ReplicasLecturaTests(TestCase):
+    """Primaria = base de pruebas; réplica = otro archivo SQLite con sus propias filas."""
+
+    @classmethod
+    def setUpClass(cls):
+        # El alias se agrega acá (no en settings ni en `databases` de la clase):
+        # el runner no debe crearle una base de pruebas, ya trae la suya
+        cls.databases = {'default', REPLICA}
+        cls.archivo = tempfile.NamedTemporaryFile(suffix='.sqlite3', delete=False).name
+        connections.settings[REPLICA] = {**connections.settings['default'], 'NAME': cls.archivo}
+        with connections[REPLICA].schema_editor() as editor:
+            editor.create_model(Categoria)
+        Categoria.objects.using(REPLICA).create(nombre='Solo en la réplica')
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections[REPLICA].close()
+        del connections[REPLICA]
+        del connections.settings[REPLICA]
+        os.remove(cls.archivo)
+
+    def setUp(self):
+        Categoria.objects.create(nombre='En la primaria')
+        ruteo = mock.patch.object(router, 'routers', [ReplicaRouter()])
+        ruteo.start()
+        self.addCleanup(ruteo.stop)
+        cache.clear()
+        self.addCleanup(db_router._replicas_caidas.clear)
+        self.cliente = Cliente.objects.create_user(username='ana', password='x')
+        self.llavero = crear_llavero()
+
+    def categorias(self, client, **extra):
+        return [c['nombre'] for c in client.get('/api/categories/', **extra).data['results']]
+
+    def escribir(self, client, **extra):
+        respuesta = client.post('/api/carrito/add/', {'cliente_id': self.cliente.pk, 'llavero_id': self.llavero.pk},
+                                format='json', **extra)
+        self.assertEqual(respuesta.status_code, 200)
+
+    def test_lee_de_la_replica(self):
+        self.assertEqual(self.categorias(APIClient()), ['Solo en la réplica'])
+
+    def test_lectura_tras_escritura_en_la_misma_peticion(self):
+        respuesta = APIClient().post('/api/batch/', {'requests': [
+            {'method': 'GET', 'path': '/api/categories/'},
+            {'method': 'POST', 'path': '/api/carrito/add/',
+             'body': {'cliente_id': self.cliente.pk, 'llavero_id': self.llavero.pk}},
+            {'method': 'GET', 'path': '/api/categories/'},
+        ]}, format='json')
+        antes, _, despues = respuesta.data['responses']
+        self.assertEqual([c['nombre'] for c in antes['body']['results']], ['Solo en la réplica'])
+        self.assertIn('En la primaria', [c['nombre'] for c in despues['body']['results']])
+
+    def test_despues_de_escribir_el_cliente_queda_en_la_primaria(self):
+        navegador = APIClient()
+        self.escribir(navegador, REMOTE_ADDR='10.0.0.1')
+        self.assertIn(db_router.COOKIE_STICKY, navegador.cookies)
+        self.assertIn('En la primaria', self.categorias(navegador, REMOTE_ADDR='10.0.0.2'))
+
+        # Sin cookie (app Android): la caché por IP
+        self.assertIn('En la primaria', self.categorias(APIClient(), REMOTE_ADDR='10.0.0.1'))
+        self.assertEqual(self.categorias(APIClient(), REMOTE_ADDR='10.0.0.3'), ['Solo en la réplica'])
+
+    def test_la_ip_sticky_no_la_elige_el_cliente(self):
+        # Con NUM_PROXIES=1 cuenta la IP que agregó el balanceador (la última)
+        self.escribir(APIClient(), HTTP_X_FORWARDED_FOR='6.6.6.6, 10.0.0.1')
+        self.assertEqual(self.categorias(APIClient(), HTTP_X_FORWARDED_FOR='6.6.6.6, 10.0.0.9'),
+                         ['Solo en la réplica'])
+        self.assertIn('En la primaria', self.categorias(APIClient(), HTTP_X_FORWARDED_FOR='1.2.3.4, 10.0.0.1'))
+
+    def test_replica_caida_usa_la_primaria(self):
+        caida = mock.patch.object(connections[REPLICA], 'ensure_connection', side_effect=OperationalError('caída'))
+        with caida as conectar:
+            self.assertIn('En la primaria', self.categorias(APIClient()))
+            self.assertIn('En la primaria', self.categorias(APIClient()))
+        # La segunda lectura ya no reintenta: espera REPLICA_REINTENTO_SEGUNDOS
+        self.assertEqual(conectar.call_count, 1)
+        db_router._replicas_caidas.clear()
+        self.assertEqual(self.categorias(APIClient()), ['Solo en la réplica'])
+
+    def test_la_tabla_de_cache_va_a_la_primaria_sin_pegar_la_peticion(self):
+        entrada = DatabaseCache('cache_compartida', {}).cache_model_class
+        # Como al empezar una petición marcada (setUp ya escribió en este contexto)
+        for variable, valor in ((db_router._leer_de_replica, True), (db_router._hubo_escritura, False)):
+            self.addCleanup(variable.reset, variable.set(valor))
+        self.assertEqual(router.db_for_write(entrada), 'default')
+        self.assertEqual(router.db_for_read(entrada), 'default')
+        self.assertEqual(router.db_for_read(Categoria), REPLICA)
+
+
+# ==========================================
+# 🧾 TOTAL DEL PEDIDO
+# ==========================================
+
+class TotalPedidoTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.cliente = Cliente.objects.create_user(username='ana', password='x')
+        self.llavero = crear_llavero(stock=50)
+        self.pedido, self.otro = (Pedido.objects.create(cliente=self.cliente) for _ in range(2))
+
+    def total(self, pedido):
+        return Pedido.objects.values_list('total', flat=True).get(pk=pedido.pk)
+
+    def agregar(self, pedido, cantidad, precio):
+        respuesta = self.client.post('/api/detalle-pedidos/', {
+            'pedido': pedido.pk, 'llavero': self.llavero.pk, 'cantidad': cantidad, 'precio_unitario': precio,
+        }, format='json')
+        self.assertEqual(respuesta.status_code, 201, respuesta.data)
+        return respuesta.data['id']
+
+    def test_alta_cambio_movida_y_baja_de_lineas(self):
+        linea = self.agregar(self.pedido, 3, '0.10')
+        self.agregar(self.pedido, 1, '2.00')
+        self.assertEqual(self.total(self.pedido), Decimal('2.30'))
+
+        self.client.patch(f'/api/detalle-pedidos/{linea}/', {'cantidad': 2}, format='json')
+        self.assertEqual(self.total(self.pedido), Decimal('2.20'))
+        # Precio editado a 0: el subtotal también pasa a 0
+        self.client.patch(f'/api/detalle-pedidos/{linea}/', {'precio_unitario': '0.00'}, format='json')
+        self.assertEqual(DetallePedido.objects.get(pk=linea).subtotal, 0)
+        self.assertEqual(self.total(self.pedido), Decimal('2.00'))
+
+        self.client.patch(f'/api/detalle-pedidos/{linea}/', {'precio_unitario': '1.50'}, format='json')
+        self.client.patch(f'/api/detalle-pedidos/{linea}/', {'pedido': self.otro.pk}, format='json')
+        self.assertEqual((self.total(self.pedido), self.total(self.otro)), (Decimal('2.00'), Decimal('3.00')))
+
+        self.client.delete(f'/api/detalle-pedidos/{linea}/')
+        self.assertEqual(self.total(self.otro), 0)
+        self.cliente.refresh_from_db()
+        self.assertEqual(self.cliente.total_gastado, Decimal('2.00'))
+
+    def test_auditar_y_corregir_desvios(self):
+        self.agregar(self.pedido, 2, '1.25')
+        Pedido.objects.filter(pk=self.pedido.pk).update(total=Decimal('9.99'))
+        Cliente.objects.filter(pk=self.cliente.pk).update(total_gastado=Decimal('9.99'))
+
+        salida = io.StringIO()
+        call_command('auditar_totales_pedidos', stdout=salida)
+        self.assertIn(f'Pedido #{self.pedido.pk}: total 9.99, líneas 2.5', salida.getvalue())
+        self.assertEqual(self.total(self.pedido), Decimal('9.99'))
+
+        call_command('auditar_totales_pedidos', corregir=True, lote=1, stdout=io.StringIO())
+        self.assertEqual(self.total(self.pedido), Decimal('2.50'))
+        self.cliente.refresh_from_db()
+        self.assertEqual(self.cliente.total_gastado, Decimal('2.50'))
+        salida = io.StringIO()
+        call_command('auditar_totales_pedidos', stdout=salida)
+        self.assertIn('0 desvío(s)', salida.getvalue())
+
+
+# ==========================================
+# 👤 RESUMEN DE PEDIDOS POR CLIENTE
+# ==========================================
+
+class ResumenClientesTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.ana, self.beto = (Cliente.objects.create_user(username=u, password='x') for u in ('ana', 'beto'))
+        self.llavero = crear_llavero(stock=50)
+
+    def crear_pedido(self, cliente, precio='2.00'):
+        pedido_id = self.client.post('/api/pedidos/', {'cliente': cliente.pk}, format='json').data['id']
+        self.client.post('/api/detalle-pedidos/', {
+            'pedido': pedido_id, 'llavero': self.llavero.pk, 'cantidad': 1, 'precio_unitario': precio,
+        }, format='json')
+        return pedido_id
+
+    def resumen(self, cliente):
+        return Cliente.objects.values_list('total_pedidos', 'total_gastado').get(pk=cliente.pk)
+
+    def test_altas_cancelaciones_y_cambios_de_total(self):
+        primero = self.crear_pedido(self.ana)
+        self.crear_pedido(self.ana, precio='3.00')
+        self.assertEqual(self.resumen(self.ana), (2, Decimal('5.00')))
+        self.assertEqual(Cliente.objects.get(pk=self.ana.pk).ultimo_pedido,
+                         Pedido.objects.order_by('-fecha_pedido').values_list('fecha_pedido', flat=True).first())
+
+        self.client.patch(f'/api/pedidos/{primero}/', {'estado': 'Cancelado'}, format='json')
+        self.assertEqual(self.resumen(self.ana), (1, Decimal('3.00')))
+        # Una línea nueva de un pedido cancelado no suma al gasto
+        self.client.post('/api/detalle-pedidos/', {
+            'pedido': primero, 'llavero': self.llavero.pk, 'cantidad': 1, 'precio_unitario': '1.00',
+        }, format='json')
+        self.assertEqual(self.resumen(self.ana), (1, Decimal('3.00')))
+
+        self.client.patch(f'/api/pedidos/{primero}/', {'estado': 'Pendiente'}, format='json')
+        self.assertEqual(self.resumen(self.ana), (2, Decimal('6.00')))
+
+    def test_mover_y_borrar_pedidos(self):
+        pedido = self.crear_pedido(self.ana)
+        self.crear_pedido(self.beto, precio='4.00')
+        self.client.patch(f'/api/pedidos/{pedido}/', {'cliente': self.beto.pk}, format='json')
+        self.assertEqual(self.resumen(self.ana), (0, Decimal('0.00')))
+        self.assertIsNone(Cliente.objects.get(pk=self.ana.pk).ultimo_pedido)
+        self.assertEqual(self.resumen(self.beto), (2, Decimal('6.00')))
+
+        self.client.delete(f'/api/pedidos/{pedido}/')
+        self.assertEqual(self.resumen(self.beto), (1, Decimal('4.00')))
+
+    def test_reconstruir_corrige_desvios(self):
+        self.crear_pedido(self.ana)
+        self.crear_pedido(self.beto, precio='4.00')
+        Cliente.objects.filter(pk=self.ana.pk).update(total_pedidos=7, total_gastado=Decimal('99.00'))
+        Cliente.objects.filter(pk=self.beto.pk).update(ultimo_pedido=None)
+
+        salida = io.StringIO()
+        call_command('reconstruir_resumenes_clientes', lote=1, stdout=salida)
+        self.assertIn('2 corregido(s)', salida.getvalue())
+        self.assertEqual(self.resumen(self.ana), (1, Decimal('2.00')))
+        self.assertIsNotNone(Cliente.objects.get(pk=self.beto.pk).ultimo_pedido)
+        self.assertEqual(reconstruir_resumenes(), (Cliente.objects.count(), 0))
+
+
+# ==========================================
+# 🔐 RECUPERACIÓN DE CONTRASEÑA
+# ==========================================
+
+@override_settings(EMAIL_HOST_USER='tienda@llaveros3d.com')
+class RecuperacionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.cliente = Cliente.objects.create_user(username='ana', email='ana@correo.com', password='vieja')
+
+    def confirmar(self, codigo):
+        return APIClient().post('/api/auth/reset-confirm/', {
+            'email': 'ana@correo.com', 'codigo': codigo, 'new_password': 'nueva-clave',
+        }, format='json')
+
+    def vencer(self, *codigos):
+        antes = timezone.now() - timedelta(minutes=settings.RECUPERACION_CODIGO_MINUTOS + 1)
+        CodigoRecuperacion.objects.filter(codigo__in=codigos).update(creado_en=antes)
+
+    def test_cada_solicitud_reemplaza_el_codigo_en_la_misma_fila(self):
+        for _ in range(2):
+            respuesta = APIClient().post('/api/auth/reset-request/', {'email': 'ana@correo.com'}, format='json')
+            self.assertEqual(respuesta.status_code, 200)
+        registro = CodigoRecuperacion.objects.get(user=self.cliente)
+        self.assertIn(registro.codigo, mail.outbox[-1].body)
+        self.assertEqual(len(mail.outbox), 2)
+
+    def test_codigo_vencido_se_rechaza(self):
+        guardar_codigo(self.cliente, '123456')
+        self.vencer('123456')
+        self.assertEqual(self.confirmar('123456').status_code, 400)
+        self.cliente.refresh_from_db()
+        self.assertTrue(self.cliente.check_password('vieja'))
+
+        # Pedir otro código renueva la vigencia de la misma fila
+        guardar_codigo(self.cliente, '654321')
+        self.assertEqual(self.confirmar('654321').status_code, 200)
+        self.cliente.refresh_from_db()
+        self.assertTrue(self.cliente.check_password('nueva-clave'))
+        self.assertFalse(CodigoRecuperacion.objects.exists())
+
+    @override_settings(RECUPERACION_MAX_SOLICITUDES=2)
+    def test_limite_de_solicitudes_por_correo(self):
+        # Cuenta igual aunque el correo no exista y sin importar mayúsculas
+        codigos = [
+            APIClient().post('/api/auth/reset-request/', {'email': email}, format='json').status_code
+            for email in ('nadie@correo.com', 'Nadie@correo.com', 'nadie@correo.com')
+        ]
+        self.assertEqual(codigos, [200, 200, 429])
+        self.assertTrue(permitir_solicitud('ana@correo.com'))
+
+    def test_purgar_borra_solo_los_vencidos(self):
+        otro = Cliente.objects.create_user(username='beto', email='beto@correo.com', password='x')
+        guardar_codigo(self.cliente, '111111')
+        guardar_codigo(otro, '222222')
+        self.vencer('111111')
+        self.assertEqual(purgar_codigos_vencidos(lote=1), 1)
+        self.assertEqual(list(CodigoRecuperacion.objects.values_list('codigo', flat=True)), ['222222'])
+
+
+# ==========================================
+# 📥 IMPORTACIÓN MASIVA DEL CATÁLOGO
+# ==========================================
+
+class ImportacionCatalogoTests(TestCase):
+    def setUp(self):
+        Categoria.objects.create(nombre='Anime')
+        self.llavero = crear_llavero(nombre='Viejo', stock=10)
+        Llavero.objects.filter(pk=self.llavero.pk).update(
+            sku='LL-1', descripcion='Guardada', imagen_url='https://img.example/1.png',
+        )
+        invalidar = mock.patch('api.importacion.invalidar_catalogo')
+        self.invalidar = invalidar.start()
+        self.addCleanup(invalidar.stop)
+
+    def test_upsert_por_sku_sin_pisar_opcionales_ausentes(self):
+        resumen = importar_catalogo([('llaveros', [
+            {'sku': 'LL-1', 'nombre': 'Nuevo', 'precio': '3.50', 'categoria': 'Anime'},
+            {'sku': 'LL-2', 'nombre': 'Otro', 'precio': '1', 'categoria': 'Anime', 'stock_actual': '4'},
+        ])], lote=1)
+        conteo = resumen['tipos']['llaveros']
+        self.assertEqual((conteo['creadas'], conteo['actualizadas'], conteo['con_error']), (1, 1, 0))
+
+        viejo = Llavero.objects.get(sku='LL-1')
+        self.assertEqual((viejo.nombre, viejo.precio), ('Nuevo', Decimal('3.50')))
+        self.assertEqual((viejo.descripcion, viejo.imagen_url), ('Guardada', 'https://img.example/1.png'))
+        self.assertEqual(stock_vigente(viejo), 10)
+        self.assertEqual(Llavero.objects.get(sku='LL-2').stock_actual, 4)
+        self.assertFalse(MovimientoInventario.objects.exists())
+        # Dos lotes, una sola invalidación de la versión del catálogo
+        self.invalidar.assert_called_once_with()
+
+    def test_stock_de_un_existente_se_cambia_con_un_movimiento(self):
+        with mock.patch('api.importacion.ajustar_stock_lote', wraps=ajustar_stock_lote) as ajustar:
+            importar_catalogo([('llaveros', [
+                {'sku': 'LL-1', 'nombre': 'Viejo', 'precio': '2', 'categoria': 'Anime', 'stock_actual': '7'},
+            ])])
+        ajustar.assert_called_once_with(Llavero, {self.llavero.pk: Decimal('7')})
+        self.llavero.refresh_from_db()
+        self.assertEqual(self.llavero.stock_actual, 10)
+        self.assertEqual(stock_vigente(self.llavero), 7)
+        movimiento = MovimientoInventario.objects.get(llavero=self.llavero)
+        self.assertEqual((movimiento.tipo, movimiento.cantidad), ('ajuste', Decimal('-3')))
+
+    def test_bom_con_sku_desconocido_se_reporta(self):
+        importar_catalogo(leer_fuentes(io.StringIO('sku,nombre,unidad_medida\nMAT-1,PLA,g\n'), 'csv', 'materiales'))
+        resumen = importar_catalogo(leer_fuentes(io.StringIO(json.dumps({'bom': [
+            {'llavero_sku': 'LL-1', 'material_sku': 'MAT-1', 'cantidad_requerida': '5'},
+            {'llavero_sku': 'LL-1', 'material_sku': 'NO-EXISTE', 'cantidad_requerida': '1'},
+        ]})), 'json'))
+        conteo = resumen['tipos']['bom']
+        self.assertEqual((conteo['validas'], conteo['creadas'], conteo['con_error']), (1, 1, 1))
+        self.assertEqual(resumen['errores'], [
+            {'tipo': 'bom', 'fila': 2, 'errores': {'material_sku': ['No existe: NO-EXISTE']}},
+        ])
+        self.assertEqual(LlaveroMaterial.objects.get(llavero=self.llavero).cantidad_requerida, 5)
+
+    def test_solo_validar_no_escribe_ni_invalida(self):
+        resumen = importar_catalogo([('llaveros', [
+            {'sku': 'LL-1', 'nombre': 'Nuevo', 'precio': '3', 'categoria': 'Anime'},
+            {'sku': 'LL-3', 'nombre': 'Malo', 'precio': 'abc', 'categoria': 'Inexistente'},
+        ])], solo_validar=True)
+        self.assertEqual(resumen['total_errores'], 1)
+        self.assertEqual(set(resumen['errores'][0]['errores']), {'precio', 'categoria'})
+        self.assertEqual(Llavero.objects.get(sku='LL-1').nombre, 'Viejo')
+        self.invalidar.assert_not_called()
+
+
+# ==========================================
+# 📤 EXPORTACIÓN DE PEDIDOS
+# ==========================================
+
+class ExportacionPedidosTests(TestCase):
+    def setUp(self):
+        cliente = Cliente.objects.create_user(username='ana', email='ana@correo.com', password='x')
+        llavero = crear_llavero(nombre='Pikachu')
+        self.pedidos = []
+        for fecha, cantidades in ((datetime(2026, 3, 1, 10), [1, 2]), (datetime(2026, 3, 2, 23, 30), []),
+                                  (datetime(2026, 3, 3, 0, 30), [3])):
+            pedido = Pedido.objects.create(cliente=cliente)
+            Pedido.objects.filter(pk=pedido.pk).update(fecha_pedido=timezone.make_aware(fecha))
+            for cantidad in cantidades:
+                DetallePedido.objects.create(pedido=pedido, llavero=llavero, cantidad=cantidad, precio_unitario='2.00')
+            self.pedidos.append(pedido.pk)
+
+    def test_ndjson_anida_las_lineas_y_un_pedido_sin_lineas_queda_vacio(self):
+        pedidos = [json.loads(linea) for linea in generar_ndjson(filas_pedidos(Pedido.objects.all()))]
+        self.assertEqual([p['pedido_id'] for p in pedidos], self.pedidos)
+        self.assertEqual([[d['cantidad'] for d in p['detalles']] for p in pedidos], [[1, 2], [], [3]])
+        self.assertEqual(pedidos[0]['detalles'][1]['subtotal'], '4.00')
+        self.assertEqual(pedidos[0]['cliente_username'], 'ana')
+
+    def test_csv_una_fila_por_linea(self):
+        filas = list(csv.reader(io.StringIO(''.join(generar_csv(filas_pedidos(Pedido.objects.all()))))))
+        self.assertEqual(filas[0], [nombre for nombre, _ in COLUMNAS])
+        self.assertEqual([int(fila[0]) for fila in filas[1:]], [self.pedidos[0], *self.pedidos])
+        # El pedido sin líneas sale con las columnas de detalle vacías
+        self.assertEqual(filas[3][len(COLUMNAS_PEDIDO):], [''] * len(COLUMNAS_DETALLE))
+
+    def test_rango_de_fechas_incluye_el_dia_hasta(self):
+        dia = datetime(2026, 3, 2).date()
+        self.assertEqual(list(filtrar_pedidos(desde=dia, hasta=dia).values_list('id', flat=True)), [self.pedidos[1]])
+        self.assertEqual(filtrar_pedidos(hasta=dia).count(), 2)
+        self.assertEqual(filtrar_pedidos(desde=dia).count(), 2)
+
+    def test_paginado_por_keyset_entre_lotes(self):
+        completo = list(filas_pedidos(Pedido.objects.all()))
+        # lote=2: ids del primer tramo, sus filas, ids del segundo, sus filas y el tramo vacío final
+        with self.assertNumQueries(5):
+            por_lotes = list(filas_pedidos(Pedido.objects.all(), lote=2))
+        self.assertEqual(por_lotes, completo)
+        self.assertEqual(len(por_lotes), 4)
+        # Con filtros, el tramo siguiente sigue desde el último id del anterior
+        self.assertEqual([fila[0] for fila in filas_pedidos(Pedido.objects.exclude(pk=self.pedidos[1]), lote=1)],
+                         [self.pedidos[0], self.pedidos[0], self.pedidos[2]])
+
+
+# ==========================================
+# 🧹 BARRIDO DE CARRITOS ABANDONADOS
+# ==========================================
+
+class BarridoCarritosTests(TestCase):
+    def llenar(self, username, dias_inactivo):
+        carrito = crear_carrito(username)
+        for llavero in self.llaveros:
+            ItemCarrito.objects.create(carrito=carrito, llavero=llavero, cantidad=1)
+            ReservaStock.objects.create(carrito=carrito, llavero=llavero, cantidad=1,
+                                        expira_en=timezone.now() + timedelta(minutes=5))
+        Carrito.objects.filter(pk=carrito.pk).update(actualizado_en=timezone.now() - timedelta(days=dias_inactivo))
+        return carrito
+
+    def setUp(self):
+        categoria = Categoria.objects.create(nombre='General')
+        self.llaveros = [crear_llavero(nombre=f'L{i}', categoria=categoria) for i in range(2)]
+
+    @override_settings(CARRITO_ABANDONADO_DIAS=30)
+    def test_borra_los_inactivos_con_sus_items_y_reservas(self):
+        viejos = [self.llenar(f'viejo{i}', 31) for i in range(3)]
+        reciente = self.llenar('reciente', 29)
+
+        salida = io.StringIO()
+        call_command('barrer_carritos', lote=2, stdout=salida)
+        self.assertIn('carritos_borrados=3 items_borrados=6 reservas_borradas=6 lotes=2', salida.getvalue())
+
+        self.assertEqual(list(Carrito.objects.values_list('pk', flat=True)), [reciente.pk])
+        self.assertFalse(ItemCarrito.objects.filter(carrito__in=[c.pk for c in viejos]).exists())
+        self.assertFalse(ReservaStock.objects.exclude(carrito=reciente).exists())
+        self.assertEqual(ItemCarrito.objects.filter(carrito=reciente).count(), 2)
+        # El cliente se conserva: solo se va su carrito
+        self.assertEqual(Cliente.objects.count(), 4)
+
+
+# ==========================================
+# 🛒 CARRITO: CONSULTAS POR PETICIÓN
+# ==========================================
+
+class CarritoConsultasTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.carrito = crear_carrito('ana')
+        categoria = Categoria.objects.create(nombre='General')
+        self.llaveros = [crear_llavero(nombre=f'L{i}', stock=10, categoria=categoria) for i in range(4)]
+
+    def agregar(self, *llaveros):
+        for llavero in llaveros:
+            ItemCarrito.objects.create(carrito=self.carrito, llavero=llavero, cantidad=1)
+
+    def consultas(self, metodo, ruta, datos=None):
+        with CaptureQueriesContext(connection) as capturadas:
+            respuesta = getattr(APIClient(), metodo)(ruta, datos, format='json')
+        self.assertEqual(respuesta.status_code, 200, respuesta.data)
+        return len(capturadas), respuesta
+
+    def test_las_consultas_no_crecen_con_los_items(self):
+        ruta = f'/api/carrito/{self.carrito.cliente_id}/'
+        self.agregar(self.llaveros[0])
+        con_uno, _ = self.consultas('get', ruta)
+        self.agregar(*self.llaveros[1:3])
+        con_tres, _ = self.consultas('get', ruta)
+        self.assertEqual(con_uno, con_tres)
+
+        datos = {'cliente_id': self.carrito.cliente_id, 'llavero_id': self.llaveros[3].pk}
+        al_agregar, _ = self.consultas('post', '/api/carrito/add/', datos)
+        al_quitar, _ = self.consultas('post', '/api/carrito/remove/', datos)
+        self.agregar(self.llaveros[3])
+        self.agregar(crear_llavero(nombre='Extra', categoria=self.llaveros[0].categoria))
+        otro = {'cliente_id': self.carrito.cliente_id, 'llavero_id': self.llaveros[0].pk}
+        self.assertEqual(self.consultas('post', '/api/carrito/add/', otro)[0], al_agregar)
+        self.assertEqual(self.consultas('post', '/api/carrito/remove/', otro)[0], al_quitar)
+
+    def test_muestra_el_stock_vigente(self):
+        self.agregar(self.llaveros[0])
+        registrar_movimientos([MovimientoInventario(tipo='venta', llavero=self.llaveros[0], cantidad=-3)])
+        _, respuesta = self.consultas('get', f'/api/carrito/{self.carrito.cliente_id}/')
+        self.assertEqual(Decimal(respuesta.data['items'][0]['llavero']['stock_actual']), 7)
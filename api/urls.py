@@ -30,7 +30,27 @@ from .views import (
     vaciar_carrito,
 
     # 🔥 NOTIFICACIONES (ESTO FALTABA IMPORTAR)
-    actualizar_fcm_token
+    actualizar_fcm_token,
+
+    # Batch
+    batch_view,
+
+    # MRP
+    mrp_view,
+
+    # Cola de preparación
+    tomar_pedidos_view,
+    renovar_toma_view,
+    soltar_pedidos_view,
+
+    # Reportes
+    reporte_ventas_view,
+    top_productos_view,
+    exportar_pedidos_view,
+    importar_catalogo_view,
+)
+from .views_async import (
+    categorias_async, productos_async, carrito_async, historial_pedidos_async, eventos_pedidos_async
 )
 
 router = DefaultRouter()
@@ -53,7 +73,7 @@ urlpatterns = [
     
     # Listas para la App
     path('categories/', CategoriaList.as_view(), name='category-list'),
-    path('products/<str:category_id>/', ProductoList.as_view(), name='product-list-by-category'),
+    path('products/<int:category_id>/', ProductoList.as_view(), name='product-list-by-category'),
 
     # Recuperación de Contraseña
     path('auth/reset-request/', solicitar_recuperacion, name='password_reset_request'),
@@ -68,4 +88,28 @@ urlpatterns = [
     # 🔥 NUEVA RUTA: REGISTRAR TOKEN DEL CELULAR 🔥
     path('fcm/update-token/', actualizar_fcm_token, name='update_fcm_token'),
 
+    # 📦 VARIAS LLAMADAS EN UN SOLO VIAJE HTTP
+    path('batch/', batch_view, name='batch'),
+
+    # 🏭 PLANIFICACIÓN DE MATERIALES (STAFF)
+    path('mrp/', mrp_view, name='mrp'),
+
+    # 🧑‍🏭 COLA DE PREPARACIÓN (STAFF)
+    path('cola/pedidos/tomar/', tomar_pedidos_view, name='cola-tomar'),
+    path('cola/pedidos/renovar/', renovar_toma_view, name='cola-renovar'),
+    path('cola/pedidos/soltar/', soltar_pedidos_view, name='cola-soltar'),
+
+    # 📊 REPORTES DE VENTAS (STAFF)
+    path('reportes/ventas/', reporte_ventas_view, name='reporte-ventas'),
+    path('reportes/top-productos/', top_productos_view, name='reporte-top-productos'),
+    path('exportar/pedidos/', exportar_pedidos_view, name='exportar-pedidos'),
+    path('importar/catalogo/', importar_catalogo_view, name='importar-catalogo'),
+
+    # ⚡ LECTURAS ASYNC (rinden de verdad con SERVER_MODE=asgi)
+    path('async/categories/', categorias_async, name='category-list-async'),
+    path('async/products/<int:category_id>/', productos_async, name='product-list-by-category-async'),
+    path('async/carrito/<int:cliente_id>/', carrito_async, name='obtener_carrito_async'),
+    path('async/pedidos/<int:cliente_id>/', historial_pedidos_async, name='historial-pedidos-async'),
+    path('async/pedidos/<int:cliente_id>/eventos/', eventos_pedidos_async, name='eventos-pedidos-async'),
+
 ]
\ No newline at end of file
@@ -1,45 +1,140 @@
+import io
+import json
+import contextvars
 import random 
 import traceback 
+from concurrent.futures import ThreadPoolExecutor
 from django.core.mail import send_mail 
 from django.conf import settings 
-from django.http import HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse
 from django.contrib.auth import get_user_model 
-from django.contrib.auth.hashers import check_password 
 from django.db.models import Q 
+from django.core.exceptions import FieldDoesNotExist
 from django.db import transaction 
+from django.db import connections
 from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from datetime import timedelta
+from django.core.handlers.wsgi import WSGIRequest
+from django.urls import resolve, Resolver404
 
 from rest_framework import viewsets, status, generics
 from rest_framework.response import Response
-from rest_framework.permissions import AllowAny
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import AllowAny, IsAdminUser, SAFE_METHODS
+from rest_framework.decorators import action, api_view, permission_classes, parser_classes, throttle_classes
+from rest_framework.parsers import MultiPartParser
+from rest_framework.pagination import CursorPagination
 from rest_framework.authtoken.models import Token 
-from rest_framework.exceptions import ValidationError 
+from rest_framework.exceptions import Throttled, ValidationError
 
 # Importaciones de tus modelos
 from .models import (
-    Categoria, Llavero, Pedido, Cliente, Material, 
-    LlaveroMaterial, DetallePedido, CodigoRecuperacion, 
-    Carrito, ItemCarrito
+    Categoria, Llavero, Pedido, Cliente, Material,
+    LlaveroMaterial, DetallePedido,
+    Carrito, ItemCarrito, MovimientoInventario
+)
+
+from .acceso import ACCESO_THROTTLES, HashSaturado, turno_de_hash, verificar_clave
+from .db_router import LecturaReplicaMixin
+from .mrp import calcular_mrp
+from .busqueda import autocompletar, buscar_llaveros, MAX_RESULTADOS
+from .carritos import carrito_vacio, carritos_con_items, tocar_carrito
+from .catalogo import facetas_catalogo, filtrar_catalogo, filtros_catalogo
+from .recomendaciones import recomendaciones_de
+from .exportacion import exportar_pedidos, FORMATOS
+from .idempotencia import idempotente
+from .importacion import ArchivoInvalido, importar_catalogo, leer_fuentes
+from .pedidos import linea_cambiada, registrar_transiciones, sumar_al_total, tomar_pedidos, renovar_toma, soltar_pedidos, liberar_tomas_vencidas
+from .recuperacion import codigo_vigente, guardar_codigo, permitir_solicitud
+from .resumenes import reconstruir_resumenes, resumen_pedido_creado, resumen_pedido_editado
+from .reportes import aplicar_ventas, ventas_de_lineas, ventas_de_pedidos, reporte_ventas, top_productos, AGRUPACIONES
+from .inventario import (
+    con_stock_vigente, stock_vigente, registrar_movimientos, ajustar_stock,
+    bloquear_llavero, disponible_para, reservar, liberar_reservas, StockInsuficiente
 )
 
 # Importaciones de tus serializers
 from .serializers import (
     RegisterSerializer, LoginSerializer, CategoriaSerializer, LlaveroSerializer, 
-    PedidoSerializer, ClienteSerializer, MaterialSerializer, 
+    PedidoSerializer, ClienteSerializer, ClienteListaSerializer, MaterialSerializer, 
     LlaveroMaterialSerializer, DetallePedidoSerializer,
     RequestPasswordResetSerializer, ResetPasswordConfirmSerializer, CarritoSerializer,
     # 🔥 IMPORTANTE: Agregamos el nuevo serializer del token
-    FCMTokenSerializer
+    FCMTokenSerializer, leer_lista_param
 )
 
 User = get_user_model()
 
+# ==========================================
+# CAMPOS DINÁMICOS: ACHICAR TAMBIÉN EL SQL
+# ==========================================
+class CamposDinamicosQuerysetMixin:
+    """
+    Complemento de CamposDinamicosMixin (serializers): si la app pide
+    ?fields= u ?omit=, el queryset solo trae esas columnas (only()) y solo
+    hace select_related/prefetch_related de las relaciones que se van a mostrar.
+    prefetch_campos permite indicar un prefetch más profundo por campo.
+    """
+    prefetch_campos = {}
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.request.method not in SAFE_METHODS:
+            return queryset
+        serializer = self.get_serializer_class()(context=self.get_serializer_context())
+        return optimizar_queryset(queryset, serializer, self.prefetch_campos)
+
+
+def optimizar_queryset(queryset, serializer, prefetch_campos=None):
+    prefetch_campos = prefetch_campos or {}
+    meta = queryset.model._meta
+    columnas = {meta.pk.name}
+    relacionados, prefetches = set(), set()
+    se_puede_achicar = True
+
+    for campo in serializer.fields.values():
+        if campo.write_only:
+            continue
+        if campo.source == '*':
+            se_puede_achicar = False
+            continue
+
+        partes = campo.source.split('.')
+        try:
+            modelo_campo = meta.get_field(partes[0])
+        except FieldDoesNotExist:
+            # Propiedad o método del modelo: necesita la fila completa
+            se_puede_achicar = False
+            continue
+
+        if modelo_campo.one_to_many or modelo_campo.many_to_many:
+            prefetches.add(prefetch_campos.get(campo.field_name, partes[0]))
+        elif modelo_campo.many_to_one or modelo_campo.one_to_one:
+            columnas.add(partes[0])
+            if len(partes) > 1:
+                relacionados.add(partes[0])
+                columnas.add('__'.join(partes))
+            elif hasattr(campo, 'fields'):
+                # Serializer anidado: trae la fila relacionada completa
+                relacionados.add(partes[0])
+        else:
+            columnas.add(partes[0])
+
+    if relacionados:
+        queryset = queryset.select_related(*relacionados)
+    if prefetches:
+        queryset = queryset.prefetch_related(*prefetches)
+    if se_puede_achicar:
+        queryset = queryset.only(*columnas)
+    return queryset
+
 # ==========================================
 # LOGIN MANUAL
 # ==========================================
 @api_view(['POST'])
 @permission_classes([AllowAny]) 
+@throttle_classes(ACCESO_THROTTLES)
 def android_login_view(request):
     print("\n" + "█"*40)
     print("🚑 LOGIN DE EMERGENCIA (MANUAL)")
@@ -55,21 +150,19 @@ def android_login_view(request):
 
         login_input = str(login_input).strip()
 
-        # Buscar usuario
-        user_obj = User.objects.filter(Q(email__iexact=login_input) | Q(username__iexact=login_input)).first()
+        # Turno acotado para búsqueda + hash: sin turno, 503 antes de tocar la base
+        with turno_de_hash(request):
+            # Buscar usuario
+            user_obj = User.objects.filter(Q(email__iexact=login_input) | Q(username__iexact=login_input)).first()
 
-        if not user_obj:
-            print(f"❌ Usuario no encontrado en tabla {User.__name__}")
-            return Response({"error": "Usuario no encontrado."}, status=status.HTTP_404_NOT_FOUND)
+            if not user_obj:
+                print(f"❌ Usuario no encontrado en tabla {User.__name__}")
+                return Response({"error": "Usuario no encontrado."}, status=status.HTTP_404_NOT_FOUND)
 
-        print(f"✅ Usuario encontrado: {user_obj.email} (ID: {user_obj.id})")
+            print(f"✅ Usuario encontrado: {user_obj.email} (ID: {user_obj.id})")
 
-        # Verificar contraseña manual
-        password_is_valid = False
-        if user_obj.password.startswith('pbkdf2_') or user_obj.password.startswith('argon2'):
-            password_is_valid = check_password(password, user_obj.password)
-        else:
-            password_is_valid = (user_obj.password == password)
+            # Verificar contraseña (las de texto plano se migran a hash)
+            password_is_valid = verificar_clave(user_obj, password)
 
         if password_is_valid:
             token, _ = Token.objects.get_or_create(user=user_obj)
@@ -87,6 +180,8 @@ def android_login_view(request):
             print("❌ Contraseña incorrecta.")
             return Response({"error": "Contraseña incorrecta"}, status=status.HTTP_401_UNAUTHORIZED)
 
+    except (HashSaturado, Throttled):
+        raise
     except Exception as e:
         error_msg = str(e)
         trace_msg = traceback.format_exc()
@@ -102,12 +197,13 @@ def android_login_view(request):
 # PEDIDOS (SIN PAGINACIÓN PARA ANDROID)
 # ==========================================
 
-class PedidoViewSet(viewsets.ModelViewSet):
+class PedidoViewSet(LecturaReplicaMixin, CamposDinamicosQuerysetMixin, viewsets.ModelViewSet):
     # 🔥 CORRECCIÓN AQUÍ: Cambiado 'fecha' por 'fecha_pedido'
     queryset = Pedido.objects.all().order_by('-fecha_pedido')
     serializer_class = PedidoSerializer
     permission_classes = [AllowAny] 
     pagination_class = None 
+    prefetch_campos = {'detalles': 'detalles__llavero'}
 
     def get_queryset(self):
         queryset = super().get_queryset()
@@ -123,16 +219,43 @@ class PedidoViewSet(viewsets.ModelViewSet):
             
         return queryset
 
+    def perform_create(self, serializer):
+        pedido = serializer.save()
+        resumen_pedido_creado(pedido)
+
+    def perform_update(self, serializer):
+        with transaction.atomic():
+            # Bloqueamos la fila para que dos cambios simultáneos no consuman materiales dos veces
+            cliente_id, anterior, total = Pedido.objects.select_for_update() \
+                .values_list('cliente_id', 'estado', 'total').get(pk=serializer.instance.pk)
+            pedido = serializer.save()
+            resumen_pedido_editado((cliente_id, anterior, total), pedido)
+            if pedido.estado != anterior:
+                registrar_transiciones([(pedido.id, anterior)], pedido.estado)
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            # Sus líneas desaparecen en cascada: se descuentan de los reportes
+            if instance.estado != 'Cancelado':
+                aplicar_ventas(ventas_de_pedidos([instance.pk]), signo=-1)
+            instance.delete()
+            reconstruir_resumenes([instance.cliente_id])
+
     def create(self, request, *args, **kwargs):
+        # El 400 genérico queda fuera de la clave: un error transitorio (deadlock,
+        # base caída) no debe repetirse como respuesta definitiva al reintentar
         try:
-            with transaction.atomic():
-                print("🛒 Creando NUEVO pedido...")
-                return super().create(request, *args, **kwargs)
+            return self._crear(request, *args, **kwargs)
         except Exception as e:
             print(f"❌ Error creando pedido: {e}")
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-class DetallePedidoViewSet(viewsets.ModelViewSet):
+    @idempotente('pedidos')
+    def _crear(self, request, *args, **kwargs):
+        print("🛒 Creando NUEVO pedido...")
+        return super().create(request, *args, **kwargs)
+
+class DetallePedidoViewSet(CamposDinamicosQuerysetMixin, viewsets.ModelViewSet):
     queryset = DetallePedido.objects.all()
     serializer_class = DetallePedidoSerializer
     permission_classes = [AllowAny]
@@ -145,32 +268,68 @@ class DetallePedidoViewSet(viewsets.ModelViewSet):
             return queryset.filter(pedido_id=pedido_id)
         return queryset
 
+    @idempotente('detalle-pedidos')
+    def create(self, request, *args, **kwargs):
+        return super().create(request, *args, **kwargs)
+
     def perform_create(self, serializer):
         llavero = serializer.validated_data['llavero']
         cantidad = serializer.validated_data['cantidad']
-
-        # 1. Validar que haya suficiente stock
-        if llavero.stock_actual < cantidad:
-            raise ValidationError({
-                "error": f"No hay suficiente stock de '{llavero.nombre}'. Disponibles: {llavero.stock_actual}"
-            })
+        pedido = serializer.validated_data['pedido']
+        carrito_id = Carrito.objects.filter(cliente_id=pedido.cliente_id).values_list('id', flat=True).first()
 
         try:
             with transaction.atomic():
-                # 2. Restar el stock
-                llavero.stock_actual -= cantidad
-                llavero.save()
-
-                # 3. Guardar el detalle del pedido
-                serializer.save()
+                # 1. Validar que haya suficiente stock (sin contar lo que reservan otros carritos)
+                llavero_bloqueado = bloquear_llavero(llavero.pk)
+                disponible = disponible_para(llavero_bloqueado, carrito_id)
+                if disponible < cantidad:
+                    raise ValidationError({
+                        "error": f"No hay suficiente stock de '{llavero.nombre}'. Disponibles: {disponible}"
+                    })
+
+                # 2. Guardar el detalle del pedido y sumarlo al total
+                detalle = serializer.save()
+                linea_cambiada(None, detalle)
+
+                # 3. Restar el stock: se agrega una venta al libro, no se toca la fila del llavero
+                registrar_movimientos([MovimientoInventario(
+                    tipo='venta', llavero=llavero, cantidad=-cantidad, pedido_id=detalle.pedido_id
+                )])
+
+                # 4. La reserva del carrito ya se convirtió en venta
+                if carrito_id:
+                    liberar_reservas(carrito_id, llavero.pk)
+
+                # 5. Reportes: se suma al rollup del día
+                if pedido.estado != 'Cancelado':
+                    aplicar_ventas(ventas_de_lineas([detalle]))
                 
-                print(f"📉 Stock actualizado: {llavero.nombre} ahora tiene {llavero.stock_actual}")
+                print(f"📉 Stock actualizado: {llavero.nombre} quedan {disponible - cantidad} disponibles")
                 
         except Exception as e:
             if isinstance(e, ValidationError):
                 raise e
             raise ValidationError({"error": f"Error actualizando stock: {str(e)}"})
 
+    def perform_update(self, serializer):
+        with transaction.atomic():
+            antes = ventas_de_lineas([serializer.instance])
+            linea_antes = DetallePedido.objects.select_for_update() \
+                .values_list('pedido_id', 'subtotal').get(pk=serializer.instance.pk)
+            detalle = serializer.save()
+            linea_cambiada(linea_antes, detalle)
+            if detalle.pedido.estado != 'Cancelado':
+                aplicar_ventas(antes, signo=-1)
+                aplicar_ventas(ventas_de_lineas([detalle]))
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            if instance.pedido.estado != 'Cancelado':
+                aplicar_ventas(ventas_de_lineas([instance]), signo=-1)
+            instance.delete()
+            sumar_al_total(instance.pedido_id, -instance.subtotal)
+
 
 # ==========================================
 # RESTO DE VISTAS (CRUD)
@@ -183,11 +342,13 @@ def login_with_google(request):
 
 class RegisterViewSet(viewsets.ViewSet):
     permission_classes = [AllowAny]
+    throttle_classes = ACCESO_THROTTLES
     def create(self, request):
         try:
             serializer = RegisterSerializer(data=request.data)
             if serializer.is_valid():
-                user = serializer.save()
+                with turno_de_hash(request):
+                    user = serializer.save()
                 token, _ = Token.objects.get_or_create(user=user)
                 return Response({
                     "token": token.key, 
@@ -195,49 +356,177 @@ class RegisterViewSet(viewsets.ViewSet):
                     "success": True
                 }, status=status.HTTP_201_CREATED)
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        except (HashSaturado, Throttled):
+            raise
         except Exception as e:
              return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-class CategoriaViewSet(viewsets.ModelViewSet):
+class CategoriaViewSet(LecturaReplicaMixin, CamposDinamicosQuerysetMixin, viewsets.ModelViewSet):
     queryset = Categoria.objects.all()
     serializer_class = CategoriaSerializer
     permission_classes = [AllowAny]
 
-class LlaveroViewSet(viewsets.ModelViewSet):
-    queryset = Llavero.objects.all()
+class StockEnLibroViewSetMixin:
+    """Un PUT/PATCH con stock_actual se registra como ajuste en el libro de inventario."""
+    def perform_update(self, serializer):
+        nuevo_stock = serializer.validated_data.get('stock_actual')
+        actual = stock_vigente(serializer.instance)
+        with transaction.atomic():
+            obj = serializer.save()
+            if nuevo_stock is not None:
+                ajustar_stock(obj, nuevo_stock, actual=actual)
+
+class LlaveroViewSet(LecturaReplicaMixin, CamposDinamicosQuerysetMixin, StockEnLibroViewSetMixin, viewsets.ModelViewSet):
+    queryset = con_stock_vigente(Llavero.objects.all())
     serializer_class = LlaveroSerializer
     permission_classes = [AllowAny]
 
-class ClienteViewSet(viewsets.ModelViewSet):
+    def _limite(self, por_defecto, maximo):
+        try:
+            return max(1, min(int(self.request.query_params.get('limite', por_defecto)), maximo))
+        except ValueError:
+            raise ValidationError({"limite": "Debe ser un número"})
+
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        """/api/llaveros/search/?q=corazon rojo&limite=20&categoria=3 (ordenado por relevancia)"""
+        texto = request.query_params.get('q', '').strip()
+        if not texto:
+            return Response({"error": "Falta el parámetro q"}, status=400)
+        limite = self._limite(20, MAX_RESULTADOS)
+        queryset = self.get_queryset()
+        categoria = request.query_params.get('categoria')
+        if categoria:
+            if not categoria.isdigit():
+                return Response({"error": "categoria inválida"}, status=400)
+            queryset = queryset.filter(categoria_id=categoria)
+
+        queryset, ids = buscar_llaveros(queryset, texto, limite)
+        if ids is None:
+            resultados = list(queryset)
+        else:
+            por_id = {llavero.pk: llavero for llavero in queryset}
+            resultados = [por_id[pk] for pk in ids if pk in por_id][:limite]
+        return Response({
+            "q": texto,
+            "count": len(resultados),
+            "results": self.get_serializer(resultados, many=True).data,
+        })
+
+    @action(detail=True, methods=['get'])
+    def recomendaciones(self, request, pk=None):
+        """Frecuentemente comprados juntos (precalculado por recalcular_recomendaciones)."""
+        if not str(pk).isdigit():
+            return Response({"detail": "No encontrado."}, status=404)
+        return Response(recomendaciones_de(int(pk)))
+
+    @action(detail=False, methods=['get'])
+    def autocomplete(self, request):
+        """/api/llaveros/autocomplete/?q=coraz (tolera errores de tipeo)"""
+        texto = request.query_params.get('q', '').strip()
+        if not texto:
+            return Response([])
+        sugerencias = autocompletar(texto, self._limite(10, 20))
+        return Response([{"id": pk, "nombre": nombre} for pk, nombre in sugerencias])
+
+class ClientesPagination(CursorPagination):
+    # Keyset por id: cada página es un WHERE id > ? LIMIT n, sin OFFSET ni COUNT(*)
+    ordering = 'id'
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+
+class ClienteViewSet(CamposDinamicosQuerysetMixin, viewsets.ModelViewSet):
+    """
+    Directorio paginado: /api/clientes/?q=<prefijo de usuario, correo o teléfono>
+    y búsqueda masiva por ids: /api/clientes/lookup/?ids=1,2,3 (ambas solo staff)
+    """
     queryset = User.objects.all() 
     serializer_class = ClienteSerializer
     permission_classes = [AllowAny]
-    pagination_class = None 
+    pagination_class = ClientesPagination
+    MAX_IDS_LOOKUP = 500
+
+    def get_permissions(self):
+        # Buscar por prefijo o resolver ids en masa expone datos personales: solo staff
+        if self.action == 'lookup' or (self.action == 'list' and self._texto_busqueda()):
+            return [IsAdminUser()]
+        return super().get_permissions()
+
+    def get_serializer_class(self):
+        if self.action in ('list', 'lookup'):
+            return ClienteListaSerializer
+        return super().get_serializer_class()
 
-class MaterialViewSet(viewsets.ModelViewSet):
-    queryset = Material.objects.all()
+    def _texto_busqueda(self):
+        return self.request.query_params.get('q', '').strip()
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        texto = self._texto_busqueda()
+        if self.action == 'list' and texto:
+            # Prefijos (LIKE 'x%' en MySQL): cada condición usa su índice (username único, email, telefono)
+            queryset = queryset.filter(
+                Q(username__istartswith=texto) | Q(email__istartswith=texto) | Q(telefono__istartswith=texto)
+            )
+        return queryset
+
+    @action(detail=False, methods=['get', 'post'])
+    def lookup(self, request):
+        """Resuelve muchos clientes en una consulta: GET ?ids=1,2,3 o POST {"ids": [1, 2, 3]}."""
+        crudos = request.data.get('ids', []) if request.method == 'POST' else (leer_lista_param(request, 'ids') or set())
+        if not isinstance(crudos, (list, set)):
+            return Response({"error": "ids debe ser una lista"}, status=400)
+        try:
+            ids = {int(valor) for valor in crudos}
+        except (TypeError, ValueError):
+            return Response({"error": "ids debe contener solo números"}, status=400)
+        if len(ids) > self.MAX_IDS_LOOKUP:
+            return Response({"error": f"Máximo {self.MAX_IDS_LOOKUP} ids por consulta"}, status=400)
+
+        clientes = list(self.get_queryset().filter(pk__in=ids).order_by('id'))
+        return Response({
+            "results": self.get_serializer(clientes, many=True).data,
+            "no_encontrados": sorted(ids - {cliente.pk for cliente in clientes}),
+        })
+
+class MaterialViewSet(CamposDinamicosQuerysetMixin, StockEnLibroViewSetMixin, viewsets.ModelViewSet):
+    queryset = con_stock_vigente(Material.objects.all())
     serializer_class = MaterialSerializer
     permission_classes = [AllowAny]
 
-class LlaveroMaterialViewSet(viewsets.ModelViewSet):
+class LlaveroMaterialViewSet(CamposDinamicosQuerysetMixin, viewsets.ModelViewSet):
     queryset = LlaveroMaterial.objects.all()
     serializer_class = LlaveroMaterialSerializer
     permission_classes = [AllowAny]
 
-class CategoriaList(generics.ListAPIView):
+class CategoriaList(LecturaReplicaMixin, CamposDinamicosQuerysetMixin, generics.ListAPIView):
     queryset = Categoria.objects.all()
     serializer_class = CategoriaSerializer
     permission_classes = [AllowAny] 
 
-class ProductoList(generics.ListAPIView):
+class ProductoList(LecturaReplicaMixin, CamposDinamicosQuerysetMixin, generics.ListAPIView):
+    """Productos de una categoría con filtros, orden y facetas (ver api/catalogo.py)."""
+    queryset = con_stock_vigente(Llavero.objects.all())
     serializer_class = LlaveroSerializer 
     permission_classes = [AllowAny] 
+
+    def get_filtros(self):
+        if not hasattr(self, '_filtros'):
+            self._filtros = filtros_catalogo(self.request.query_params)
+        return self._filtros
+
     def get_queryset(self):
-        queryset = Llavero.objects.all()
+        queryset = super().get_queryset()
         category_id = self.kwargs.get('category_id')
         if category_id is not None:
-            queryset = queryset.filter(categoria__id=category_id)
-        return queryset
+            queryset = queryset.filter(categoria_id=category_id)
+        return filtrar_catalogo(queryset, self.get_filtros())
+
+    def list(self, request, *args, **kwargs):
+        response = super().list(request, *args, **kwargs)
+        response.data['facetas'] = facetas_catalogo(self.kwargs.get('category_id'), self.get_filtros())
+        return response
 
 # ==========================================
 # 🔐 RECUPERACIÓN DE CONTRASEÑA
@@ -251,15 +540,19 @@ def solicitar_recuperacion(request):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
     email = serializer.validated_data['email']
+    if not permitir_solicitud(email):
+        return Response(
+            {"error": "Demasiadas solicitudes para este correo. Intenta más tarde."},
+            status=status.HTTP_429_TOO_MANY_REQUESTS
+        )
+
     user = User.objects.filter(email=email).first()
     
     if not user:
         return Response({"message": "Si el correo existe, se ha enviado un código."})
     
     codigo_str = str(random.randint(100000, 999999))
-    
-    CodigoRecuperacion.objects.filter(user=user).delete()
-    CodigoRecuperacion.objects.create(user=user, codigo=codigo_str)
+    guardar_codigo(user, codigo_str)
     
     asunto = "Recuperación de Contraseña - Llaveros3D"
     mensaje = f"""Hola {user.username},
@@ -269,6 +562,8 @@ Tu código de verificación es:
 
 {codigo_str}
 
+Vence en {settings.RECUPERACION_CODIGO_MINUTOS} minutos.
+
 Si no fuiste tú, ignora este mensaje.
 """
     
@@ -282,6 +577,7 @@ Si no fuiste tú, ignora este mensaje.
 
 @api_view(['POST'])
 @permission_classes([AllowAny])
+@throttle_classes(ACCESO_THROTTLES)
 def confirmar_recuperacion(request):
     serializer = ResetPasswordConfirmSerializer(data=request.data)
     if not serializer.is_valid():
@@ -295,11 +591,12 @@ def confirmar_recuperacion(request):
     if not user:
         return Response({"error": "Usuario no encontrado"}, status=404)
         
-    registro = CodigoRecuperacion.objects.filter(user=user, codigo=codigo).first()
+    registro = codigo_vigente(user, codigo)
     if not registro:
-        return Response({"error": "Código inválido o incorrecto"}, status=400)
+        return Response({"error": "Código inválido, incorrecto o vencido"}, status=400)
         
-    user.set_password(new_password)
+    with turno_de_hash(request):
+        user.set_password(new_password)
     user.save()
     
     registro.delete()
@@ -315,12 +612,15 @@ def confirmar_recuperacion(request):
 @permission_classes([AllowAny])
 def obtener_carrito(request, cliente_id):
     cliente = get_object_or_404(Cliente, pk=cliente_id)
-    carrito, created = Carrito.objects.get_or_create(cliente=cliente)
+    carrito = carritos_con_items().filter(cliente=cliente).first()
+    if carrito is None:
+        return Response(carrito_vacio(cliente.pk))
     serializer = CarritoSerializer(carrito)
     return Response(serializer.data)
 
 @api_view(['POST'])
 @permission_classes([AllowAny])
+@idempotente('carrito-agregar')
 def agregar_item_carrito(request):
     cliente_id = request.data.get('cliente_id')
     llavero_id = request.data.get('llavero_id')
@@ -330,19 +630,23 @@ def agregar_item_carrito(request):
     carrito, _ = Carrito.objects.get_or_create(cliente=cliente)
     llavero = get_object_or_404(Llavero, pk=llavero_id)
 
-    item, created = ItemCarrito.objects.get_or_create(carrito=carrito, llavero=llavero)
-    
-    if not created:
-        item.cantidad += cantidad
-    else:
-        item.cantidad = cantidad
-    
-    if item.cantidad > llavero.stock_actual:
-        return Response({"error": "No hay suficiente stock"}, status=400)
+    with transaction.atomic():
+        item = ItemCarrito.objects.filter(carrito=carrito, llavero=llavero).first()
+        if item is None:
+            item = ItemCarrito(carrito=carrito, llavero=llavero, cantidad=cantidad)
+        else:
+            item.cantidad += cantidad
+
+        # Aparta el stock por unos minutos; falla si otros carritos ya lo reservaron
+        try:
+            reservar(carrito.id, llavero.id, item.cantidad)
+        except StockInsuficiente as e:
+            return Response({"error": "No hay suficiente stock", "disponible": e.disponible}, status=400)
 
-    item.save()
+        item.save()
+        tocar_carrito(carrito.id)
     
-    serializer = CarritoSerializer(carrito)
+    serializer = CarritoSerializer(carritos_con_items().get(pk=carrito.pk))
     return Response(serializer.data)
 
 @api_view(['POST'])
@@ -352,11 +656,15 @@ def eliminar_item_carrito(request):
     llavero_id = request.data.get('llavero_id')
 
     cliente = get_object_or_404(Cliente, pk=cliente_id)
-    carrito = get_object_or_404(Carrito, cliente=cliente)
+    carrito = Carrito.objects.filter(cliente=cliente).first()
+    if carrito is None:
+        return Response(carrito_vacio(cliente.pk))
     
     ItemCarrito.objects.filter(carrito=carrito, llavero_id=llavero_id).delete()
+    liberar_reservas(carrito.id, llavero_id)
+    tocar_carrito(carrito.id)
 
-    serializer = CarritoSerializer(carrito)
+    serializer = CarritoSerializer(carritos_con_items().get(pk=carrito.pk))
     return Response(serializer.data)
 
 @api_view(['POST'])
@@ -364,8 +672,11 @@ def eliminar_item_carrito(request):
 def vaciar_carrito(request):
     cliente_id = request.data.get('cliente_id')
     cliente = get_object_or_404(Cliente, pk=cliente_id)
-    carrito = get_object_or_404(Carrito, cliente=cliente)
-    carrito.items.all().delete()
+    carrito = Carrito.objects.filter(cliente=cliente).first()
+    if carrito is not None:
+        carrito.items.all().delete()
+        liberar_reservas(carrito.id)
+        tocar_carrito(carrito.id)
     return Response({"status": "Carrito vaciado"})
 
 
@@ -394,4 +705,309 @@ def actualizar_fcm_token(request):
         except Cliente.DoesNotExist:
             return Response({"error": "Cliente no encontrado"}, status=404)
             
-    return Response(serializer.errors, status=400)
\ No newline at end of file
+    return Response(serializer.errors, status=400)
+
+
+# ==========================================
+# 📦 BATCH: VARIAS LLAMADAS EN UN SOLO VIAJE
+# ==========================================
+
+# Cabeceras propias que puede traer cada subpetición ({"headers": {...}})
+CABECERAS_SUBPETICION = ('Idempotency-Key',)
+
+
+def _construir_subpeticion(request, sub):
+    """Crea un HttpRequest interno copiando el entorno de la petición original."""
+    ruta, _, query = sub['path'].partition('?')
+    cuerpo = b''
+    if sub.get('body') is not None:
+        cuerpo = json.dumps(sub['body']).encode('utf-8')
+
+    # La Idempotency-Key del batch no es de ninguna subpetición: cada una trae la suya en 'headers'
+    environ = {
+        clave: valor for clave, valor in request.META.items()
+        if not clave.startswith('wsgi.') and clave not in ('CONTENT_LENGTH', 'CONTENT_TYPE', 'HTTP_IDEMPOTENCY_KEY')
+    }
+    environ.update({
+        'HTTP_' + nombre.upper().replace('-', '_'): valor for nombre, valor in sub.get('headers', {}).items()
+    })
+    environ.update({
+        'REQUEST_METHOD': sub['method'],
+        'PATH_INFO': ruta,
+        'QUERY_STRING': query,
+        'CONTENT_TYPE': 'application/json',
+        'CONTENT_LENGTH': str(len(cuerpo)),
+        'wsgi.input': io.BytesIO(cuerpo),
+        'wsgi.url_scheme': request.scheme,
+    })
+    subpeticion = WSGIRequest(environ)
+
+    # Autenticación compartida: DRF no vuelve a validar el token en cada subpetición
+    subpeticion._force_auth_user = request.user
+    subpeticion._force_auth_token = request.auth
+    return subpeticion
+
+
+def _ejecutar_subpeticion(request, sub):
+    subpeticion = _construir_subpeticion(request, sub)
+    try:
+        match = resolve(subpeticion.path_info)
+    except Resolver404:
+        return {"status": 404, "body": {"error": f"Ruta no encontrada: {sub['path']}"}}
+
+    try:
+        response = match.func(subpeticion, *match.args, **match.kwargs)
+        if hasattr(response, 'render'):
+            response.render()
+    except Exception:
+        # Un error en una subpetición no tumba el batch ni pierde lo que ya corrió
+        print(f"🔥 Error en subpetición {sub['method']} {sub['path']}:\n{traceback.format_exc()}")
+        return {"status": 500, "body": {"error": "Error interno del servidor en esta subpetición"}}
+
+    contenido = response.content.decode('utf-8') if response.content else ''
+    if response.get('Content-Type', '').startswith('application/json') and contenido:
+        contenido = json.loads(contenido)
+    return {"status": response.status_code, "body": contenido}
+
+
+def _ejecutar_en_hilo(request, sub):
+    try:
+        return _ejecutar_subpeticion(request, sub)
+    finally:
+        # Cada hilo abre su propia conexión: la cerramos para no dejarla colgada
+        connections.close_all()
+
+
+@api_view(['POST'])
+@permission_classes([AllowAny])
+def batch_view(request):
+    """
+    Ejecuta varias llamadas a la API en un solo viaje HTTP:
+    {"requests": [{"method": "GET", "path": "/api/categories/"}, ...]}
+    Los GET consecutivos corren en paralelo; las escrituras se ejecutan en orden
+    y hacen de barrera para que las lecturas siguientes vean sus cambios.
+    Una escritura reintentable lleva su clave: "headers": {"Idempotency-Key": "..."}.
+    """
+    # Bytes reales del cuerpo (con chunked no hay CONTENT_LENGTH que mirar)
+    if len(request._request.body) > settings.BATCH_MAX_BYTES:
+        return Response({"error": f"El batch supera {settings.BATCH_MAX_BYTES} bytes"},
+                        status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
+    subpeticiones = request.data.get('requests') if isinstance(request.data, dict) else None
+    if not isinstance(subpeticiones, list) or not subpeticiones:
+        return Response({"error": "Se espera una lista 'requests' no vacía"}, status=status.HTTP_400_BAD_REQUEST)
+    if len(subpeticiones) > settings.BATCH_MAX_SUBPETICIONES:
+        return Response({"error": f"Máximo {settings.BATCH_MAX_SUBPETICIONES} subpeticiones por batch"},
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    normalizadas = []
+    for indice, sub in enumerate(subpeticiones):
+        if not isinstance(sub, dict) or not isinstance(sub.get('path'), str):
+            return Response({"error": f"Subpetición {indice}: falta 'path'"}, status=status.HTTP_400_BAD_REQUEST)
+        metodo = str(sub.get('method', 'GET')).upper()
+        if metodo not in ('GET', 'POST', 'PUT', 'PATCH', 'DELETE'):
+            return Response({"error": f"Subpetición {indice}: método no permitido"}, status=status.HTTP_400_BAD_REQUEST)
+        ruta = sub['path'].partition('?')[0]
+        if not ruta.startswith('/api/') or '..' in ruta.split('/'):
+            return Response({"error": f"Subpetición {indice}: solo rutas bajo /api/"}, status=status.HTTP_400_BAD_REQUEST)
+        if ruta.rstrip('/').endswith('/batch'):
+            return Response({"error": "No se permiten batch anidados"}, status=status.HTTP_400_BAD_REQUEST)
+        cabeceras = sub.get('headers') or {}
+        if not isinstance(cabeceras, dict) or not all(
+            nombre in CABECERAS_SUBPETICION and isinstance(valor, str) for nombre, valor in cabeceras.items()
+        ):
+            permitidas = ', '.join(CABECERAS_SUBPETICION)
+            return Response({"error": f"Subpetición {indice}: 'headers' admite solo {permitidas}"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        normalizadas.append({"method": metodo, "path": sub['path'], "body": sub.get('body'), "headers": cabeceras})
+
+    resultados = [None] * len(normalizadas)
+    lecturas = []
+
+    def vaciar_lecturas():
+        if len(lecturas) == 1:
+            indice = lecturas[0]
+            resultados[indice] = _ejecutar_subpeticion(request, normalizadas[indice])
+        elif lecturas:
+            with ThreadPoolExecutor(max_workers=min(len(lecturas), settings.BATCH_MAX_HILOS)) as ejecutor:
+                # copy_context: cada hilo hereda el estado del router (p. ej. "ya hubo escritura")
+                futuros = {
+                    i: ejecutor.submit(contextvars.copy_context().run, _ejecutar_en_hilo, request, normalizadas[i])
+                    for i in lecturas
+                }
+            for indice, futuro in futuros.items():
+                resultados[indice] = futuro.result()
+        lecturas.clear()
+
+    for indice, sub in enumerate(normalizadas):
+        if sub['method'] == 'GET':
+            lecturas.append(indice)
+            continue
+        vaciar_lecturas()
+        resultados[indice] = _ejecutar_subpeticion(request, sub)
+    vaciar_lecturas()
+
+    return Response({"responses": resultados})
+
+
+
+# ==========================================
+# 🏭 MRP (SOLO STAFF)
+# ==========================================
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def mrp_view(request):
+    """Producción máxima por llavero y materiales que faltan para los pedidos pendientes."""
+    solo_faltantes = request.query_params.get('faltantes') in ('1', 'true')
+    return Response(calcular_mrp(solo_faltantes=solo_faltantes))
+
+
+# ==========================================
+# 🧑‍🏭 COLA DE PREPARACIÓN (SOLO STAFF)
+# ==========================================
+
+def _ids_pedidos(request):
+    ids = request.data.get('ids')
+    if not isinstance(ids, list) or not all(str(pedido_id).isdigit() for pedido_id in ids):
+        raise ValidationError({"error": "ids debe ser una lista de números de pedido"})
+    return [int(pedido_id) for pedido_id in ids]
+
+@api_view(['POST'])
+@permission_classes([IsAdminUser])
+def tomar_pedidos_view(request):
+    """Toma los siguientes pedidos pendientes ({"cantidad": n}); otro empleado nunca recibe los mismos."""
+    try:
+        cantidad = int(request.data.get('cantidad', 1))
+    except (TypeError, ValueError):
+        return Response({"error": "cantidad debe ser un número"}, status=400)
+    if not 1 <= cantidad <= settings.COLA_MAX_LOTE:
+        return Response({"error": f"cantidad debe estar entre 1 y {settings.COLA_MAX_LOTE}"}, status=400)
+
+    liberar_tomas_vencidas()
+    ids = tomar_pedidos(request.user, cantidad)
+    pedidos = Pedido.objects.filter(pk__in=ids).order_by('fecha_pedido', 'id').prefetch_related('detalles__llavero')
+    return Response({
+        "tomados": len(ids),
+        "tomado_hasta": pedidos[0].tomado_hasta if ids else None,
+        "pedidos": PedidoSerializer(pedidos, many=True).data,
+    })
+
+@api_view(['POST'])
+@permission_classes([IsAdminUser])
+def renovar_toma_view(request):
+    """Extiende las tomas propias ({"ids": [...]}) mientras se siguen preparando."""
+    return Response({"renovados": renovar_toma(request.user, _ids_pedidos(request))})
+
+@api_view(['POST'])
+@permission_classes([IsAdminUser])
+def soltar_pedidos_view(request):
+    """Devuelve a la cola pedidos propios que no se van a preparar ({"ids": [...]})."""
+    ids = soltar_pedidos(Pedido.objects.filter(pk__in=_ids_pedidos(request), tomado_por=request.user))
+    return Response({"soltados": ids})
+
+
+
+# ==========================================
+# 📊 REPORTES DE VENTAS (SOLO STAFF)
+# ==========================================
+
+def _rango_fechas(request):
+    hoy = timezone.localdate()
+    desde = parse_date(request.query_params.get('desde', '')) if request.query_params.get('desde') else hoy - timedelta(days=30)
+    hasta = parse_date(request.query_params.get('hasta', '')) if request.query_params.get('hasta') else hoy
+    if desde is None or hasta is None:
+        raise ValidationError({"error": "Fechas inválidas, use YYYY-MM-DD"})
+    return desde, hasta
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def reporte_ventas_view(request):
+    """Unidades e ingresos por día, llavero o categoría (?agrupar=dia|llavero|categoria)."""
+    desde, hasta = _rango_fechas(request)
+    agrupar = request.query_params.get('agrupar', 'dia')
+    if agrupar not in AGRUPACIONES:
+        return Response({"error": f"agrupar debe ser uno de: {', '.join(AGRUPACIONES)}"}, status=400)
+    return Response({
+        "desde": desde, "hasta": hasta, "agrupar": agrupar,
+        "resultados": reporte_ventas(desde, hasta, agrupar),
+    })
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def top_productos_view(request):
+    """Llaveros más vendidos en el rango (?orden=ingresos|unidades&limite=10)."""
+    desde, hasta = _rango_fechas(request)
+    orden = request.query_params.get('orden', 'ingresos')
+    if orden not in ('ingresos', 'unidades'):
+        return Response({"error": "orden debe ser 'ingresos' o 'unidades'"}, status=400)
+    try:
+        limite = min(int(request.query_params.get('limite', 10)), 100)
+    except ValueError:
+        return Response({"error": "limite inválido"}, status=400)
+    return Response({
+        "desde": desde, "hasta": hasta,
+        "resultados": top_productos(desde, hasta, limite, orden),
+    })
+
+
+
+# ==========================================
+# 📤 EXPORTACIÓN DE PEDIDOS (SOLO STAFF)
+# ==========================================
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def exportar_pedidos_view(request):
+    """
+    Descarga pedidos + líneas + cliente en streaming.
+    ?formato=csv|ndjson&desde=YYYY-MM-DD&hasta=YYYY-MM-DD&estado=Pendiente
+    """
+    formato = request.query_params.get('formato', 'csv')
+    if formato not in FORMATOS:
+        return Response({"error": f"formato debe ser uno de: {', '.join(FORMATOS)}"}, status=400)
+    fechas = {}
+    for nombre in ('desde', 'hasta'):
+        valor = request.query_params.get(nombre)
+        if valor:
+            fechas[nombre] = parse_date(valor)
+            if fechas[nombre] is None:
+                return Response({"error": f"{nombre} inválida, use YYYY-MM-DD"}, status=400)
+    estado = request.query_params.get('estado')
+    if estado and estado not in dict(Pedido.ESTADOS):
+        return Response({"error": "Estado inválido"}, status=400)
+
+    tipo = 'text/csv' if formato == 'csv' else 'application/x-ndjson'
+    response = StreamingHttpResponse(
+        exportar_pedidos(formato, estado=estado, **fechas),
+        content_type=f'{tipo}; charset=utf-8',
+    )
+    response['Content-Disposition'] = f'attachment; filename="pedidos.{formato}"'
+    return response
+
+
+
+# ==========================================
+# 📥 IMPORTACIÓN DEL CATÁLOGO (SOLO STAFF)
+# ==========================================
+
+@api_view(['POST'])
+@permission_classes([IsAdminUser])
+@parser_classes([MultiPartParser])
+def importar_catalogo_view(request):
+    """
+    Multipart: archivo (CSV o JSON), tipo (materiales|llaveros|bom, obligatorio en CSV),
+    formato (por defecto según la extensión) y validar=1 para solo revisar.
+    """
+    archivo = request.FILES.get('archivo')
+    if archivo is None:
+        return Response({"error": "Falta el archivo"}, status=400)
+    formato = request.data.get('formato') or archivo.name.rsplit('.', 1)[-1].lower()
+    solo_validar = request.data.get('validar') in ('1', 'true', 'True')
+    texto = io.TextIOWrapper(archivo.file, encoding='utf-8-sig', newline='')
+    try:
+        fuentes = leer_fuentes(texto, formato, request.data.get('tipo') or None)
+        resumen = importar_catalogo(fuentes, solo_validar=solo_validar)
+    except (ArchivoInvalido, UnicodeDecodeError) as e:
+        return Response({"error": str(e)}, status=400)
+    return Response(resumen)
@@ -0,0 +1,160 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_GET
+from rest_framework.request import Request
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+from rest_framework.exceptions import ValidationError
+from rest_framework.utils.encoders import JSONEncoder
+
+from .carritos import carrito_vacio, carritos_con_items
+from .catalogo import facetas_catalogo, filtrar_catalogo, filtros_catalogo
+from .db_router import en_replica
+from .eventos import leer_y_cerrar, stream_eventos
+from .inventario import con_stock_vigente
+from .models import Categoria, Llavero, Pedido, Cliente
+from .serializers import CategoriaSerializer, LlaveroSerializer, PedidoSerializer, CarritoSerializer
+from .views import optimizar_queryset
+
+# ==========================================
+# ⚡ VISTAS ASYNC (MODO ASGI)
+# ==========================================
+# Versiones async de las lecturas más pedidas por la app. La base de datos se
+# consulta con el ORM async de Django; lo que sigue siendo bloqueante
+# (armar el JSON con los serializers) va a un pool de hilos acotado para que
+# nunca ocupe todos los hilos del servidor.
+
+EJECUTOR_BLOQUEANTE = ThreadPoolExecutor(
+    max_workers=settings.ASYNC_HILOS_BLOQUEANTES,
+    thread_name_prefix='bloqueante',
+)
+
+
+async def en_hilo(funcion, *args, **kwargs):
+    """Ejecuta una función bloqueante en el pool acotado sin frenar el event loop."""
+    return await sync_to_async(funcion, thread_sensitive=False, executor=EJECUTOR_BLOQUEANTE)(*args, **kwargs)
+
+
+def _json(data, status=200):
+    # Mismo encoder que el JSONRenderer de DRF para respuestas idénticas a las sync
+    return JsonResponse(data, status=status, safe=False, encoder=JSONEncoder)
+
+
+def _contexto(request):
+    # Request de DRF para reutilizar ?fields= / ?omit= de los serializers
+    return {'request': Request(request)}
+
+
+def _serializar(serializer_class, objetos, contexto, many=True):
+    return serializer_class(objetos, many=many, context=contexto).data
+
+
+async def _listar(request, queryset, serializer_class, paginar=True, prefetch_campos=None, extra=None):
+    try:
+        contexto = _contexto(request)
+        queryset = optimizar_queryset(queryset, serializer_class(context=contexto), prefetch_campos)
+    except ValidationError as e:
+        return _json(e.detail, status=400)
+
+    if not paginar:
+        objetos = [obj async for obj in queryset]
+        return _json(await en_hilo(_serializar, serializer_class, objetos, contexto))
+
+    # Mismo formato que PageNumberPagination (count/next/previous/results)
+    tamanio = settings.REST_FRAMEWORK['PAGE_SIZE']
+    try:
+        pagina = max(int(request.GET.get('page', 1)), 1)
+    except ValueError:
+        return _json({"detail": "Página inválida."}, status=404)
+
+    total = await queryset.acount()
+    inicio = (pagina - 1) * tamanio
+    objetos = [obj async for obj in queryset[inicio:inicio + tamanio]]
+    if pagina > 1 and not objetos:
+        return _json({"detail": "Página inválida."}, status=404)
+
+    url = request.build_absolute_uri()
+    siguiente = replace_query_param(url, 'page', pagina + 1) if inicio + tamanio < total else None
+    anterior = None
+    if pagina == 2:
+        anterior = remove_query_param(url, 'page')
+    elif pagina > 2:
+        anterior = replace_query_param(url, 'page', pagina - 1)
+
+    return _json({
+        "count": total,
+        "next": siguiente,
+        "previous": anterior,
+        "results": await en_hilo(_serializar, serializer_class, objetos, contexto),
+        **(extra or {}),
+    })
+
+
+@require_GET
+@en_replica
+async def categorias_async(request):
+    return await _listar(request, Categoria.objects.order_by('id'), CategoriaSerializer)
+
+
+@require_GET
+@en_replica
+async def productos_async(request, category_id):
+    try:
+        filtros = filtros_catalogo(request.GET)
+    except ValidationError as e:
+        return _json(e.detail, status=400)
+    # Con en_stock se leen los movimientos pendientes al armar el filtro
+    queryset = await en_hilo(
+        filtrar_catalogo, con_stock_vigente(Llavero.objects.filter(categoria_id=category_id)), filtros
+    )
+    facetas = await en_hilo(facetas_catalogo, category_id, filtros)
+    return await _listar(request, queryset, LlaveroSerializer, extra={'facetas': facetas})
+
+
+@require_GET
+@en_replica
+async def historial_pedidos_async(request, cliente_id):
+    queryset = Pedido.objects.filter(cliente_id=cliente_id).order_by('-fecha_pedido')
+    return await _listar(request, queryset, PedidoSerializer, paginar=False,
+                         prefetch_campos={'detalles': 'detalles__llavero'})
+
+
+@require_GET
+async def carrito_async(request, cliente_id):
+    if not await Cliente.objects.filter(pk=cliente_id).aexists():
+        return _json({"detail": "No encontrado."}, status=404)
+
+    carrito = await carritos_con_items().filter(cliente_id=cliente_id).afirst()
+    if carrito is None:
+        return _json(carrito_vacio(cliente_id))
+    data = await en_hilo(_serializar, CarritoSerializer, carrito, _contexto(request), many=False)
+    return _json(data)
+
+
+@require_GET
+async def eventos_pedidos_async(request, cliente_id):
+    """
+    Server-sent events con los cambios de estado de los pedidos del cliente.
+    Reanuda desde la cabecera Last-Event-ID (la manda el EventSource al
+    reconectar) o ?desde=<id>.
+    """
+    # Sin el ORM async: su conexión quedaría tomada mientras el stream siga abierto
+    if not await leer_y_cerrar(Cliente.objects.filter(pk=cliente_id).exists):
+        return _json({"detail": "No encontrado."}, status=404)
+    cursor = request.headers.get('Last-Event-ID') or request.GET.get('desde')
+    try:
+        desde = int(cursor) if cursor else None
+    except ValueError:
+        return _json({"detail": "Cursor inválido."}, status=400)
+
+    if settings.SERVER_MODE != 'asgi':
+        # En WSGI un stream abierto ocuparía un hilo: se responde lo pendiente y el cliente reconecta
+        cuerpo = ''.join([parte async for parte in stream_eventos(cliente_id, desde, continuo=False)])
+        response = HttpResponse(cuerpo, content_type='text/event-stream')
+    else:
+        response = StreamingHttpResponse(stream_eventos(cliente_id, desde), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # que nginx/Railway no junten los eventos
+    return response
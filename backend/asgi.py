@@ -9,8 +9,11 @@ https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 
 import os
 
+from django.contrib.staticfiles.handlers import ASGIStaticFilesHandler
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
+os.environ.setdefault("SERVER_MODE", "asgi")
 
-application = get_asgi_application()
+# WhiteNoise no corre en ASGI: los estáticos (admin) se sirven con el handler de Django
+application = ASGIStaticFilesHandler(get_asgi_application())
@@ -1,6 +1,7 @@
 import os
 from pathlib import Path
 import dj_database_url 
+from django.core.exceptions import ImproperlyConfigured
 
 # 🔥 IMPORTACIONES DE FIREBASE
 import firebase_admin
@@ -57,13 +58,26 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
     ),
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
-    'PAGE_SIZE': 10
+    'PAGE_SIZE': 10,
+    # Proxies delante de Django (balanceador de Cloud Run): la IP del cliente es
+    # la que agregó el último, no la que manda el propio cliente en X-Forwarded-For.
+    # NUM_PROXIES=0 si no hay proxy; 2 si hay, p. ej., CDN + balanceador. Con menos
+    # de los reales, todos comparten la IP del proxy; con más, el cliente elige su IP.
+    'NUM_PROXIES': int(os.environ.get('NUM_PROXIES', 1)),
 }
 
 AUTH_USER_MODEL = 'api.Cliente'
 
+# ==========================================
+# 📦 ENDPOINT BATCH (/api/batch/)
+# ==========================================
+BATCH_MAX_SUBPETICIONES = int(os.environ.get('BATCH_MAX_SUBPETICIONES', 10))
+BATCH_MAX_BYTES = int(os.environ.get('BATCH_MAX_BYTES', 256 * 1024))
+BATCH_MAX_HILOS = int(os.environ.get('BATCH_MAX_HILOS', 4))
+
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
+    'api.db_router.ReplicaStickyMiddleware',
     "django.middleware.security.SecurityMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -74,6 +88,94 @@ MIDDLEWARE = [
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
 
+# ==========================================
+# ⚡ MODO DE SERVIDOR: 'wsgi' (por defecto) o 'asgi' (uvicorn)
+# ==========================================
+SERVER_MODE = os.environ.get('SERVER_MODE', 'wsgi')
+if SERVER_MODE == 'asgi':
+    # WhiteNoise solo funciona en modo sync y obligaría a cada petición async
+    # a pasar por un hilo; en ASGI los estáticos los sirve backend/asgi.py
+    MIDDLEWARE.remove("whitenoise.middleware.WhiteNoiseMiddleware")
+
+# ==========================================
+# 🗄️ CACHÉ COMPARTIDA (CACHE_URL)
+# ==========================================
+# Los límites de login/registro y de recuperación de contraseña, la lectura
+# pegada a la primaria y las facetas viven en la caché. Con LocMemCache cada
+# worker de gunicorn tiene la suya y los límites se multiplican por
+# WEB_CONCURRENCY (y por instancia), así que en la nube va una caché común:
+# - redis://host:6379/0 (o rediss://) -> Redis
+# - db -> tabla cache_compartida en la base principal (la crea la migración 0023;
+#   si se cambia a 'db' después de migrar: python manage.py createcachetable)
+# - locmem -> por proceso, solo para desarrollo con un worker
+# Por defecto: 'db' en la nube, 'locmem' en tu PC.
+CACHE_URL = os.environ.get('CACHE_URL', 'locmem' if DEBUG else 'db')
+if CACHE_URL.startswith(('redis://', 'rediss://')):
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': CACHE_URL}}
+elif CACHE_URL == 'db':
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'cache_compartida'}}
+elif CACHE_URL == 'locmem':
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+else:
+    raise ImproperlyConfigured(f"CACHE_URL no reconocida: {CACHE_URL!r} (redis://..., db o locmem)")
+
+# Minutos que un carrito aparta el stock de lo que agregó
+RESERVA_TTL_MINUTOS = int(os.environ.get('RESERVA_TTL_MINUTOS', 15))
+
+# Días sin actividad tras los que el barrido borra un carrito (barrer_carritos)
+CARRITO_ABANDONADO_DIAS = int(os.environ.get('CARRITO_ABANDONADO_DIAS', 30))
+
+# Horas que se guarda la respuesta de un POST con Idempotency-Key
+IDEMPOTENCIA_TTL_HORAS = int(os.environ.get('IDEMPOTENCIA_TTL_HORAS', 24))
+
+# Cola de preparación: minutos que dura la toma de un pedido y máximo por toma
+COLA_TOMA_MINUTOS = int(os.environ.get('COLA_TOMA_MINUTOS', 30))
+COLA_MAX_LOTE = int(os.environ.get('COLA_MAX_LOTE', 50))
+
+# Stream de estados de pedidos (SSE): backend de avisos entre suscriptores.
+# 'api.eventos.BackendMemoria' con un solo worker; 'api.eventos.BackendBaseDatos' con varios.
+EVENTOS_PEDIDOS_BACKEND = os.environ.get('EVENTOS_PEDIDOS_BACKEND', 'api.eventos.BackendMemoria')
+EVENTOS_SONDEO_SEGUNDOS = float(os.environ.get('EVENTOS_SONDEO_SEGUNDOS', 1))
+EVENTOS_LATIDO_SEGUNDOS = int(os.environ.get('EVENTOS_LATIDO_SEGUNDOS', 15))
+EVENTOS_REINTENTO_MS = int(os.environ.get('EVENTOS_REINTENTO_MS', 5000))
+EVENTOS_RETENCION_HORAS = int(os.environ.get('EVENTOS_RETENCION_HORAS', 72))
+
+# Login/registro (api/acceso.py): cubetas de tokens por IP y por cuenta
+# (ráfaga permitida y tokens que se recuperan por minuto)
+ACCESO_IP_RAFAGA = int(os.environ.get('ACCESO_IP_RAFAGA', 20))
+ACCESO_IP_POR_MINUTO = int(os.environ.get('ACCESO_IP_POR_MINUTO', 10))
+ACCESO_CUENTA_RAFAGA = int(os.environ.get('ACCESO_CUENTA_RAFAGA', 5))
+ACCESO_CUENTA_POR_MINUTO = int(os.environ.get('ACCESO_CUENTA_POR_MINUTO', 3))
+# Hilos por proceso que pueden hashear a la vez: el hash es CPU pura, más que
+# núcleos solo se reparten la misma CPU. Cuántos más pueden esperar turno y por
+# cuánto tiempo antes del 503 (absorbe ráfagas de logins legítimos; el resto
+# de los hilos queda libre) y cuántos turnos puede pedir a la vez un mismo
+# cliente (IP) antes del 429.
+_CPUS = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else (os.cpu_count() or 1)
+HASH_MAX_CONCURRENTES = int(os.environ.get('HASH_MAX_CONCURRENTES', _CPUS))
+HASH_MAX_EN_FILA = int(os.environ.get('HASH_MAX_EN_FILA', HASH_MAX_CONCURRENTES))
+HASH_ESPERA_SEGUNDOS = float(os.environ.get('HASH_ESPERA_SEGUNDOS', 0.75))
+HASH_MAX_POR_CLIENTE = int(os.environ.get('HASH_MAX_POR_CLIENTE', 1))
+
+# Recuperación de contraseña: vida del código y solicitudes por correo en la ventana
+RECUPERACION_CODIGO_MINUTOS = int(os.environ.get('RECUPERACION_CODIGO_MINUTOS', 15))
+RECUPERACION_MAX_SOLICITUDES = int(os.environ.get('RECUPERACION_MAX_SOLICITUDES', 3))
+RECUPERACION_VENTANA_SEGUNDOS = int(os.environ.get('RECUPERACION_VENTANA_SEGUNDOS', 900))
+
+# Búsqueda: cada cuánto un worker revisa si otro proceso cambió el catálogo
+# y rearma su índice en memoria (solo sin FULLTEXT/tsvector nativo)
+BUSQUEDA_REFRESCO_SEGUNDOS = int(os.environ.get('BUSQUEDA_REFRESCO_SEGUNDOS', '60'))
+
+# Vida de las facetas cacheadas de /api/products/ (además se invalidan por versión
+# del catálogo; el TTL cubre los cambios de stock, que no cambian la versión)
+FACETAS_TTL_SEGUNDOS = int(os.environ.get('FACETAS_TTL_SEGUNDOS', '300'))
+
+# Admin: por encima de esto los listados muestran conteos estimados
+ADMIN_CONTEO_MAXIMO = int(os.environ.get('ADMIN_CONTEO_MAXIMO', '10000'))
+
+# Hilos para trabajo bloqueante dentro de las vistas async (api/views_async.py)
+ASYNC_HILOS_BLOQUEANTES = int(os.environ.get('ASYNC_HILOS_BLOQUEANTES', 8))
+
 CORS_ALLOW_ALL_ORIGINS = True
 ROOT_URLCONF = "backend.urls"
 
@@ -107,6 +209,23 @@ DATABASES = {
         ssl_require=False
     )
 }
+
+# Réplicas de lectura (opcional): DATABASE_REPLICA_URLS="mysql://...,mysql://..."
+# Para probar en local basta con dos SQLite: una copia de la base sirve de réplica.
+DATABASE_REPLICAS = []
+for indice, url in enumerate(u.strip() for u in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if u.strip()):
+    alias = f'replica_{indice}'
+    DATABASES[alias] = dj_database_url.parse(url, conn_max_age=600, ssl_require=False)
+    DATABASES[alias]['TEST'] = {'MIRROR': 'default'}
+    DATABASE_REPLICAS.append(alias)
+
+if DATABASE_REPLICAS:
+    DATABASE_ROUTERS = ['api.db_router.ReplicaRouter']
+
+# Segundos que un cliente lee de la primaria después de escribir (lag de replicación)
+REPLICA_STICKY_SEGUNDOS = int(os.environ.get('REPLICA_STICKY_SEGUNDOS', 5))
+# Segundos antes de reintentar una réplica que falló
+REPLICA_REINTENTO_SEGUNDOS = int(os.environ.get('REPLICA_REINTENTO_SEGUNDOS', 30))
 # ---------------------------------------------------------
 
 AUTH_PASSWORD_VALIDATORS = [
@@ -0,0 +1,238 @@
+"""
+Utilidades compartidas por los benchmarks de benchmarks/.
+
+Cada script usa su propia base: por defecto un sqlite en /tmp que siembra la
+primera vez (las siguientes corridas reutilizan los datos). Para medir contra
+MySQL/PostgreSQL de pruebas, BENCH_DATABASE_URL=mysql://... (nunca la de
+producción: los scripts insertan filas).
+"""
+import asyncio
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def preparar(nombre):
+    """Configura Django contra la base del benchmark `nombre` y aplica migraciones."""
+    if RAIZ not in sys.path:
+        sys.path.insert(0, RAIZ)
+    os.environ['DATABASE_URL'] = os.environ.get('BENCH_DATABASE_URL', f'sqlite:////tmp/bench_{nombre}.db')
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+    import django
+    django.setup()
+    from django.core.management import call_command
+    call_command('migrate', verbosity=0)
+    return os.environ['DATABASE_URL']
+
+
+# ------------------------------------------
+# Datos sintéticos
+# ------------------------------------------
+
+PALABRAS = (
+    'llavero corazon estrella gato perro luna sol flor rojo azul verde negro dorado plateado '
+    'acrilico madera metal resina personalizado nombre inicial anime futbol musica auto moto '
+    'casa arbol mariposa unicornio dinosaurio calavera rosa cristal brillante mini grande'
+).split()
+
+
+def _texto(rng, n):
+    return ' '.join(rng.choice(PALABRAS) for _ in range(n))
+
+
+def sembrar_catalogo(n_llaveros, n_categorias=20, semilla=1):
+    """Completa hasta n_llaveros (con descripciones largas, como las reales). Devuelve los ids."""
+    from api.models import Categoria, Llavero
+    rng = random.Random(semilla)
+    categorias = list(Categoria.objects.values_list('id', flat=True))
+    if len(categorias) < n_categorias:
+        Categoria.objects.bulk_create([
+            Categoria(nombre=f'Categoría {i}', descripcion=_texto(rng, 20))
+            for i in range(len(categorias), n_categorias)
+        ])
+        categorias = list(Categoria.objects.values_list('id', flat=True))
+    existentes = Llavero.objects.count()
+    if existentes < n_llaveros:
+        Llavero.objects.bulk_create([
+            Llavero(
+                categoria_id=rng.choice(categorias),
+                nombre=f'{_texto(rng, 3)} {i}'[:50],
+                sku=f'BENCH-{i}',
+                descripcion=_texto(rng, 60),
+                precio=rng.randint(100, 5000) / 100,
+                stock_actual=rng.randint(0, 200),
+                es_personalizable=rng.random() < 0.3,
+                imagen_url=f'https://cdn.ejemplo.com/llaveros/{i}.jpg',
+            )
+            for i in range(existentes, n_llaveros)
+        ], batch_size=5000)
+    return list(Llavero.objects.order_by('id').values_list('id', flat=True)[:n_llaveros])
+
+
+def sembrar_clientes(n):
+    """Completa hasta n clientes (contraseña inutilizable: no se loguean)."""
+    from api.models import Cliente
+    existentes = Cliente.objects.count()
+    if existentes < n:
+        Cliente.objects.bulk_create([
+            Cliente(username=f'cli{i}', email=f'cli{i}@mail.com', telefono=f'9{i:08d}', password='!')
+            for i in range(existentes, n)
+        ], batch_size=5000)
+    return list(Cliente.objects.order_by('id').values_list('id', flat=True)[:n])
+
+
+def sembrar_pedidos(n, cliente_ids, llavero_ids, lineas=(1, 4), semilla=2):
+    """Completa hasta n pedidos con sus líneas (subtotal calculado como en DetallePedido.save)."""
+    from api.models import DetallePedido, Pedido
+    rng = random.Random(semilla)
+    existentes = Pedido.objects.count()
+    faltan = n - existentes
+    while faltan > 0:
+        tanda = min(faltan, 5000)
+        pedidos = Pedido.objects.bulk_create([
+            Pedido(cliente_id=rng.choice(cliente_ids), estado=rng.choice(('Pendiente', 'Completado', 'Completado')))
+            for _ in range(tanda)
+        ])
+        if pedidos[0].pk is None:
+            pedidos = list(Pedido.objects.order_by('-id')[:tanda])
+        detalles = []
+        for pedido in pedidos:
+            for llavero_id in rng.sample(llavero_ids, rng.randint(*lineas)):
+                detalle = DetallePedido(pedido=pedido, llavero_id=llavero_id,
+                                        cantidad=rng.randint(1, 3), precio_unitario=rng.randint(100, 5000) / 100)
+                detalle.calcular_subtotal()
+                detalles.append(detalle)
+        DetallePedido.objects.bulk_create(detalles, batch_size=5000)
+        faltan -= tanda
+
+
+# ------------------------------------------
+# Medición
+# ------------------------------------------
+
+def percentil(valores, q):
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(len(ordenados) * q))]
+
+
+def resumen_ms(segundos):
+    """'p50 1.2ms p95 3.4ms' a partir de duraciones en segundos."""
+    return f"p50 {percentil(segundos, .5) * 1000:.2f}ms p95 {percentil(segundos, .95) * 1000:.2f}ms"
+
+
+def medir(funcion, repeticiones=20, calentar=2):
+    for _ in range(calentar):
+        funcion()
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append(time.perf_counter() - inicio)
+    return tiempos
+
+
+def tabla(filas, encabezado):
+    anchos = [max(len(str(f[i])) for f in [encabezado, *filas]) for i in range(len(encabezado))]
+    for fila in [encabezado, *filas]:
+        print('  '.join(str(celda).ljust(ancho) for celda, ancho in zip(fila, anchos)))
+
+
+# ------------------------------------------
+# Servidor real (gunicorn -c gunicorn.conf.py)
+# ------------------------------------------
+
+def puerto_libre():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+@contextmanager
+def servidor(entorno=None, argumentos=(), latencia_db_ms=0, espera=30):
+    """
+    Levanta gunicorn con la configuración del repo (más `entorno` y
+    `argumentos`, que pisan a gunicorn.conf.py) contra la base del benchmark y
+    devuelve (URL base, pid del master). Lo detiene al salir. latencia_db_ms
+    agrega esa espera a cada consulta (ver latencia_db/sitecustomize.py).
+    """
+    puerto = puerto_libre()
+    env = {**os.environ, 'PORT': str(puerto), 'GUNICORN_LOG_LEVEL': 'error', **(entorno or {})}
+    if latencia_db_ms:
+        env['BENCH_LATENCIA_DB_MS'] = str(latencia_db_ms)
+        env['PYTHONPATH'] = os.pathsep.join(filter(None, [
+            os.path.join(RAIZ, 'benchmarks', 'latencia_db'), RAIZ, env.get('PYTHONPATH'),
+        ]))
+    proceso = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '--access-logfile', '/dev/null', *argumentos],
+        cwd=RAIZ, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True,
+    )
+    try:
+        limite = time.time() + espera
+        while True:
+            try:
+                socket.create_connection(('127.0.0.1', puerto), timeout=1).close()
+                break
+            except OSError:
+                if proceso.poll() is not None or time.time() > limite:
+                    raise RuntimeError("gunicorn no arrancó")
+                time.sleep(0.2)
+        yield f'http://127.0.0.1:{puerto}', proceso.pid
+    finally:
+        os.killpg(proceso.pid, signal.SIGTERM)
+        proceso.wait(30)
+
+
+async def carga(cliente, url, concurrencia, segundos, pausa=0.0, **kwargs):
+    """
+    `concurrencia` clientes pidiendo `url` en bucle durante `segundos`.
+    Devuelve (duraciones_ok, códigos) con códigos = {status: cantidad}.
+    """
+    duraciones, codigos = [], {}
+    fin = time.perf_counter() + segundos
+
+    async def usuario():
+        while time.perf_counter() < fin:
+            inicio = time.perf_counter()
+            try:
+                respuesta = await cliente.get(url, **kwargs)
+                codigo = respuesta.status_code
+            except Exception:
+                codigo = 'error'
+            codigos[codigo] = codigos.get(codigo, 0) + 1
+            if codigo == 200:
+                duraciones.append(time.perf_counter() - inicio)
+            if pausa:
+                await asyncio.sleep(pausa)
+
+    await asyncio.gather(*(usuario() for _ in range(concurrencia)))
+    return duraciones, codigos
+
+
+def memoria_mb(pid_master):
+    """
+    (RSS, PSS) totales en MB del master de gunicorn y sus workers. La RSS cuenta
+    una vez por proceso las páginas compartidas copy-on-write (preload); la PSS
+    las reparte entre los procesos que las comparten.
+    """
+    pids = [pid_master] + [
+        int(p) for p in subprocess.run(['pgrep', '-P', str(pid_master)], capture_output=True, text=True).stdout.split()
+    ]
+    rss_kb = pss_kb = 0
+    for pid in pids:
+        try:
+            with open(f'/proc/{pid}/smaps_rollup') as resumen:
+                for linea in resumen:
+                    if linea.startswith('Rss:'):
+                        rss_kb += int(linea.split()[1])
+                    elif linea.startswith('Pss:'):
+                        pss_kb += int(linea.split()[1])
+        except OSError:
+            pass
+    return rss_kb / 1024, pss_kb / 1024
@@ -0,0 +1,72 @@
+"""
+Índice invertido en memoria de api/busqueda.py: tiempo de armado, latencia de
+búsqueda/autocompletado y latencia de las búsquedas mientras otro hilo rearma
+el índice (el armado no toma el lock de las búsquedas).
+
+Uso: python benchmarks/bench_busqueda.py [--llaveros 100000]
+"""
+import argparse
+import random
+import threading
+import time
+
+from _comun import PALABRAS, medir, preparar, resumen_ms, sembrar_catalogo, tabla
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--llaveros', type=int, default=100000)
+parser.add_argument('--repeticiones', type=int, default=2000)
+args = parser.parse_args()
+
+print("Base:", preparar('busqueda'))
+
+from api.busqueda import IndiceInvertido
+
+sembrar_catalogo(args.llaveros)
+rng = random.Random(3)
+
+indice_texto, indice_nombres = IndiceInvertido(), IndiceInvertido(solo_nombres=True)
+filas = []
+for nombre, indice in (('texto', indice_texto), ('nombres', indice_nombres)):
+    inicio = time.perf_counter()
+    indice.armar()
+    filas.append((f'armar ({nombre})', f'{time.perf_counter() - inicio:.2f}s', len(indice.vocabulario)))
+print()
+tabla(filas, ('índice', 'tiempo', 'palabras'))
+
+consultas = {
+    'una palabra': lambda: rng.choice(PALABRAS),
+    'dos palabras': lambda: f'{rng.choice(PALABRAS)} {rng.choice(PALABRAS)}',
+    'prefijo': lambda: rng.choice(PALABRAS)[:3],
+    'con error de tipeo': lambda: (lambda p: p[:2] + p[3:])(rng.choice(PALABRAS)),
+}
+
+
+def latencias(indice, generar, segundos=None):
+    """Si `segundos`, busca en bucle ese tiempo; si no, args.repeticiones veces."""
+    if segundos is None:
+        return medir(lambda: indice.buscar(generar()), args.repeticiones)
+    tiempos, fin = [], time.perf_counter() + segundos
+    while time.perf_counter() < fin:
+        inicio = time.perf_counter()
+        indice.buscar(generar())
+        tiempos.append(time.perf_counter() - inicio)
+    return tiempos
+
+
+filas = [
+    (tipo, nombre, resumen_ms(latencias(indice, generar)))
+    for nombre, indice in (('texto', indice_texto), ('autocompletar', indice_nombres))
+    for tipo, generar in consultas.items()
+]
+print()
+tabla(filas, ('consulta', 'índice', 'latencia'))
+
+# Búsquedas mientras otro hilo rearma: antes esperaban al armado completo
+indice_texto.version = -1
+rearmado = threading.Thread(target=indice_texto.armar)
+inicio = time.perf_counter()
+rearmado.start()
+durante = latencias(indice_texto, consultas['una palabra'], segundos=2)
+rearmado.join()
+print(f"\nMientras se rearma ({time.perf_counter() - inicio:.2f}s): {len(durante)} búsquedas, {resumen_ms(durante)}, "
+      f"máx {max(durante) * 1000:.1f}ms")
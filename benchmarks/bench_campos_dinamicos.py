@@ -0,0 +1,74 @@
+"""
+?fields= / ?omit= (api/serializers.py CamposDinamicosMixin + CamposDinamicosQuerysetMixin):
+bytes de la respuesta, consultas, tiempo en SQL y tiempo total por request,
+con y sin selección de campos, sobre los listados que más usa la app.
+
+Uso: python benchmarks/bench_campos_dinamicos.py [--llaveros 10000] [--pedidos 20000]
+"""
+import argparse
+import time
+
+from _comun import preparar, sembrar_catalogo, sembrar_clientes, sembrar_pedidos, medir, percentil, tabla
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--llaveros', type=int, default=10000)
+parser.add_argument('--pedidos', type=int, default=20000)
+parser.add_argument('--repeticiones', type=int, default=30)
+args = parser.parse_args()
+
+print("Base:", preparar('campos_dinamicos'))
+
+from django.db import connection, reset_queries
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+from api.models import Categoria, Pedido
+
+llaveros = sembrar_catalogo(args.llaveros)
+clientes = sembrar_clientes(500)
+sembrar_pedidos(args.pedidos, clientes, llaveros)
+
+categoria = Categoria.objects.annotate(n=Count('llavero')).order_by('-n').values_list('id', flat=True).first()
+cliente = Pedido.objects.values('cliente_id').annotate(n=Count('id')).order_by('-n').values_list('cliente_id', flat=True).first()
+pantalla = 'id,nombre,precio,imagen_url'
+
+casos = [
+    ('llaveros (página)', '/api/llaveros/', f'/api/llaveros/?fields={pantalla}'),
+    ('productos por categoría', f'/api/products/{categoria}/', f'/api/products/{categoria}/?fields={pantalla}'),
+    ('historial de pedidos', f'/api/pedidos/?cliente={cliente}', f'/api/pedidos/?cliente={cliente}&omit=detalles'),
+    ('detalle de llavero', f'/api/llaveros/{llaveros[0]}/', f'/api/llaveros/{llaveros[0]}/?fields=nombre,precio'),
+]
+
+cliente_http = Client()
+
+
+def perfil(url):
+    reset_queries()  # con DEBUG el log de consultas tiene tope: la siembra lo llena
+    with CaptureQueriesContext(connection) as consultas:
+        respuesta = cliente_http.get(url)
+    assert respuesta.status_code == 200, (url, respuesta.status_code)
+
+    en_sql = []
+
+    def cronometrar(ejecutar, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return ejecutar(sql, params, many, context)
+        finally:
+            en_sql.append(time.perf_counter() - inicio)
+
+    with connection.execute_wrapper(cronometrar):
+        tiempos = medir(lambda: cliente_http.get(url), args.repeticiones, calentar=0)
+    sql_ms = sum(en_sql) / args.repeticiones * 1000
+    return len(respuesta.content), len(consultas), sql_ms, percentil(tiempos, .5) * 1000
+
+
+filas = []
+for nombre, completo, reducido in casos:
+    for etiqueta, url in (('todo', completo), ('campos', reducido)):
+        tamano, consultas, sql_ms, total_ms = perfil(url)
+        filas.append((nombre, etiqueta, f'{tamano:,} B', consultas, f'{sql_ms:.1f}ms', f'{total_ms:.1f}ms'))
+
+print(f"\n{args.llaveros} llaveros, {args.pedidos} pedidos; p50 de {args.repeticiones} requests en proceso\n")
+tabla(filas, ('endpoint', 'modo', 'respuesta', 'consultas', 'sql/request', 'request p50'))
@@ -0,0 +1,76 @@
+"""
+Listado de productos por categoría (ProductoList + api/catalogo.py): filtros,
+orden, facetas en frío y en caché, y ?en_stock=1 con filtrar_con_stock
+(movimientos posteriores al último snapshot) contra la subconsulta por fila.
+
+Uso: python benchmarks/bench_catalogo.py [--llaveros 100000] [--pendientes 500]
+"""
+import argparse
+import random
+
+from _comun import medir, preparar, resumen_ms, sembrar_catalogo, tabla
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--llaveros', type=int, default=100000)
+parser.add_argument('--pendientes', type=int, default=500,
+                    help="Movimientos de inventario sin compactar al medir ?en_stock=1")
+parser.add_argument('--repeticiones', type=int, default=30)
+args = parser.parse_args()
+
+print("Base:", preparar('catalogo'))
+
+from django.core.cache import cache
+from django.db.models import Count
+from django.test import Client
+
+from api import inventario
+from api.inventario import compactar_inventario, registrar_movimientos
+from api.models import Categoria, MovimientoInventario
+
+llaveros = sembrar_catalogo(args.llaveros)
+categoria = Categoria.objects.annotate(n=Count('llavero')).order_by('-n').values_list('id', flat=True).first()
+
+# Un snapshot reciente más algunos movimientos sin compactar, como en producción
+MovimientoInventario.objects.all().delete()
+rng = random.Random(5)
+registrar_movimientos([
+    MovimientoInventario(tipo='venta', llavero_id=rng.choice(llaveros), cantidad=-rng.randint(1, 3))
+    for _ in range(args.pendientes * 4)
+])
+compactar_inventario(espera_huecos_segundos=0)
+registrar_movimientos([
+    MovimientoInventario(tipo='venta', llavero_id=rng.choice(llaveros), cantidad=-rng.randint(1, 3))
+    for _ in range(args.pendientes)
+])
+
+cliente_http = Client()
+base = f'/api/products/{categoria}/?fields=id,nombre,precio,imagen_url'
+casos = [
+    ('página', base),
+    ('orden=precio', f'{base}&orden=precio'),
+    ('precio 10-20, -precio', f'{base}&precio_min=10&precio_max=20&orden=-precio'),
+    ('personalizable', f'{base}&personalizable=true&orden=nombre'),
+    ('en_stock', f'{base}&en_stock=1'),
+]
+
+
+def pedir(url, fria=False):
+    if fria:
+        cache.clear()
+    respuesta = cliente_http.get(url)
+    assert respuesta.status_code == 200, (url, respuesta.status_code)
+
+
+filas = []
+for nombre, url in casos:
+    filas.append((nombre, 'facetas en caché', resumen_ms(medir(lambda: pedir(url), args.repeticiones))))
+filas.append(('página', 'facetas en frío', resumen_ms(medir(lambda: pedir(base, fria=True), args.repeticiones))))
+
+# Misma consulta forzando la subconsulta por fila (lo que hace filtrar_con_stock con demasiados pendientes)
+inventario.MAX_PENDIENTES_EN_FILTRO = -1
+filas.append(('en_stock', 'subconsulta por fila',
+              resumen_ms(medir(lambda: pedir(f'{base}&en_stock=1'), args.repeticiones))))
+
+print(f"\n{args.llaveros} llaveros, categoría con {len(llaveros) // 20}~ items, "
+      f"{args.pendientes} movimientos sin compactar; in-process\n")
+tabla(filas, ('consulta', 'modo', 'request'))
@@ -0,0 +1,71 @@
+"""
+Directorio de clientes (ClienteViewSet): página con cursor a distintas
+profundidades contra LIMIT/OFFSET sobre la misma tabla, búsqueda por prefijo
+(?q=) y lookup de 500 ids. Las dos últimas son solo staff.
+
+Uso: python benchmarks/bench_clientes.py [--clientes 300000]
+"""
+import argparse
+
+from _comun import medir, preparar, resumen_ms, sembrar_clientes, tabla
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--clientes', type=int, default=300000)
+parser.add_argument('--repeticiones', type=int, default=30)
+args = parser.parse_args()
+
+print("Base:", preparar('clientes'))
+
+from django.db import connection, reset_queries
+from django.test.utils import CaptureQueriesContext
+from rest_framework.pagination import Cursor
+from rest_framework.test import APIClient
+
+from api.models import Cliente
+from api.serializers import ClienteListaSerializer
+from api.views import ClientesPagination
+
+ids = sembrar_clientes(args.clientes)
+staff, _ = Cliente.objects.get_or_create(username='bench-staff', defaults={'is_staff': True, 'password': '!'})
+cliente_http = APIClient()
+cliente_http.force_authenticate(staff)
+tamano = ClientesPagination.page_size
+
+
+def cursor_en(posicion):
+    """URL de la página que empieza en `posicion`, con el mismo cursor que daría `next`."""
+    if posicion == 0:
+        return '/api/clientes/'
+    paginador = ClientesPagination()
+    paginador.base_url = '/api/clientes/'
+    return paginador.encode_cursor(Cursor(offset=0, reverse=False, position=str(ids[posicion - 1])))
+
+
+def con_offset(posicion):
+    # Lo que haría una paginación por número de página sobre la misma tabla
+    return lambda: (ClienteListaSerializer(Cliente.objects.order_by('id')[posicion:posicion + tamano], many=True).data,
+                    Cliente.objects.count())
+
+
+filas = []
+for profundidad in (0, 0.5, 0.99):
+    posicion = int(len(ids) * profundidad)
+    url = cursor_en(posicion)
+    reset_queries()
+    with CaptureQueriesContext(connection) as consultas:
+        assert cliente_http.get(url).status_code == 200
+    filas.append((f'cursor @{profundidad:.0%}', len(consultas), resumen_ms(medir(lambda: cliente_http.get(url), args.repeticiones))))
+    filas.append((f'offset @{profundidad:.0%}', 2, resumen_ms(medir(con_offset(posicion), args.repeticiones))))
+
+for nombre, url in (
+    ('?q=cli12 (prefijo)', '/api/clientes/?q=cli12'),
+    ('?q=cli12@mail (correo)', '/api/clientes/?q=cli12%40mail'),
+    ('lookup 500 ids', '/api/clientes/lookup/?ids=' + ','.join(str(i) for i in ids[::len(ids) // 500][:500])),
+):
+    reset_queries()
+    with CaptureQueriesContext(connection) as consultas:
+        assert cliente_http.get(url).status_code == 200, url
+    filas.append((nombre, len(consultas), resumen_ms(medir(lambda: cliente_http.get(url), args.repeticiones))))
+
+print(f"\n{len(ids)} clientes, páginas de {tamano}; in-process\n")
+tabla(filas, ('consulta', 'consultas', 'request'))
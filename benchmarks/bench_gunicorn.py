@@ -0,0 +1,65 @@
+"""
+gunicorn.conf.py: throughput, latencia y memoria (RSS y PSS del master + workers)
+según workers, hilos por worker y preload, con el mismo catálogo y la misma
+latencia de base simulada que bench_servidor.py.
+
+Cada combinación se pasa por las variables de entorno que lee gunicorn.conf.py
+(WEB_CONCURRENCY, GUNICORN_THREADS, GUNICORN_PRELOAD). La memoria se mide
+después de la carga; lo que ahorra preload se ve en la PSS, no en la RSS.
+
+Uso: python benchmarks/bench_gunicorn.py [--workers 1,3] [--hilos 1,4,8] [--concurrencia 50]
+"""
+import argparse
+import asyncio
+import itertools
+
+import httpx
+
+from _comun import carga, memoria_mb, percentil, preparar, sembrar_catalogo, servidor, tabla
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--workers', default='1,3')
+parser.add_argument('--hilos', default='1,4,8')
+parser.add_argument('--preload', default='1,0')
+parser.add_argument('--concurrencia', type=int, default=50)
+parser.add_argument('--segundos', type=float, default=10)
+parser.add_argument('--latencia-db-ms', type=float, default=20)
+args = parser.parse_args()
+
+print("Base:", preparar('servidor'))
+
+from django.db.models import Count
+
+from api.models import Categoria
+
+sembrar_catalogo(5000)
+categoria = Categoria.objects.annotate(n=Count('llavero')).order_by('-n').values_list('id', flat=True).first()
+RUTA = f'/api/products/{categoria}/?fields=id,nombre,precio,imagen_url'
+
+
+async def medir_combinacion(base):
+    limites = httpx.Limits(max_connections=1000, max_keepalive_connections=1000)
+    async with httpx.AsyncClient(base_url=base, timeout=60, limits=limites) as cliente_http:
+        await cliente_http.get(RUTA)
+        return await carga(cliente_http, RUTA, args.concurrencia, args.segundos)
+
+
+filas = []
+combinaciones = itertools.product(args.workers.split(','), args.hilos.split(','), args.preload.split(','))
+for workers, hilos, preload in combinaciones:
+    entorno = {'SERVER_MODE': 'wsgi', 'WEB_CONCURRENCY': workers, 'GUNICORN_THREADS': hilos, 'GUNICORN_PRELOAD': preload}
+    with servidor(entorno, latencia_db_ms=args.latencia_db_ms) as (base, pid):
+        duraciones, codigos = asyncio.run(medir_combinacion(base))
+        rss, pss = memoria_mb(pid)
+    errores = sum(n for codigo, n in codigos.items() if codigo != 200)
+    filas.append((
+        workers, hilos, 'sí' if preload == '1' else 'no',
+        f'{len(duraciones) / args.segundos:.0f}',
+        f'{percentil(duraciones, .5) * 1000:.0f}ms' if duraciones else '-',
+        f'{percentil(duraciones, .95) * 1000:.0f}ms' if duraciones else '-',
+        errores, f'{rss:.0f} MB', f'{pss:.0f} MB',
+    ))
+
+print(f"\nCatálogo por categoría, {args.concurrencia} clientes, {args.segundos:g}s, "
+      f"latencia de base {args.latencia_db_ms:g}ms por consulta\n")
+tabla(filas, ('workers', 'hilos', 'preload', 'req/s', 'p50', 'p95', 'errores', 'RSS', 'PSS'))
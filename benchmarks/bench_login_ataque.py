@@ -0,0 +1,97 @@
+"""
+Límites del login (api/acceso.py) bajo credential stuffing: latencia del
+catálogo medida mientras N atacantes prueban contraseñas contra
+/api/android/login/, sin límites, desde una sola IP y como botnet (una IP
+nueva por intento en X-Forwarded-For). Cuenta cuántos intentos terminaron en
+401/429/503, es decir, cuántos llegaron a hashear.
+
+Uso: python benchmarks/bench_login_ataque.py [--atacantes 40] [--segundos 15] [--hilos 4]
+"""
+import argparse
+import asyncio
+
+import httpx
+
+from _comun import carga, percentil, preparar, sembrar_catalogo, sembrar_clientes, servidor, tabla
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--atacantes', type=int, default=40)
+parser.add_argument('--segundos', type=float, default=15)
+parser.add_argument('--workers', default='1')
+parser.add_argument('--hilos', default='4')
+parser.add_argument('--cuentas', type=int, default=2000)
+args = parser.parse_args()
+
+print("Base:", preparar('login'))
+
+from django.contrib.auth.hashers import make_password
+from django.db.models import Count
+
+from api.models import Categoria, Cliente
+
+sembrar_catalogo(5000)
+ids = sembrar_clientes(args.cuentas)
+# Contraseñas hasheadas de verdad: verificar una cuesta lo mismo que en producción
+Cliente.objects.filter(pk__in=ids).update(password=make_password('la-verdadera'))
+usuarios = list(Cliente.objects.filter(pk__in=ids).values_list('username', flat=True))
+categoria = Categoria.objects.annotate(n=Count('llavero')).order_by('-n').values_list('id', flat=True).first()
+CATALOGO = f'/api/products/{categoria}/?fields=id,nombre,precio,imagen_url'
+
+SIN_LIMITES = {
+    'ACCESO_IP_RAFAGA': '1000000', 'ACCESO_CUENTA_RAFAGA': '1000000',
+    'HASH_MAX_CONCURRENTES': '1000', 'HASH_MAX_POR_CLIENTE': '1000',
+}
+ESCENARIOS = [
+    ('sin ataque', None, {}),
+    ('sin límites', 'botnet', SIN_LIMITES),
+    ('una IP', 'una_ip', {}),
+    ('botnet', 'botnet', {}),
+]
+
+
+async def atacante(cliente_http, numero, modo, codigos, fin):
+    intento = 0
+    while not fin.is_set():
+        intento += 1
+        ip = '6.6.6.6' if modo == 'una_ip' else f'10.{numero}.{intento // 250}.{intento % 250}'
+        try:
+            respuesta = await cliente_http.post('/api/android/login/', json={
+                'username': usuarios[(numero * 97 + intento) % len(usuarios)], 'password': f'adivina{intento}',
+            }, headers={'X-Forwarded-For': ip})
+            codigo = respuesta.status_code
+        except httpx.HTTPError:
+            codigo = 'error'
+        codigos[codigo] = codigos.get(codigo, 0) + 1
+
+
+async def medir(base, modo):
+    limites = httpx.Limits(max_connections=args.atacantes + 10)
+    async with httpx.AsyncClient(base_url=base, timeout=120, limits=limites) as cliente_http:
+        await cliente_http.get(CATALOGO)
+        codigos, fin = {}, asyncio.Event()
+        ataque = [
+            asyncio.create_task(atacante(cliente_http, i, modo, codigos, fin))
+            for i in range(args.atacantes if modo else 0)
+        ]
+        await asyncio.sleep(1 if modo else 0)
+        # Un usuario normal navegando el catálogo mientras tanto
+        duraciones, _ = await carga(cliente_http, CATALOGO, 1, args.segundos, pausa=0.05)
+        fin.set()
+        await asyncio.gather(*ataque)
+        return duraciones, codigos
+
+
+filas = []
+for nombre, modo, entorno in ESCENARIOS:
+    entorno = {'SERVER_MODE': 'wsgi', 'WEB_CONCURRENCY': args.workers, 'GUNICORN_THREADS': args.hilos, **entorno}
+    with servidor(entorno) as (base, _):
+        duraciones, codigos = asyncio.run(medir(base, modo))
+    filas.append((
+        nombre, len(duraciones),
+        f'{percentil(duraciones, .5) * 1000:.0f}ms' if duraciones else '-',
+        f'{percentil(duraciones, .95) * 1000:.0f}ms' if duraciones else '-',
+        ' '.join(f'{codigo}x{n}' for codigo, n in sorted(codigos.items(), key=str)) or '-',
+    ))
+
+print(f"\n{args.workers} worker(s) x {args.hilos} hilos, {args.atacantes} atacantes, {args.segundos:.0f}s por escenario\n")
+tabla(filas, ('escenario', 'pedidos catálogo', 'p50', 'p95', 'logins (código x cantidad)'))
@@ -0,0 +1,99 @@
+"""
+MRP de api/mrp.py (BOM como matriz dispersa + NumPy) contra el mismo cálculo
+con loops de Python sobre las mismas filas ya leídas, y contra el loop por
+llavero con una consulta cada uno (lo que haría una vista ingenua). Verifica
+que los tres den lo mismo y separa el tiempo de lectura del de cálculo.
+
+Uso: python benchmarks/bench_mrp.py [--llaveros 20000] [--materiales 300] [--por-llavero 4]
+"""
+import argparse
+import math
+import random
+import time
+from collections import defaultdict
+
+from _comun import preparar, sembrar_catalogo, sembrar_clientes, sembrar_pedidos, tabla
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--llaveros', type=int, default=20000)
+parser.add_argument('--materiales', type=int, default=300)
+parser.add_argument('--por-llavero', type=int, default=4, help="Materiales por llavero en la BOM")
+parser.add_argument('--pedidos', type=int, default=20000)
+parser.add_argument('--ingenuo-max', type=int, default=2000,
+                    help="Llaveros que recorre la versión de una consulta por llavero (se extrapola)")
+args = parser.parse_args()
+
+print("Base:", preparar('mrp'))
+
+import numpy as np
+from django.db.models import Sum
+
+from api.models import DetallePedido, LlaveroMaterial, Material
+from api.mrp import ESTADOS_PENDIENTES, cargar_bom, maximo_producible, unidades_pendientes
+
+llaveros = sembrar_catalogo(args.llaveros)
+sembrar_pedidos(args.pedidos, sembrar_clientes(500), llaveros)
+rng = random.Random(4)
+if Material.objects.count() < args.materiales:
+    Material.objects.bulk_create([
+        Material(nombre=f'Material {i}', unidad_medida='g', stock_actual=rng.randint(0, 5000))
+        for i in range(Material.objects.count(), args.materiales)
+    ])
+materiales = list(Material.objects.order_by('id').values_list('id', flat=True)[:args.materiales])
+if not LlaveroMaterial.objects.exists():
+    LlaveroMaterial.objects.bulk_create([
+        LlaveroMaterial(llavero_id=llavero_id, material_id=material_id, cantidad_requerida=rng.randint(1, 400) / 100)
+        for llavero_id in llaveros
+        for material_id in rng.sample(materiales, args.por_llavero)
+    ], batch_size=5000)
+
+# ---- vectorizado (api/mrp.py) ----
+inicio = time.perf_counter()
+bom = cargar_bom()
+pendientes = unidades_pendientes(bom)
+lectura = time.perf_counter() - inicio
+inicio = time.perf_counter()
+maximos = maximo_producible(bom)
+demanda = bom.matriz.T @ pendientes
+calculo = time.perf_counter() - inicio
+
+# ---- mismas filas, loops de Python ----
+stock = dict(zip(bom.material_ids.tolist(), bom.stock.tolist()))
+relaciones = list(LlaveroMaterial.objects.filter(cantidad_requerida__gt=0)
+                  .values_list('llavero_id', 'material_id', 'cantidad_requerida'))
+por_llavero = defaultdict(list)
+for llavero_id, material_id, cantidad in relaciones:
+    por_llavero[llavero_id].append((material_id, float(cantidad)))
+unidades = dict(zip(bom.llavero_ids.tolist(), pendientes.tolist()))
+
+inicio = time.perf_counter()
+maximos_loop = {
+    llavero_id: math.floor(min(max(stock[m], 0) / c for m, c in receta) + 1e-9)
+    for llavero_id, receta in por_llavero.items()
+}
+demanda_loop = defaultdict(float)
+for llavero_id, receta in por_llavero.items():
+    for material_id, cantidad in receta:
+        demanda_loop[material_id] += cantidad * unidades.get(llavero_id, 0)
+calculo_loop = time.perf_counter() - inicio
+
+posicion = {llavero_id: i for i, llavero_id in enumerate(bom.llavero_ids.tolist())}
+assert all(maximos[posicion[l]] == m for l, m in maximos_loop.items())
+assert np.allclose([demanda_loop.get(m, 0) for m in bom.material_ids.tolist()], demanda)
+
+# ---- una consulta por llavero ----
+muestra = llaveros[:args.ingenuo_max]
+inicio = time.perf_counter()
+for llavero_id in muestra:
+    receta = list(LlaveroMaterial.objects.filter(llavero_id=llavero_id, cantidad_requerida__gt=0)
+                  .values_list('material__stock_actual', 'cantidad_requerida'))
+    DetallePedido.objects.filter(llavero_id=llavero_id, pedido__estado__in=ESTADOS_PENDIENTES) \
+        .aggregate(total=Sum('cantidad'))
+ingenuo = (time.perf_counter() - inicio) * len(llaveros) / len(muestra)
+
+print(f"\n{len(llaveros)} llaveros x {len(materiales)} materiales, {bom.matriz.nnz} celdas en la BOM\n")
+tabla([
+    ('api/mrp.py (NumPy/SciPy)', f'{lectura:.2f}s', f'{calculo * 1000:.1f}ms'),
+    ('loops de Python, mismas filas', '-', f'{calculo_loop * 1000:.1f}ms'),
+    ('2 consultas por llavero', '-', f'~{ingenuo:.1f}s (extrapolado de {len(muestra)})'),
+], ('versión', 'lectura', 'cálculo'))
@@ -0,0 +1,65 @@
+"""
+recalcular_recomendaciones (api/recomendaciones.py): recálculo completo,
+corrida incremental después de pedidos nuevos (verificando que deja el mismo
+ranking que un recálculo completo) y lectura de /api/llaveros/<id>/recomendaciones/.
+
+Uso: python benchmarks/bench_recomendaciones.py [--llaveros 100000] [--pedidos 40000] [--nuevos 1000]
+"""
+import argparse
+import time
+
+from _comun import medir, preparar, resumen_ms, sembrar_catalogo, sembrar_clientes, sembrar_pedidos, tabla
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--llaveros', type=int, default=100000)
+parser.add_argument('--pedidos', type=int, default=40000)
+parser.add_argument('--nuevos', type=int, default=1000, help="Pedidos agregados antes de la corrida incremental")
+args = parser.parse_args()
+
+print("Base:", preparar('recomendaciones'))
+
+from django.db.models import Count
+from django.test import Client
+
+from api.models import DetallePedido, Recomendacion
+from api.recomendaciones import recalcular_recomendaciones
+
+llaveros = sembrar_catalogo(args.llaveros)
+clientes = sembrar_clientes(2000)
+# Canastas concentradas en una parte del catálogo para que haya co-compras repetidas
+populares = llaveros[:5000]
+sembrar_pedidos(args.pedidos, clientes, populares, lineas=(2, 5))
+
+
+def ranking():
+    return sorted(Recomendacion.objects.values_list('llavero_id', 'posicion', 'recomendado_id'))
+
+
+filas = []
+inicio = time.perf_counter()
+completo = recalcular_recomendaciones(completo=True)
+filas.append(('completo', completo['pedidos'], completo['llaveros_actualizados'], f'{time.perf_counter() - inicio:.2f}s'))
+
+sembrar_pedidos(args.pedidos + args.nuevos, clientes, populares, lineas=(2, 5), semilla=7)
+inicio = time.perf_counter()
+incremental = recalcular_recomendaciones()
+filas.append(('incremental', incremental['pedidos'], incremental['llaveros_actualizados'],
+              f'{time.perf_counter() - inicio:.2f}s'))
+despues_incremental = ranking()
+
+inicio = time.perf_counter()
+completo = recalcular_recomendaciones(completo=True)
+filas.append(('completo otra vez', completo['pedidos'], completo['llaveros_actualizados'],
+              f'{time.perf_counter() - inicio:.2f}s'))
+iguales = despues_incremental == ranking()
+
+print(f"\n{args.llaveros} llaveros, {DetallePedido.objects.count()} líneas de pedido\n")
+tabla(filas, ('corrida', 'pedidos', 'llaveros', 'tiempo'))
+print(f"\nRanking incremental == completo: {'sí' if iguales else 'NO'}")
+
+llavero = (Recomendacion.objects.values('llavero_id').annotate(n=Count('id'))
+           .order_by('-n').values_list('llavero_id', flat=True).first())
+cliente_http = Client()
+url = f'/api/llaveros/{llavero}/recomendaciones/'
+assert cliente_http.get(url).status_code == 200
+print(f"GET {url}: {resumen_ms(medir(lambda: cliente_http.get(url), 200))}")
@@ -0,0 +1,79 @@
+"""
+Capacidad de concurrencia: WSGI (sync como el Procfile anterior, y gthread) contra
+ASGI (uvicorn) con las vistas async de api/views_async.py, sobre gunicorn.conf.py.
+
+Los endpoints medidos son el catálogo por categoría, el carrito y el historial de
+pedidos (sync /api/... y async /api/async/...). Con --latencia-db-ms cada
+consulta espera esos ms antes de ejecutarse, como una base remota (MySQL en
+otra zona). Sin esa espera, una sqlite local vuelve todo CPU y no se ve la
+diferencia entre modos.
+
+Uso: python benchmarks/bench_servidor.py [--latencia-db-ms 20] [--concurrencias 10,50,200] [--segundos 10]
+"""
+import argparse
+import asyncio
+
+import httpx
+
+from _comun import carga, percentil, preparar, sembrar_catalogo, sembrar_clientes, sembrar_pedidos, servidor, tabla
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--latencia-db-ms', type=float, default=20)
+parser.add_argument('--concurrencias', default='10,50,200')
+parser.add_argument('--segundos', type=float, default=10)
+parser.add_argument('--workers', type=int, default=1)
+parser.add_argument('--modos', default='sync,gthread,asgi')
+args = parser.parse_args()
+
+print("Base:", preparar('servidor'))
+
+from django.db.models import Count
+
+from api.models import Categoria, Pedido
+
+llaveros = sembrar_catalogo(5000)
+clientes = sembrar_clientes(200)
+sembrar_pedidos(5000, clientes, llaveros)
+categoria = Categoria.objects.annotate(n=Count('llavero')).order_by('-n').values_list('id', flat=True).first()
+cliente = Pedido.objects.values('cliente_id').annotate(n=Count('id')).order_by('-n').values_list('cliente_id', flat=True).first()
+
+MODOS = {
+    # gunicorn backend.wsgi a secas: un worker sync, un request a la vez
+    'sync': ({'SERVER_MODE': 'wsgi'}, ['--worker-class', 'sync', '--threads', '1']),
+    'gthread': ({'SERVER_MODE': 'wsgi'}, []),
+    'asgi': ({'SERVER_MODE': 'asgi'}, []),
+}
+ENDPOINTS = {
+    'catálogo': (f'/api/products/{categoria}/?fields=id,nombre,precio,imagen_url',
+                 f'/api/async/products/{categoria}/?fields=id,nombre,precio,imagen_url'),
+    'carrito': (f'/api/carrito/{cliente}/', f'/api/async/carrito/{cliente}/'),
+    'historial': (f'/api/pedidos/?cliente={cliente}&omit=detalles', f'/api/async/pedidos/{cliente}/?omit=detalles'),
+}
+
+
+async def medir_modo(base, asincrono):
+    filas = []
+    limites = httpx.Limits(max_connections=1000, max_keepalive_connections=1000)
+    async with httpx.AsyncClient(base_url=base, timeout=60, limits=limites) as cliente_http:
+        for nombre, (ruta_sync, ruta_async) in ENDPOINTS.items():
+            ruta = ruta_async if asincrono else ruta_sync
+            await cliente_http.get(ruta)
+            for concurrencia in (int(c) for c in args.concurrencias.split(',')):
+                duraciones, codigos = await carga(cliente_http, ruta, concurrencia, args.segundos)
+                errores = sum(n for codigo, n in codigos.items() if codigo != 200)
+                filas.append((
+                    nombre, concurrencia, f'{len(duraciones) / args.segundos:.0f}',
+                    f'{percentil(duraciones, .5) * 1000:.0f}ms' if duraciones else '-',
+                    f'{percentil(duraciones, .95) * 1000:.0f}ms' if duraciones else '-',
+                    errores,
+                ))
+    return filas
+
+
+for modo in args.modos.split(','):
+    entorno, argumentos = MODOS[modo]
+    entorno = {**entorno, 'WEB_CONCURRENCY': str(args.workers)}
+    with servidor(entorno, argumentos, latencia_db_ms=args.latencia_db_ms) as (base, _):
+        filas = asyncio.run(medir_modo(base, modo == 'asgi'))
+    print(f"\n== {modo} ({args.workers} worker(s), latencia de base {args.latencia_db_ms:g}ms por consulta)")
+    tabla(filas, ('endpoint', 'concurrencia', 'req/s', 'p50', 'p95', 'errores'))
@@ -0,0 +1,20 @@
+"""
+Solo para benchmarks: con este directorio en PYTHONPATH y BENCH_LATENCIA_DB_MS=N,
+cada consulta SQL del proceso espera N ms antes de ejecutarse (simula una base
+remota sobre una sqlite local). Lo usa _comun.servidor(latencia_db_ms=...).
+"""
+import os
+import time
+
+_espera = float(os.environ.get('BENCH_LATENCIA_DB_MS', 0)) / 1000
+
+if _espera:
+    from django.db.backends import utils
+
+    _original = utils.CursorWrapper._execute_with_wrappers
+
+    def _con_latencia(self, *args, **kwargs):
+        time.sleep(_espera)
+        return _original(self, *args, **kwargs)
+
+    utils.CursorWrapper._execute_with_wrappers = _con_latencia
@@ -0,0 +1,66 @@
+"""
+Configuración de gunicorn para producción (Cloud Run / Railway).
+
+Uso: gunicorn -c gunicorn.conf.py
+Todo se puede ajustar con variables de entorno sin tocar el código.
+"""
+import os
+
+# ==========================================
+# APP Y PUERTO
+# ==========================================
+SERVER_MODE = os.environ.get('SERVER_MODE', 'wsgi')
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+
+if SERVER_MODE == 'asgi':
+    wsgi_app = 'backend.asgi:application'
+    worker_class = 'uvicorn_worker.UvicornWorker'
+else:
+    wsgi_app = 'backend.wsgi:application'
+    # gthread: un request lento (MySQL remoto, SMTP) ya no bloquea todo el worker
+    worker_class = 'gthread'
+
+# ==========================================
+# WORKERS E HILOS
+# ==========================================
+# Cloud Run asigna pocas vCPU por contenedor: 2 workers por CPU + 1 y varios
+# hilos por worker cubren la espera de I/O sin disparar la memoria.
+# sched_getaffinity respeta las CPU asignadas al contenedor (cpu_count ve las del host)
+cpus = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else (os.cpu_count() or 1)
+workers = int(os.environ.get('WEB_CONCURRENCY', cpus * 2 + 1))
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+
+# Carga la app (Django, Firebase) antes de hacer fork: los workers
+# comparten esa memoria copy-on-write y arrancan más rápido.
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') == '1'
+
+# Reciclar workers acota fugas de memoria; el jitter evita que todos
+# se reinicien a la vez.
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 100))
+
+# ==========================================
+# TIEMPOS
+# ==========================================
+# Cloud Run ya corta las peticiones con su propio timeout: 0 desactiva el
+# timeout de gunicorn (recomendación de Google) y evita matar workers sanos.
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 0))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+# El balanceador de Cloud Run reutiliza conexiones: mantenerlas vivas ahorra
+# el handshake en cada request de la app.
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 75))
+
+# ==========================================
+# LOGS
+# ==========================================
+accesslog = '-'
+errorlog = '-'
+loglevel = os.environ.get('GUNICORN_LOG_LEVEL', 'info')
+
+
+def post_fork(server, worker):
+    # Con preload, nada abierto por el proceso padre debe compartirse entre
+    # workers: cada uno abre sus propias conexiones a la base de datos.
+    from django.db import connections
+    connections.close_all()